@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# __init__.py
+__version__ = "0.0"
+#
+# This is a Python3 init script for pdf_hide module bench v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# All modules
+
+__all__ = [ "bench", "synth" ]
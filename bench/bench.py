@@ -0,0 +1,479 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+import statistics
+import multiprocessing
+
+from pdfhide import cache
+from pdfhide import driver
+from pdfhide import logger
+from pdfhide import pdf_algo
+
+from bench import synth
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# bench.py
+__version__ = "0.0"
+#
+# This is a benchmark suite for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This script times embedding and extracting over a sweep of covers,
+# payload sizes and algo settings, and compares the results of two runs.
+#
+# ##### python3 -m bench.bench run [-o results.json] [--covers <a.pdf> ...] #####
+# ##### python3 -m bench.bench run [-o results.json] --covers --pages 1,100,10000 #####
+# ##### python3 -m bench.bench compare <old.json> <new.json> #####
+#
+# Embedding is split into phases (see PDF_stego.phase()):
+# - uncompress: QPDF uncompresses the cover to a QDF file
+# - scan: the payload and the TJ values are read, the capacity is checked
+# - rewrite: the QDF file is rewritten (and fixed on the fly)
+# - fix: fix-qdf fixes it, if the algo could not (usually 0)
+# - compress: QPDF compresses it to the output file
+# NB: The QDF file is read from disk (as with a cache, see cache.py), so
+# that uncompressing and rewriting do not overlap as with a pipe.
+# Extracting is one phase: scan (reading, decoding and writing the data).
+#
+# Each case runs in a new process, so that its peak RSS is its own (QPDF
+# is not included: the peak RSS of children forked from a process cannot
+# be told apart from its own). Timings are the median of all repeats, in
+# seconds. The payload is random, but the same for the same
+# size in every run, so runs on the same covers can be compared.
+#
+# Synthetic covers of any number of pages can be added to the sweep (see
+# synth.py), to measure scaling without pdflatex. They are generated
+# before the run, and are the same in every run.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Phases of embedding, in order
+PHASES = ["uncompress","scan","rewrite","fix","compress"]
+
+# Default sweep
+COVERS = ["sample/test.pdf","sample/test_long.pdf"]
+PAYLOADS = "16,256,4096"
+NBITS = "2,4,6"
+REDS = "0.1,0.3"
+IMPROVES = "0,1"
+CUSTOMRANGES = "0,1"
+
+# Settings that identify a case
+KEYS = ["cover","payload","nbits","red","improve","customrange"]
+
+# Seed of the payloads
+SEED = 0
+
+# Key to embed with
+KEY = "pdf_hide-bench"
+
+# Changes below this are noise, in seconds
+MIN_DELTA = 0.001
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Returns the cases of a sweep, as dicts
+#
+# NB: Like PDF_stego.capacities(), the custom range needs improvements,
+# and at most 6 bits
+def sweep(covers,payloads,nbits,reds,improves,customranges,repeat=3):
+	cases = []
+	for (cover,size,n,red,improve,customrange) in itertools.product(covers,payloads,nbits,reds,improves,customranges):
+		if customrange and (not improve or n > 6):
+			continue
+		cases += [{
+			"cover":cover,
+			"payload":size,
+			"nbits":n,
+			"red":red,
+			"improve":improve,
+			"customrange":customrange,
+			"repeat":repeat
+			}]
+	return cases
+
+# Runs one case
+#
+# Returns the result of the case (as a dict)
+#
+# NB: Runs in a new process (see run())
+def run_case(case):
+	result = dict(case)
+	rl = logger.rootLogger(logger.CRITICAL)
+	settings = {name:case[name] for name in ["nbits","red","improve","customrange"]}
+	data = random.Random(SEED).randbytes(case["payload"])
+	result["size"] = os.path.getsize(case["cover"])
+	embeds = []
+	extracts = []
+	with tempfile.TemporaryDirectory(prefix="pdf_hide-bench-") as tmpdir:
+		qdf_path = os.path.join(tmpdir,"cover.qdf")
+		stego_path = os.path.join(tmpdir,"stego.pdf")
+		msg_path = os.path.join(tmpdir,"msg")
+		for n in range(case["repeat"]):
+			# Embed
+			timer = Timer()
+			timer("uncompress")
+			if driver.uncompress(case["cover"],qdf_path) not in (0,3):
+				raise OSError("QPDF cannot uncompress \"" + case["cover"] + "\"")
+			ps = pdf_algo.PDF_stego(case["cover"],rl,output=stego_path,cache=cache.QDF_file(qdf_path),tmpdir=tmpdir,**settings)
+			ps.timer = timer
+			result["result"] = ps.embed(data,KEY)
+			embeds += [timer.stop()]
+			if result["result"] < 0:
+				# Not enough space
+				# -> Nothing to extract
+				break
+			# Extract
+			timer = Timer()
+			ps = pdf_algo.PDF_stego(stego_path,rl,output=msg_path,tmpdir=tmpdir,**settings)
+			ps.timer = timer
+			code = ps.extract(KEY)
+			extracts += [timer.stop()]
+			with open(msg_path,"rb") as msg_file:
+				result["ok"] = code == 0 and msg_file.read() == data
+		result["peak_rss"] = peak_rss()
+		# NB: After the peak RSS, and without a list of values
+		result["tjs"] = sum(1 for value in ps.iter_values())
+	result["embed"] = median(embeds,PHASES)
+	if extracts.__len__() > 0:
+		result["extract"] = median(extracts,["scan"])
+	return result
+
+# Runs cases, each in a new process
+#
+# Returns the results (as a dict, see compare())
+def run(cases,log):
+	results = []
+	# NB: A new interpreter per case, not a fork of this one
+	context = multiprocessing.get_context("spawn")
+	for case in cases:
+		with context.Pool(1,maxtasksperchild=1) as pool:
+			result = pool.apply(run_case,(case,))
+		log.info(describe(result) + ": " + summarize(result))
+		results += [result]
+	return {
+		"version":pdf_algo.__version__,
+		"commit":commit(),
+		"date":time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+		"python":platform.python_version(),
+		"platform":platform.platform(),
+		"cpus":os.cpu_count(),
+		"results":results
+		}
+
+# Compares the results of two runs
+#
+# threshold: the relative slowdown to report as a regression
+#
+# Returns a list res[]
+# res[0] is the list of changes, as dicts
+# res[1] is the number of regressions
+#
+# NB: Cases are matched by cover name and settings, cases of only one
+# run are ignored
+def compare(old,new,threshold=0.1):
+	olds = {}
+	for result in old["results"]:
+		olds[key(result)] = result
+	changes = []
+	regressions = 0
+	for result in new["results"]:
+		if key(result) not in olds:
+			continue
+		before = olds[key(result)]
+		for action in ["embed","extract"]:
+			if action not in result or action not in before:
+				continue
+			for phase in ["total"] + PHASES:
+				if phase not in result[action] or phase not in before[action]:
+					continue
+				change = {
+					"case":describe(result),
+					"action":action,
+					"phase":phase,
+					"old":before[action][phase],
+					"new":result[action][phase]
+					}
+				change["regression"] = change["new"] - change["old"] > max(MIN_DELTA,change["old"] * threshold)
+				if change["regression"]:
+					regressions += 1
+				changes += [change]
+		change = {
+			"case":describe(result),
+			"action":"memory",
+			"phase":"peak_rss",
+			"old":before["peak_rss"],
+			"new":result["peak_rss"]
+			}
+		change["regression"] = change["new"] > change["old"] * (1 + threshold)
+		if change["regression"]:
+			regressions += 1
+		changes += [change]
+	return [changes,regressions]
+
+#
+#
+# INTERNALS
+#
+#
+
+# Records the start of each phase (see PDF_stego.phase())
+class Timer:
+
+	def __init__(self):
+		self.marks = []
+
+	def __call__(self,name):
+		self.marks += [[name,time.perf_counter()]]
+
+	# Returns the time spent in each phase, and in all
+	def stop(self):
+		end = time.perf_counter()
+		phases = {}
+		for n in range(self.marks.__len__()):
+			(name,begin) = self.marks[n]
+			until = self.marks[n + 1][1] if n + 1 < self.marks.__len__() else end
+			phases[name] = phases.get(name,0.) + until - begin
+		phases["total"] = end - self.marks[0][1] if self.marks.__len__() > 0 else 0.
+		return phases
+
+# Returns the median time of each phase over repeats
+#
+# names: the phases to report even if they did not run
+def median(runs,names):
+	phases = {}
+	for name in set(itertools.chain(["total"] + names,*runs)):
+		phases[name] = round(statistics.median([run.get(name,0.) for run in runs]),6)
+	return phases
+
+# Returns the peak RSS of this process, in bytes
+#
+# NB: Linux reports KiB, macOS reports bytes
+def peak_rss():
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		return rss
+	return rss * 1024
+
+# Returns the key of a case, to match cases between runs
+def key(result):
+	return tuple(os.path.basename(result[name]) if name == "cover" else result[name] for name in KEYS)
+
+# Returns a short description of a case
+def describe(result):
+	return " ".join([os.path.basename(result["cover"])] + [name + "=" + str(result[name]) for name in KEYS[1:]])
+
+# Returns a short summary of the result of a case
+def summarize(result):
+	if result["result"] < 0:
+		return "not enough space, embed " + str(result["embed"]["total"]) + "s"
+	return "embed " + str(result["embed"]["total"]) + "s, extract " + str(result["extract"]["total"]) + "s, peak RSS " + str(result["peak_rss"] >> 20) + " MiB"
+
+# Returns the current git commit, if any
+def commit():
+	try:
+		return subprocess.check_output(["git","rev-parse","HEAD"],stderr=subprocess.DEVNULL).decode('utf-8').strip()
+	except (OSError,subprocess.CalledProcessError):
+		return None
+
+#
+#
+#
+# SCRIPT
+#
+
+def main():
+	# CLI
+	parser = argparse.ArgumentParser(prog="bench",
+		  description="Benchmark suite for pdf_hide"
+		  )
+	subparsers = parser.add_subparsers(title="actions",
+		  dest="action",
+		  help="action to execute"
+		  )
+	subparsers.required = True
+	# CLI - Run
+	parser_run = subparsers.add_parser("run",
+		  help="Time embedding and extracting over a sweep"
+		  )
+	parser_run.add_argument("-o", "--output",
+		  dest="output",
+		  default="bench.json",
+		  help="write the results to FILENAME",
+		  metavar="FILENAME"
+		  )
+	parser_run.add_argument("--covers",
+		  dest="covers",
+		  nargs="*",
+		  default=COVERS,
+		  help="use these PDF files as covers (of various sizes)",
+		  metavar="PDF"
+		  )
+	parser_run.add_argument("--pages",
+		  dest="pages",
+		  default=None,
+		  help="also use synthetic covers of these numbers of pages (comma separated)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--kerning",
+		  dest="kerning",
+		  choices=sorted(synth.DISTRIBUTIONS),
+		  default="latex",
+		  help="draw the kerning numbers of synthetic covers from this distribution"
+		  )
+	parser_run.add_argument("--payloads",
+		  dest="payloads",
+		  default=PAYLOADS,
+		  help="use these payload sizes, in bytes (comma separated)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--nbits",
+		  dest="nbits",
+		  default=NBITS,
+		  help="use these values of NBITS (comma separated)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--red",
+		  dest="red",
+		  default=REDS,
+		  help="use these values of RED (comma separated)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--improve",
+		  dest="improve",
+		  default=IMPROVES,
+		  help="use these values of the improve flag (comma separated 0 or 1)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--custom-range",
+		  dest="customrange",
+		  default=CUSTOMRANGES,
+		  help="use these values of the custom-range flag (comma separated 0 or 1)",
+		  metavar="LIST"
+		  )
+	parser_run.add_argument("--repeat",
+		  dest="repeat",
+		  type=int,
+		  default=3,
+		  help="run each case REPEAT times, keep the median",
+		  metavar="REPEAT"
+		  )
+	# CLI - Compare
+	parser_compare = subparsers.add_parser("compare",
+		  help="Compare the results of two runs"
+		  )
+	parser_compare.add_argument("old",
+		  help="the results of the reference run"
+		  )
+	parser_compare.add_argument("new",
+		  help="the results of the run to check"
+		  )
+	parser_compare.add_argument("--threshold",
+		  dest="threshold",
+		  type=float,
+		  default=0.1,
+		  help="report slowdowns above THRESHOLD as regressions (defaults to 0.1, i.e. 10%%)",
+		  metavar="THRESHOLD"
+		  )
+	parser_compare.add_argument("--all",
+		  action="store_true",
+		  dest="all",
+		  default=False,
+		  help="list all changes, not only regressions"
+		  )
+	args = parser.parse_args()
+	# Log
+	rl = logger.rootLogger(logger.INFO)
+	# Exec
+	if args.action == "run":
+		for cover in args.covers:
+			if not os.path.isfile(cover):
+				rl.error("Cover not found (see \"make samples\")",cover)
+				exit(-1)
+		with tempfile.TemporaryDirectory(prefix="pdf_hide-synth-") as synth_dir:
+			covers = list(args.covers)
+			if args.pages != None:
+				for pages in [int(n) for n in args.pages.split(",")]:
+					cover = os.path.join(synth_dir,"synth-" + args.kerning + "-" + str(pages) + ".pdf")
+					synth.generate(cover,pages=pages,kerning=args.kerning)
+					covers += [cover]
+			if covers.__len__() == 0:
+				rl.error("No covers (see \"--covers\" and \"--pages\")")
+				exit(-1)
+			cases = sweep(
+				  covers,
+				  [int(n) for n in args.payloads.split(",")],
+				  [int(n) for n in args.nbits.split(",")],
+				  [float(red) for red in args.red.split(",")],
+				  [bool(int(n)) for n in args.improve.split(",")],
+				  [bool(int(n)) for n in args.customrange.split(",")],
+				  repeat=args.repeat
+				  )
+			rl.info("Running " + str(cases.__len__()) + " cases, please wait...")
+			results = run(cases,rl)
+		with open(args.output,"w") as output_file:
+			json.dump(results,output_file,indent=1,sort_keys=True)
+		rl.info("Results file: \"" + args.output + "\"")
+		failed = [result for result in results["results"] if result["result"] > 0 and not result["ok"]]
+		if failed.__len__() > 0:
+			rl.error(str(failed.__len__()) + " cases did not extract the payload")
+			exit(-1)
+		exit(0)
+	elif args.action == "compare":
+		with open(args.old) as old_file, open(args.new) as new_file:
+			(changes,regressions) = compare(json.load(old_file),json.load(new_file),args.threshold)
+		for change in changes:
+			if args.all or change["regression"]:
+				ratio = change["new"] / change["old"] if change["old"] > 0 else float("inf")
+				print("\t".join([change["case"],change["action"],change["phase"],str(change["old"]),str(change["new"]),"%+.1f%%" % ((ratio - 1) * 100)] + (["REGRESSION"] if change["regression"] else [])))
+		rl.info(str(regressions) + " regressions in " + str(changes.__len__()) + " comparisons")
+		exit(1 if regressions > 0 else 0)
+
+if __name__ == '__main__':
+	main()
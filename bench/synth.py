@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+import zlib
+import bisect
+import random
+import itertools
+import argparse
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# synth.py
+__version__ = "0.0"
+#
+# This is a synthetic cover generator for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module writes PDF files of any size to use as covers in tests and
+# benchmarks, without pdflatex.
+#
+# ##### python3 -m bench.synth -o cover.pdf [--pages <pages>] [--kerning <latex>] #####
+#
+# Each page holds lines of text drawn with TJ blocks, such as:
+# ##### [(Lorem)-333(ipsum)-27(dolor)]TJ #####
+# and the generator controls:
+# - pages: the number of pages
+# - tjs: the number of TJ blocks per page
+# - kerns: the number of kerning numbers (TJ ops) per TJ block
+# - kerning: the distribution of kerning numbers (see DISTRIBUTIONS)
+# - layout: "lines" for one TJ block per line of the content stream (as
+#   pdflatex), "line" for all the page on one line
+# - image: the size of an image stream to add to each page, in bytes
+# - compress: whether streams are compressed (FlateDecode)
+# - seed: the seed of the words, the kerning numbers and the images
+# The same settings always give the same file, byte for byte.
+#
+# The file is written as it is generated, so memory usage does not
+# depend on the number of pages.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Distributions of kerning numbers, as [weight,low,high] ranges (bounds included)
+#
+# NB: Zero is never drawn, but a range [weight,0,0] adds zeros
+DISTRIBUTIONS = {
+	# Word gaps in the custom range, and small kerns (as pdflatex)
+	"latex":[[6,-450,-250],[4,-40,40]],
+	# Only the custom range (see encoding.is_in_crange())
+	"crange":[[1,-450,-250]],
+	# Only small kerns, usable without improvements
+	"small":[[1,-16,16]],
+	# Any kern
+	"uniform":[[1,-999,999]]
+	}
+
+# Words of the text
+#
+# NB: No parentheses nor brackets, so strings need no escaping
+WORDS = b"""lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor
+incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud
+exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure
+in reprehenderit voluptate velit esse cillum eu fugiat nulla pariatur excepteur sint
+occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est""".split()
+
+# Layouts of content streams
+LAYOUTS = ["lines","line"]
+
+# Width of images, in pixels (one byte per pixel)
+IMAGE_WIDTH = 1024
+
+# Size of the page (US Letter), in points
+PAGE = b"[0 0 612 792]"
+
+# Object numbers of the catalog, the page tree and the font
+CATALOG = 1
+PAGES = 2
+FONT = 3
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Writes a synthetic PDF file
+#
+# output: the PDF file to write
+# the other arguments are the settings of the generator (see above),
+# kerning is the name of a distribution or a list of ranges
+#
+# Returns the number of TJ ops written
+def generate(output,pages=1,tjs=40,kerns=8,kerning="latex",layout="lines",image=0,compress=True,seed=0):
+	if isinstance(kerning,str):
+		if kerning not in DISTRIBUTIONS:
+			raise ValueError("unknown kerning distribution \"" + kerning + "\"")
+		kerning = DISTRIBUTIONS[kerning]
+	if layout not in LAYOUTS:
+		raise ValueError("unknown layout \"" + layout + "\"")
+	if pages < 1:
+		raise ValueError("at least one page is needed")
+	rng = random.Random(seed)
+	kern = sampler(kerning)
+	# Objects of each page: the page, its content stream, then its image
+	count = 3 if image > 0 else 2
+	with open(output,"wb") as output_file:
+		w = Writer(output_file)
+		w.header()
+		w.obj(CATALOG,b"<< /Type /Catalog /Pages " + ref(PAGES) + b" >>")
+		w.obj(FONT,b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+		kids = []
+		for n in range(pages):
+			num = FONT + 1 + n * count
+			kids += [num]
+			resources = b"/Font << /F1 " + ref(FONT) + b" >>"
+			if image > 0:
+				resources += b" /XObject << /Im1 " + ref(num + 2) + b" >>"
+			w.obj(num,b"<< /Type /Page /Parent " + ref(PAGES) + b" /MediaBox " + PAGE + b" /Resources << " + resources + b" >> /Contents " + ref(num + 1) + b" >>")
+			w.stream(num + 1,b"",content(rng,tjs,kerns,kern,layout,image > 0),compress)
+			if image > 0:
+				height = (image + IMAGE_WIDTH - 1) // IMAGE_WIDTH
+				w.stream(num + 2,b"/Type /XObject /Subtype /Image /Width " + str(IMAGE_WIDTH).encode() + b" /Height " + str(height).encode() + b" /ColorSpace /DeviceGray /BitsPerComponent 8",rng.randbytes(IMAGE_WIDTH * height),compress)
+		w.obj(PAGES,b"<< /Type /Pages /Kids [" + b" ".join(ref(kid) for kid in kids) + b"] /Count " + str(pages).encode() + b" >>")
+		w.trailer(CATALOG)
+	return pages * tjs * kerns
+
+# Returns a function drawing kerning numbers from a distribution
+#
+# kerning: the list of [weight,low,high] ranges
+#
+# NB: The function takes the random generator to draw with
+def sampler(kerning):
+	ranges = [[low,high - low + 1] for (weight,low,high) in kerning if weight > 0]
+	if ranges.__len__() == 0:
+		raise ValueError("empty kerning distribution")
+	bounds = list(itertools.accumulate(weight for (weight,low,high) in kerning if weight > 0))
+	total = bounds[-1]
+	def draw(rng):
+		(low,width) = ranges[bisect.bisect_right(bounds,rng.random() * total)]
+		if low == 0 and width == 1:
+			return 0
+		while True:
+			# NB: Faster than randint()
+			value = low + int(rng.random() * width)
+			if value != 0:
+				return value
+	return draw
+
+#
+#
+# INTERNALS
+#
+#
+
+# Returns the content stream of a page
+def content(rng,tjs,kerns,kern,layout,image):
+	lines = [b"BT",b"/F1 10 Tf",b"12 TL",b"72 756 Td"]
+	for n in range(tjs):
+		parts = [b"[(" + WORDS[int(rng.random() * WORDS.__len__())] + b")"]
+		for k in range(kerns):
+			parts += [str(kern(rng)).encode() + b"(" + WORDS[int(rng.random() * WORDS.__len__())] + b")"]
+		lines += [b"".join(parts) + b"]TJ T*"]
+	lines += [b"ET"]
+	if image:
+		lines += [b"q 468 0 0 216 72 72 cm /Im1 Do Q"]
+	if layout == "line":
+		return b" ".join(lines) + b"\n"
+	return b"\n".join(lines) + b"\n"
+
+# Returns a reference to an object
+def ref(num):
+	return str(num).encode() + b" 0 R"
+
+# Writes the objects of a PDF file, and its cross-reference table
+class Writer:
+
+	def __init__(self,sink):
+		self.sink = sink
+		self.offset = 0
+		# Offsets of objects, by number
+		self.offsets = {}
+
+	def write(self,data):
+		self.sink.write(data)
+		self.offset += data.__len__()
+
+	def header(self):
+		# NB: A binary comment, so that the file is handled as binary
+		self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+	def obj(self,num,data):
+		self.offsets[num] = self.offset
+		self.write(str(num).encode() + b" 0 obj\n" + data + b"\nendobj\n")
+
+	def stream(self,num,entries,data,compress):
+		if compress:
+			data = zlib.compress(data)
+			entries += b" /Filter /FlateDecode"
+		self.obj(num,b"<< " + entries + b" /Length " + str(data.__len__()).encode() + b" >>\nstream\n" + data + b"\nendstream")
+
+	def trailer(self,root):
+		size = max(self.offsets) + 1
+		xref = self.offset
+		self.write(b"xref\n0 " + str(size).encode() + b"\n0000000000 65535 f \n")
+		for num in range(1,size):
+			self.write(b"%010d 00000 n \n" % self.offsets[num])
+		self.write(b"trailer\n<< /Size " + str(size).encode() + b" /Root " + ref(root) + b" >>\nstartxref\n" + str(xref).encode() + b"\n%%EOF\n")
+
+#
+#
+#
+# SCRIPT
+#
+
+def main():
+	# CLI
+	parser = argparse.ArgumentParser(prog="synth",
+		  description="Synthetic cover generator for pdf_hide"
+		  )
+	parser.add_argument("-o", "--output",
+		  dest="output",
+		  default="synth.pdf",
+		  help="write the PDF file to FILENAME",
+		  metavar="FILENAME"
+		  )
+	parser.add_argument("--pages",
+		  dest="pages",
+		  type=int,
+		  default=1,
+		  help="write PAGES pages",
+		  metavar="PAGES"
+		  )
+	parser.add_argument("--tjs",
+		  dest="tjs",
+		  type=int,
+		  default=40,
+		  help="write TJS TJ blocks per page",
+		  metavar="TJS"
+		  )
+	parser.add_argument("--kerns",
+		  dest="kerns",
+		  type=int,
+		  default=8,
+		  help="write KERNS kerning numbers per TJ block",
+		  metavar="KERNS"
+		  )
+	parser.add_argument("--kerning",
+		  dest="kerning",
+		  choices=sorted(DISTRIBUTIONS),
+		  default="latex",
+		  help="draw kerning numbers from this distribution"
+		  )
+	parser.add_argument("--layout",
+		  dest="layout",
+		  choices=LAYOUTS,
+		  default="lines",
+		  help="write one TJ block per line, or each page on one line"
+		  )
+	parser.add_argument("--image",
+		  dest="image",
+		  type=int,
+		  default=0,
+		  help="add an image of SIZE bytes to each page",
+		  metavar="SIZE"
+		  )
+	parser.add_argument("--no-compress",
+		  action="store_false",
+		  dest="compress",
+		  default=True,
+		  help="do not compress streams"
+		  )
+	parser.add_argument("--seed",
+		  dest="seed",
+		  type=int,
+		  default=0,
+		  help="use SEED for the words, the kerning numbers and the images",
+		  metavar="SEED"
+		  )
+	args = parser.parse_args()
+	count = generate(args.output,
+		  pages=args.pages,
+		  tjs=args.tjs,
+		  kerns=args.kerns,
+		  kerning=args.kerning,
+		  layout=args.layout,
+		  image=args.image,
+		  compress=args.compress,
+		  seed=args.seed
+		  )
+	print("Cover file: \"" + args.output + "\" (" + str(count) + " TJ ops)")
+
+if __name__ == '__main__':
+	main()
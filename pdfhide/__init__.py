@@ -37,4 +37,4 @@ __version__ = "0.0"
 #
 # All modules
 
-__all__ = [ "chaos", "encoding", "driver", "pdf_algo", "logger" ]
+__all__ = [ "chaos", "encoding", "driver", "pdf_algo", "logger", "tokenizer", "reader", "qdf", "batch", "cache", "detector", "template", "keystream", "payload", "shard", "scan", "memory", "server", "aio" ]
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+import os
+import asyncio
+import tempfile
+import functools
+
+from pdfhide import cache
+from pdfhide import driver
+from pdfhide import logger
+from pdfhide import pdf_algo
+from pdfhide import qdf
+from pdfhide import reader
+from pdfhide import template
+from pdfhide import tokenizer
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# aio.py
+__version__ = "0.0"
+#
+# This is an asyncio API for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module embeds and extracts data without blocking the event loop,
+# so that one process can keep many PDF files in flight.
+#
+# Embedding takes four stages:
+# - QPDF uncompresses the PDF file to a QDF file (a subprocess)
+# - the algo rewrites the QDF file and fixes it on the fly (in an executor)
+# - fix-qdf fixes it, if the algo could not (a subprocess)
+# - QPDF compresses it to the output file (a subprocess)
+# Extracting reads the content streams in an executor, and only runs QPDF
+# if they cannot be read directly (see reader.py).
+#
+# The subprocesses are asyncio subprocesses, the event loop runs while
+# they do. The executor defaults to the one of the event loop (threads):
+# concurrent tasks then share the keystreams of the same key, which are
+# generated under a lock (see keystream.py), so they all read the same
+# numbers. CPU-bound rewriting only runs in parallel in a
+# ProcessPoolExecutor, but then the data to embed must be picklable
+# (bytes or str, not a file).
+#
+# The new PDF files are the same as those of PDF_stego.embed(), byte for
+# byte, and errors are reported the same way.
+#
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Embeds data with passkey in a PDF file
+#
+# input: the PDF file to read (or the template file, if template is True)
+# output: the PDF file to write
+# data: the data to embed (see PDF_stego.embed())
+# cache: a cache of QDF files to use, if any (see cache.py)
+# tmpdir: the directory of the intermediate files
+# log: the logger to use, defaults to a quiet one
+# executor: the executor to rewrite the QDF file in, defaults to the one of the event loop
+# the other arguments are the algo settings (see PDF_stego)
+#
+# Returns the number of embedded numerals constituting the data, or
+# minus the number needed if there is not enough space
+async def embed(input,output,data,passkey,improve=False,red=0.1,nbits=4,customrange=False,norandom=False,counter=False,template=False,workers=1,cache=None,tmpdir=None,log=None,executor=None):
+	log = quiet(log)
+	loop = asyncio.get_running_loop()
+	settings = {
+		"improve":improve,
+		"red":red,
+		"nbits":nbits,
+		"customrange":customrange,
+		"norandom":norandom,
+		"counter":counter,
+		"template":template,
+		"workers":workers
+		}
+	with tempfile.TemporaryDirectory(dir=tmpdir,prefix="pdf_hide-") as scratch:
+		# Uncompress
+		qdf_path = None
+		if template:
+			# NB: The template holds the QDF file
+			pass
+		elif cache != None:
+			qdf_path = await loop.run_in_executor(executor,cache.get,input)
+		else:
+			qdf_path = os.path.join(scratch,"cover.qdf")
+			if await driver.uncompress_async(input,qdf_path) not in (0,3):
+				# NB: QPDF returns 3 when it had to recover from warnings
+				raise OSError("QPDF cannot uncompress \"" + input + "\"")
+		# Rewrite
+		fixed_path = os.path.join(scratch,"fixed.qdf")
+		(result,ok) = await loop.run_in_executor(executor,functools.partial(rewrite,input,qdf_path,fixed_path,data,passkey,settings,log))
+		if result < 0:
+			return result
+		# Fix
+		if not ok:
+			log.info("Cannot fix the QDF file directly, using fix-qdf")
+			damaged_path = fixed_path
+			fixed_path = os.path.join(scratch,"refixed.qdf")
+			if await driver.fix_async(damaged_path,fixed_path) not in (0,3):
+				raise OSError("fix-qdf cannot fix the QDF file of \"" + input + "\"")
+		# Compress
+		if await driver.compress_async(fixed_path,output) not in (0,3):
+			raise OSError("QPDF cannot compress \"" + output + "\"")
+	log.info("Output file: \"" + output + "\"")
+	return result
+
+# Extracts data with passkey from a PDF file
+#
+# input: the PDF file to read
+# output: the file to write the data to
+# the other arguments are the same as embed()
+#
+# Returns 0 if data was extracted, -1 otherwise
+async def extract(input,output,passkey,improve=False,red=0.1,nbits=4,customrange=False,native=True,counter=False,cache=None,tmpdir=None,log=None,executor=None):
+	log = quiet(log)
+	loop = asyncio.get_running_loop()
+	settings = {
+		"improve":improve,
+		"red":red,
+		"nbits":nbits,
+		"customrange":customrange,
+		"counter":counter
+		}
+	if cache == None and native:
+		# Try to read content streams directly
+		result = await loop.run_in_executor(executor,functools.partial(read,input,output,passkey,settings,log,None))
+		if result != None:
+			return result
+		log.info("Cannot read content streams directly, using QPDF")
+	with tempfile.TemporaryDirectory(dir=tmpdir,prefix="pdf_hide-") as scratch:
+		if cache != None:
+			qdf_path = await loop.run_in_executor(executor,cache.get,input)
+		else:
+			qdf_path = os.path.join(scratch,"cover.qdf")
+			if await driver.uncompress_async(input,qdf_path) not in (0,3):
+				raise OSError("QPDF cannot uncompress \"" + input + "\"")
+		return await loop.run_in_executor(executor,functools.partial(read,input,output,passkey,settings,log,qdf_path))
+
+#
+#
+# INTERNALS
+#
+#
+
+# Returns a logger, quiet by default
+def quiet(log):
+	if log == None:
+		return logger.rootLogger(logger.CRITICAL)
+	return log
+
+# Returns the algo for a PDF file, reading its QDF file if any
+def stego(input,log,settings,qdf_path,output="a.out",cover_template=None):
+	return pdf_algo.PDF_stego(
+		  input,
+		  log,
+		  output=output,
+		  improve=settings["improve"],
+		  red=settings["red"],
+		  nbits=settings["nbits"],
+		  customrange=settings["customrange"],
+		  counter=settings["counter"],
+		  workers=settings.get("workers",1),
+		  cache=cache.QDF_file(qdf_path) if qdf_path != None else None,
+		  template=cover_template
+		  )
+
+# Rewrites the QDF file of a PDF file, fixing it on the fly
+#
+# Returns a list res[]
+# res[0] is the result of the algo (see PDF_stego.embed())
+# res[1] is False if the new QDF file still needs fix-qdf
+#
+# NB: Runs in the executor, so everything here must be picklable
+def rewrite(input,qdf_path,fixed_path,data,passkey,settings,log):
+	cover_template = None
+	if settings["template"]:
+		cover_template = template.Template(input)
+	try:
+		ps = stego(input,log,settings,qdf_path,cover_template=cover_template)
+		with open(fixed_path,"wb",driver.BUFFER_SIZE) as fixed_file:
+			fixer = qdf.QDF_fixer(fixed_file)
+			result = ps.embed(data,passkey,norandom=settings["norandom"],sink=fixer)
+			fixer.flush()
+		return [result,fixer.ok]
+	finally:
+		if cover_template != None:
+			cover_template.close()
+
+# Extracts data from a PDF file, reading its QDF file if any
+#
+# Returns the result of the algo (see PDF_stego.extract()), or None if
+# there is no QDF file and the content streams cannot be read directly
+#
+# NB: Runs in the executor, so everything here must be picklable
+def read(input,output,passkey,settings,log,qdf_path):
+	ps = stego(input,log,settings,qdf_path,output=output)
+	if qdf_path != None:
+		return ps.extract(passkey)
+	try:
+		streams = reader.contents(input)
+	except reader.ReaderError as e:
+		log.debug("Cannot read content streams",str(e))
+		return None
+	return ps.extract(passkey,values(streams))
+
+# Yields the values of all TJ ops of content streams, in order
+def values(streams):
+	for content in streams:
+		yield from tokenizer.values(content)
@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+import csv
+import json
+import time
+import tempfile
+import concurrent.futures
+
+from pdfhide import cache
+from pdfhide import logger
+from pdfhide import pdf_algo
+from pdfhide import template
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# batch.py
+__version__ = "0.0"
+#
+# This is a batch runner for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module runs many embedding and extracting jobs in parallel.
+#
+# Jobs are read from a manifest, which is a CSV file with a header line.
+# Each row is a job, with the following columns:
+# ##### action,cover,output,payload,key,nbits,red,improve,customrange,norandom #####
+# - action: "embed" or "extract" (defaults to "embed")
+# - cover: the PDF file to read
+# - output: the file to write
+# - payload: the data file to embed (embedding only)
+# - the other columns are the algo settings
+# Only "cover" and "output" are required, empty or missing columns take
+# their value from the defaults (i.e. from the command line).
+# If a "cache" directory is set, all jobs share the same QDF cache.
+# If "template" is set, the cover is a compiled template (see template.py).
+#
+# Each job runs in a worker process, with its own temporary directory,
+# so jobs never share intermediate files. The result of each job is
+# written as one JSON object per line, in the order of the manifest.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Settings of a job, with their type
+SETTINGS = {
+	"key":str,
+	"nbits":int,
+	"red":float,
+	"improve":bool,
+	"customrange":bool,
+	"norandom":bool,
+	"native":bool,
+	"counter":bool,
+	"cachesize":int,
+	"template":bool
+	}
+
+# Values of boolean settings
+TRUE = ["1","true","yes","y","on"]
+FALSE = ["0","false","no","n","off"]
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Reads jobs from a manifest
+#
+# manifest: the CSV file to read (opened in text mode)
+# defaults: the settings to use when a column is missing or empty
+#
+# Returns a list of jobs (as dicts)
+def read_manifest(manifest,defaults={}):
+	jobs = []
+	for row in csv.DictReader(manifest):
+		# NB: Line 1 is the header
+		line = jobs.__len__() + 2
+		job = dict(defaults)
+		job["job"] = jobs.__len__()
+		job["action"] = "embed"
+		for (name,value) in row.items():
+			if name == None or value == None:
+				continue
+			name = name.strip()
+			value = value.strip()
+			if value.__len__() == 0:
+				continue
+			if name in SETTINGS:
+				job[name] = parse_setting(name,value,line)
+			else:
+				job[name] = value
+		# Check the job
+		if job["action"] in ["m","x"]:
+			job["action"] = {"m":"embed","x":"extract"}[job["action"]]
+		if job["action"] not in ["embed","extract"]:
+			raise ValueError("Line " + str(line) + ": unknown action \"" + job["action"] + "\"")
+		required = ["cover","output"]
+		if job["action"] == "embed":
+			required += ["payload"]
+		for name in required:
+			if name not in job:
+				raise ValueError("Line " + str(line) + ": missing " + name)
+		jobs += [job]
+	return jobs
+
+# Parses the value of a setting from a manifest
+def parse_setting(name,value,line):
+	if SETTINGS[name] == bool:
+		if value.lower() in TRUE:
+			return True
+		if value.lower() in FALSE:
+			return False
+		raise ValueError("Line " + str(line) + ": invalid " + name + " \"" + value + "\"")
+	try:
+		return SETTINGS[name](value)
+	except ValueError:
+		raise ValueError("Line " + str(line) + ": invalid " + name + " \"" + value + "\"")
+
+# Runs one job
+#
+# job: the job to run (as a dict)
+# verbose: the verbosity level of the worker
+#
+# Returns the result of the job (as a dict)
+#
+# NB: Runs in a worker process, so everything here must be picklable
+def run_job(job,verbose=logger.CRITICAL):
+	result = {
+		"job":job["job"],
+		"action":job["action"],
+		"cover":job["cover"],
+		"output":job["output"]
+		}
+	begin = time.time()
+	try:
+		# Each job gets its own scratch space
+		with tempfile.TemporaryDirectory(prefix="pdf_hide-") as tmpdir:
+			qdf_cache = None
+			if job.get("cache") != None:
+				qdf_cache = cache.QDF_cache(job["cache"],job.get("cachesize",cache.DEFAULT_SIZE))
+			cover_template = None
+			if job.get("template",False):
+				cover_template = template.Template(job["cover"])
+			ps = pdf_algo.PDF_stego(
+				  job["cover"],
+				  logger.rootLogger(verbose),
+				  output=job["output"],
+				  improve=job.get("improve",False),
+				  red=job.get("red",0.1),
+				  nbits=job.get("nbits",4),
+				  customrange=job.get("customrange",False),
+				  native=job.get("native",True),
+				  counter=job.get("counter",False),
+				  tmpdir=tmpdir,
+				  cache=qdf_cache,
+				  template=cover_template
+				  )
+			if job["action"] == "embed":
+				with open(job["payload"],"rb") as payload_file:
+					code = ps.embed(payload_file,job["key"],norandom=job.get("norandom",False))
+				result["ok"] = code > 0
+			else:
+				code = ps.extract(job["key"])
+				result["ok"] = code == 0
+			result["result"] = code
+	except Exception as e:
+		result["ok"] = False
+		result["error"] = e.__class__.__qualname__ + ": " + str(e)
+	result["time"] = round(time.time() - begin,6)
+	return result
+
+# Runs jobs in a pool of worker processes
+#
+# jobs: the jobs to run
+# summary: the writable to write the results to (opened in text mode)
+# workers: the number of worker processes, defaults to the number of CPUs
+# verbose: the verbosity level of the workers
+#
+# Returns the number of jobs that failed
+def run(jobs,summary,workers=None,verbose=logger.CRITICAL):
+	failed = 0
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = [executor.submit(run_job,job,verbose) for job in jobs]
+		# Write results in order, as soon as they are available
+		for future in futures:
+			result = future.result()
+			if not result["ok"]:
+				failed += 1
+			summary.write(json.dumps(result,sort_keys=True) + "\n")
+			summary.flush()
+	return failed
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+import os
+import hashlib
+import tempfile
+
+from pdfhide import driver
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# cache.py
+__version__ = "0.0"
+#
+# This is a cache of QDF files for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module keeps the QDF files generated by QPDF on disk, so that the
+# same PDF file is only uncompressed once.
+#
+# Entries are addressed by the SHA-256 of the content of the PDF file,
+# not by its name: renaming or copying a PDF file still hits the cache,
+# and changing it misses. The cache has a size cap, and the least
+# recently used entries are removed when it is exceeded.
+#
+# Entries are written to a temporary file, then renamed, so several
+# processes can share the same cache directory.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Default directory of the cache
+DEFAULT_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME",os.path.join(os.path.expanduser("~"),".cache")),"pdf_hide")
+
+# Default size cap of the cache, in bytes
+DEFAULT_SIZE = 1 << 30
+
+# Extension of entries
+EXT = ".qdf"
+
+# Size of the blocks to hash
+BLOCK_SIZE = 1 << 20
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class QDF_cache:
+
+	# Sets the location and the size of the cache at creation time
+	#
+	# dir: the directory of the cache, created if needed
+	# size: the size cap of the cache, in bytes
+	def __init__(self,dir=DEFAULT_DIR,size=DEFAULT_SIZE):
+		self.dir = dir
+		self.size = size
+		os.makedirs(self.dir,exist_ok=True)
+
+	#
+	#
+	#
+	# ENTRIES
+	#
+
+	# Returns the key of a PDF file, i.e. the SHA-256 of its content
+	def key(self,input):
+		h = hashlib.sha256()
+		with open(input,"rb") as input_file:
+			for block in iter(lambda: input_file.read(BLOCK_SIZE),b""):
+				h.update(block)
+		return h.hexdigest()
+
+	# Returns the path of the entry for a key
+	def path(self,key):
+		return os.path.join(self.dir,key + EXT)
+
+	# Returns the path of the QDF file of a PDF file, uncompressing it if needed
+	#
+	# NB: The entry is marked as recently used
+	def get(self,input):
+		path = self.path(self.key(input))
+		try:
+			# Hit
+			# -> Mark as recently used
+			os.utime(path)
+			return path
+		except FileNotFoundError:
+			pass
+		# Miss
+		# -> Uncompress to a temporary file, then commit it
+		fd,temp = tempfile.mkstemp(dir=self.dir,suffix=".tmp")
+		os.close(fd)
+		try:
+			if driver.uncompress(input,temp) not in (0,3):
+				# NB: QPDF returns 3 when it had to recover from warnings
+				raise OSError("QPDF cannot uncompress \"" + input + "\"")
+			os.replace(temp,path)
+		finally:
+			driver.delete(temp)
+		self.evict(path)
+		return path
+
+	# Opens the QDF file of a PDF file, uncompressing it if needed
+	#
+	# Returns a file opened in binary mode
+	#
+	# NB: The file stays readable even if the entry is evicted
+	def open(self,input):
+		return open(self.get(input),"rb")
+
+	#
+	#
+	#
+	# EVICTION
+	#
+
+	# Removes the least recently used entries until the cache fits its size cap
+	#
+	# keep: the path of an entry not to remove
+	def evict(self,keep=None):
+		entries = []
+		total = 0
+		for entry in os.scandir(self.dir):
+			if not entry.name.endswith(EXT):
+				continue
+			try:
+				stat = entry.stat()
+			except FileNotFoundError:
+				# Removed by another process
+				continue
+			entries += [(stat.st_mtime,entry.path,stat.st_size)]
+			total += stat.st_size
+		# Remove oldest entries first
+		entries.sort()
+		for (mtime,path,size) in entries:
+			if total <= self.size:
+				break
+			if path == keep:
+				continue
+			driver.delete(path)
+			total -= size
+
+	# Removes all entries
+	def clear(self):
+		for entry in os.scandir(self.dir):
+			if entry.name.endswith(EXT):
+				driver.delete(entry.path)
+
+# A QDF file already uncompressed, as a cache with a single entry
+#
+# NB: Same interface as QDF_cache, as used by PDF_stego, whatever the input
+class QDF_file:
+
+	def __init__(self,path):
+		self.qdf = path
+
+	def get(self,input):
+		return self.qdf
+
+	def open(self,input):
+		return open(self.qdf,"rb")
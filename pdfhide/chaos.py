@@ -47,7 +47,8 @@ __version__ = "0.0"
 # parameter according to the pdf_hide algo.
 #
 # After that, the 'next()' method can be used to simultaneously
-# generate and retrieve the next value from the chaotic map.
+# generate and retrieve the next value from the chaotic map, and the
+# 'block()' method to do so for many values at once.
 #
 
 class Chaotic:
@@ -71,3 +72,16 @@ class Chaotic:
 		x_ = self.mu * self.x * (1 - self.x)
 		self.x = x_
 		return self.x
+
+	# Gets the next real numbers from the chaotic map
+	#
+	# Returns a list of count numbers, the same as count calls to next()
+	def block(self,count):
+		mu = self.mu
+		x = self.x
+		xs = [0.] * count
+		for k in range(count):
+			x = mu * x * (1 - x)
+			xs[k] = x
+		self.x = x
+		return xs
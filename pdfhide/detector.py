@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# detector.py
+__version__ = "0.0"
+#
+# This is a FlagStr detector for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module finds the ending code FlagStr in extracted numerals.
+#
+# The numerals are fed one by one, as they are extracted, and matched
+# against FlagStr with the Knuth-Morris-Pratt algorithm: each numeral is
+# compared a constant number of times on average, and nothing is copied.
+# The detector tells as soon as FlagStr is complete, so the caller can
+# stop extracting.
+#
+# As in the original algo, the numerals are seen as a cycle: if FlagStr
+# is not found when all numerals are fed, the first ones are matched
+# again after the last ones (see finish()).
+#
+# Numerals of the data are passed to a sink as soon as they cannot be
+# part of FlagStr anymore, so only the first numerals (for CheckStr and
+# the cycle) and the last ones (a possible beginning of FlagStr) are
+# kept in memory.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Length of CheckStr, i.e. the number of numerals before the data
+CHECKSTR_LEN = 20
+
+# Number of numerals to pass to the sink at a time
+BLOCK_SIZE = 4096
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class FlagStr_detector:
+
+	# Sets FlagStr at creation time
+	#
+	# flagstr: the list of numerals to look for
+	# start: the position of CheckStr
+	# sink: the function to call with each list of numerals of the data,
+	#       in order; if None, they are kept (see data())
+	# block_size: the number of numerals to pass to the sink at a time
+	def __init__(self,flagstr,start=0,sink=None,block_size=BLOCK_SIZE):
+		self.flagstr = flagstr
+		self.start = start
+		self.block_size = block_size
+		# Numerals of the data, if there is no sink
+		self.collected = None
+		if sink == None:
+			self.collected = []
+			sink = self.collected.extend
+		self.sink = sink
+		# Number of numerals fed so far
+		self.count = 0
+		# First numerals, matched again by finish()
+		self.heads = start + CHECKSTR_LEN + flagstr.__len__()
+		self.head = []
+		# Numerals not passed to the sink yet, from position self.first
+		self.tail = []
+		self.first = 0
+		# Number of numerals of FlagStr matched so far
+		self.matched = 0
+		# Position of FlagStr, None until it is found
+		self.end = None
+		# KMP table: table[n] is the length of the longest proper
+		# prefix of flagstr[:n + 1] that is also a suffix of it
+		self.table = [0] * flagstr.__len__()
+		k = 0
+		for n in range(1,flagstr.__len__()):
+			while k > 0 and flagstr[n] != flagstr[k]:
+				k = self.table[k - 1]
+			if flagstr[n] == flagstr[k]:
+				k += 1
+			self.table[n] = k
+
+	#
+	#
+	#
+	# MATCHING
+	#
+
+	# Feeds the next numeral
+	#
+	# Returns True if FlagStr was found
+	def feed(self,num):
+		if self.end != None:
+			return True
+		pos = self.count
+		self.count += 1
+		if pos < self.heads:
+			self.head.append(num)
+		self.tail.append(num)
+		if self.match(num,pos):
+			# Pass the rest of the data
+			self.flush(self.end)
+			return True
+		if self.tail.__len__() >= self.block_size:
+			# NB: FlagStr cannot begin before the numerals matched so far
+			self.flush(self.count - self.matched)
+		return False
+
+	# Matches the numeral at a position of the cycle
+	#
+	# Returns True if FlagStr was found
+	def match(self,num,pos):
+		if self.end != None:
+			return True
+		# Only look for FlagStr after CheckStr
+		if pos < self.start + CHECKSTR_LEN or self.flagstr.__len__() == 0:
+			return False
+		while self.matched > 0 and num != self.flagstr[self.matched]:
+			self.matched = self.table[self.matched - 1]
+		if num == self.flagstr[self.matched]:
+			self.matched += 1
+		if self.matched == self.flagstr.__len__():
+			# FlagStr is complete
+			# -> Register its position
+			self.end = pos + 1 - self.flagstr.__len__()
+			return True
+		return False
+
+	# Matches the first numerals again after the last ones
+	#
+	# Returns True if FlagStr was found
+	#
+	# NB: Like the original algo, this looks for FlagStr at most once
+	# per numeral after CheckStr, and never past the second lap
+	def finish(self):
+		if self.end != None:
+			return True
+		n = self.count
+		last = min(n + self.start + CHECKSTR_LEN + self.flagstr.__len__() - 2,2 * n - 1)
+		pos = n
+		while pos <= last and self.end == None:
+			self.match(self.head[pos - n],pos)
+			pos += 1
+		if self.end == None:
+			return False
+		# Pass the rest of the data, then the numerals after the wrap
+		self.flush(min(self.end,n))
+		first = max(n,self.start + CHECKSTR_LEN)
+		if first < self.end:
+			self.sink(self.cycle(first,self.end))
+		return True
+
+	# Passes the numerals of the data before a position to the sink
+	def flush(self,last):
+		k = last - self.first
+		first = max(self.first,self.start + CHECKSTR_LEN)
+		if first < last:
+			self.sink(self.tail[first - self.first:k])
+		del self.tail[:k]
+		self.first = last
+
+	#
+	#
+	#
+	# RESULTS
+	#
+
+	# Returns the numerals between two positions of the cycle
+	#
+	# NB: Only works for the first numerals, i.e. the ones matched again
+	def cycle(self,first,last):
+		n = self.count
+		return [self.head[pos % n] for pos in range(first,last)]
+
+	# Returns CheckStr
+	def checkstr(self):
+		return self.cycle(self.start,self.start + CHECKSTR_LEN)
+
+	# Returns the numerals of the data, between CheckStr and FlagStr
+	#
+	# NB: Only if there is no sink
+	def data(self):
+		return self.collected
@@ -1,5 +1,9 @@
 #!/usr/bin/python3
 import os
+import mmap
+import asyncio
+import subprocess
+import tempfile
 
 #
 #
@@ -38,9 +42,25 @@ __version__ = "0.0"
 #
 # This module is a wrapper for QPDF and some system utilities for pdf_hide.
 #
-# It uses Python's OS system calls to expose the QPDF API.
+# It uses Python's subprocesses to expose the QPDF API, either with files
+# or with pipes. Pipes let the stages of the algo run concurrently, without
+# intermediate files.
 #
 
+#
+#
+#
+# STATIC
+#
+
+# Size of the buffers of pipes
+BUFFER_SIZE = 1 << 20
+
+# The file mode creation mask of the process (read once, as it can only
+# be read by setting it)
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
 #
 #
 # PUBLIC API
@@ -49,22 +69,204 @@ __version__ = "0.0"
 
 # Generates QDF file from PDF file, uncompressing streams if needed
 def uncompress(input,output):
-	os.system('qpdf '+input+' '+output+' --qdf --stream-data=uncompress')
+	return subprocess.call(["qpdf",input,output,"--qdf","--stream-data=uncompress"],pass_fds=fds(input,output))
 
 # Generates fixed QDF  file from damaged QDF file, reconstructing XRef and trailer if needed
 def fix(input,output):
-	os.system('fix-qdf <'+input+' >'+output)
+	with open(input,"rb") as input_file, open(output,"wb") as output_file:
+		return subprocess.call(["fix-qdf"],stdin=input_file,stdout=output_file)
 
 # Generates PDF file from QDF or PDF file, compressing streams if needed
 def compress(input,output):
-	os.system('qpdf '+input+' '+output+' --stream-data=compress')
+	return subprocess.call(["qpdf",input,output,"--stream-data=compress"],pass_fds=fds(input,output))
 
 # Removes file
 def delete(file):
-	os.system('rm '+file)
+	try:
+		os.remove(file)
+	except FileNotFoundError:
+		pass
+
+#
+# Pipes
+
+# Starts generating a QDF stream from PDF file, uncompressing streams if needed
+#
+# Returns the running process, the QDF stream is read from its stdout
+def uncompress_pipe(input):
+	return subprocess.Popen(["qpdf",input,"-","--qdf","--stream-data=uncompress"],stdout=subprocess.PIPE,bufsize=BUFFER_SIZE,pass_fds=fds(input))
+
+# Starts generating fixed QDF file from damaged QDF stream
+#
+# output_file: the open file to write the fixed QDF to
+#
+# Returns the running process, the damaged QDF stream is written to its stdin
+def fix_pipe(output_file):
+	return subprocess.Popen(["fix-qdf"],stdin=subprocess.PIPE,stdout=output_file,bufsize=BUFFER_SIZE)
+
+# Generates fixed QDF file from open damaged QDF file
+def fix_file(input_file,output_file):
+	input_file.flush()
+	input_file.seek(0,0)
+	return subprocess.call(["fix-qdf"],stdin=input_file,stdout=output_file)
+
+# Generates PDF file from open QDF or PDF file, compressing streams if needed
+#
+# NB: QPDF needs to seek in its input, so it cannot read from a pipe
+def compress_file(input_file,output):
+	input_file.flush()
+	input_file.seek(0,0)
+	return subprocess.call(["qpdf",fd_path(input_file),output,"--stream-data=compress"],pass_fds=(input_file.fileno(),) + fds(output))
+
+# Waits for a process to finish, closing its pipes
+def wait(process):
+	for pipe in (process.stdin,process.stdout):
+		if pipe != None:
+			pipe.close()
+	return process.wait()
+
+#
+# Asyncio
+#
+# NB: Same as above, but the event loop runs while QPDF does
+
+# Generates QDF file from PDF file, uncompressing streams if needed
+async def uncompress_async(input,output):
+	process = await asyncio.create_subprocess_exec("qpdf",input,output,"--qdf","--stream-data=uncompress",pass_fds=fds(input,output))
+	return await process.wait()
 
-# Fixes, compresses, and cleans
-def fcc(input,output):
-	fix(input,input+'.fix')
-	delete(input)
-	compress(input+'.fix',output)
+# Generates fixed QDF file from damaged QDF file
+async def fix_async(input,output):
+	with open(input,"rb") as input_file, open(output,"wb") as output_file:
+		process = await asyncio.create_subprocess_exec("fix-qdf",stdin=input_file,stdout=output_file)
+		return await process.wait()
+
+# Generates PDF file from QDF or PDF file, compressing streams if needed
+async def compress_async(input,output):
+	process = await asyncio.create_subprocess_exec("qpdf",input,output,"--stream-data=compress",pass_fds=fds(input,output))
+	return await process.wait()
+
+# Returns an anonymous temporary file, removed as soon as it is closed
+#
+# memory: if True, the file is in memory (see memfile())
+def spool(dir=None,memory=False):
+	if memory:
+		return memfile()
+	return tempfile.TemporaryFile(dir=dir)
+
+#
+# Files in memory
+
+# Returns an anonymous file in memory, opened in binary mode
+#
+# data: the initial content of the file, if any
+#
+# NB: The file has a descriptor, so QPDF can read and write it through
+# its path (see fd_path()); if the system cannot create files in memory,
+# it is an anonymous temporary file instead
+def memfile(data=None):
+	try:
+		memory_file = open(os.memfd_create("pdf_hide"),"w+b")
+	except (AttributeError,OSError):
+		memory_file = tempfile.TemporaryFile()
+	if data != None:
+		memory_file.write(data)
+		memory_file.seek(0)
+	return memory_file
+
+# Returns the path of the descriptor of an open file
+def fd_path(file):
+	return "/dev/fd/" + str(file.fileno())
+
+# Returns the descriptors to pass to a subprocess for its file arguments
+#
+# NB: Only descriptor paths (see fd_path()) need to be passed
+def fds(*paths):
+	return tuple(int(path[8:]) for path in paths if isinstance(path,str) and path.startswith("/dev/fd/"))
+
+# Opens a temporary file to write output to, next to it
+#
+# Returns a list f[]
+# f[0] is the temporary file, opened in binary mode
+# f[1] is its path, or None if output is not a regular file (then f[0]
+#      is output itself, e.g. /dev/stdout, which cannot be replaced)
+#
+# NB: The temporary file has a unique name, so concurrent runs writing the
+# same output never share it; it gets the permissions that open() would
+# give output (or those of output, if it exists)
+def open_atomic(output,buffering=BUFFER_SIZE):
+	if os.path.exists(output) and not os.path.isfile(output):
+		return [open(output,"wb",buffering),None]
+	(fd,temp) = tempfile.mkstemp(dir=os.path.dirname(output) or ".",prefix="." + os.path.basename(output) + ".",suffix=".tmp")
+	try:
+		if os.path.isfile(output):
+			os.fchmod(fd,os.stat(output).st_mode & 0o7777)
+		else:
+			os.fchmod(fd,0o666 & ~UMASK)
+		return [open(fd,"wb",buffering),temp]
+	except OSError:
+		os.close(fd)
+		delete(temp)
+		raise
+
+# Closes a file opened with open_atomic(), replacing output if commit is True
+#
+# NB: Otherwise, the temporary file is removed and output is unchanged
+def close_atomic(output_file,temp,output,commit):
+	output_file.close()
+	if temp == None:
+		return
+	if commit:
+		os.replace(temp,output)
+	else:
+		delete(temp)
+
+#
+# Reading
+
+# Yields the content of an open file in blocks of whole lines
+#
+# NB: Regular files are mapped in memory, and blocks are memoryview
+# slices of the mapping; pipes are read in large chunks. Either way,
+# no object is created per line.
+def blocks(input_file,block_size=BUFFER_SIZE):
+	try:
+		buffer = mmap.mmap(input_file.fileno(),0,access=mmap.ACCESS_READ)
+	except (OSError,ValueError,AttributeError):
+		# Not a regular file, or an empty one
+		yield from read_blocks(input_file,block_size)
+		return
+	# NB: The mapping is closed when the last block is released
+	view = memoryview(buffer)
+	pos = 0
+	end = buffer.__len__()
+	while pos < end:
+		# Cut after the first newline after block_size bytes
+		cut = buffer.find(b"\n",min(pos + block_size,end) - 1)
+		if cut < 0:
+			cut = end
+		else:
+			cut += 1
+		yield view[pos:cut]
+		pos = cut
+
+# Yields the content of an open file in blocks of whole lines, reading it
+#
+# NB: Long lines (e.g. raw image data) are read in many blocks, which are
+# joined once, when their newline arrives
+def read_blocks(input_file,block_size=BUFFER_SIZE):
+	pending = []
+	while True:
+		data = input_file.read(block_size)
+		if not data:
+			break
+		# Keep the incomplete last line for the next block
+		cut = data.rfind(b"\n") + 1
+		if cut == 0:
+			pending.append(data)
+			continue
+		pending.append(data[:cut])
+		yield b"".join(pending)
+		pending = [data[cut:]] if cut < data.__len__() else []
+	if pending.__len__() > 0:
+		yield b"".join(pending)
@@ -1,4 +1,5 @@
 #!/usr/bin/python3
+import math
 import hashlib
 
 #
@@ -42,6 +43,9 @@ __version__ = "0.0"
 # as the `bytes` type in Python), binary representations (implemented as
 # UTF-8 strings of "0"s and "1"s), and n-bits integers called 'numerals'.
 #
+# Messages are packed into numerals (and unpacked) with integer shifts,
+# a few bytes at a time; binary representations are only used for debug.
+#
 
 #
 #
@@ -60,11 +64,31 @@ def digest(str):
 
 # Encodes a 20-byte SHA1 digest to a list of 20 numerals array according to the algo
 def digest_to_nums(d,nbits):
-	return [hexstr_to_num(dig,nbits) for dig in split_len(digest(d),2)]
+	return hexdigest_to_nums(digest(d),nbits)
+
+# Encodes a SHA1 digest (as an hexadecimal string) to a list of 20 numerals according to the algo
+def hexdigest_to_nums(h,nbits):
+	return [hexstr_to_num(dig,nbits) for dig in split_len(h,2)]
 
 # Encodes a message to a list of numerals according to the algo
+#
+# NB: The message is read as a big-endian number, written in base 2^nbits
+# without leading zeros (but with at least one numeral)
 def msg_to_nums(msg,nbits):
-	return [binstr_to_num(str,nbits) for str in pad_str(msg,nbits)]
+	if not isinstance(msg,type(b'')):
+		msg = msg.encode('utf-8')
+	if msg.__len__() < 1:
+		return []
+	# Pack whole chunks of bytes, aligned on the end of the message
+	(size,count) = chunk_len(nbits)
+	msg = bytes((size - msg.__len__() % size) % size) + msg
+	chunks = pack(msg,size,8)
+	nums = unpack(chunks,count,nbits)
+	# Remove leading zeros
+	k = 0
+	while k < nums.__len__() - 1 and nums[k] == 0:
+		k += 1
+	return nums[k:]
 
 # Encodes a message and a stego key according to the algo
 #
@@ -90,6 +114,27 @@ def encode_key(key,nbits):
 def decode(bin_str):
 	return [binstr_to_byte_bige(num) for num in split_len(tail_bige(bin_str),8)]
 
+# Decodes a list of numerals into a message according to the algo
+#
+# NB: Same as decoding the binary representation of the numerals, i.e.
+# the message has as many bytes as the numerals have whole bytes, plus
+# one if the remaining leading bits are not all zeros
+def nums_to_msg(nums,nbits):
+	if nums.__len__() < 1:
+		return b""
+	# Number of bits and whole bytes of the numerals
+	nbits_all = nums.__len__() * nbits
+	nbytes = nbits_all // 8
+	# Unpack whole chunks of numerals, aligned on the end of the list
+	(size,count) = chunk_len(nbits)
+	nums = [0] * ((count - nums.__len__() % count) % count) + nums
+	chunks = pack(nums,count,nbits)
+	msg = bytes(unpack(chunks,size,8))
+	# Check the remaining leading bits
+	if nbits_all % 8 > 0 and msg[msg.__len__() - nbytes - 1] > 0:
+		nbytes += 1
+	return msg[msg.__len__() - nbytes:]
+
 #
 # Math
 
@@ -146,6 +191,39 @@ def split_len(seq,length):
 #
 #
 
+#
+# Packing numerals
+
+# Returns a list c[]
+# c[0] is the smallest number of bytes that make whole numerals
+# c[1] is the number of numerals in c[0] bytes
+def chunk_len(nbits):
+	size = nbits // math.gcd(8,nbits)
+	return [size,size * 8 // nbits]
+
+# Packs groups of n-bit integers into big-endian integers
+#
+# ints: the sequence of integers, its length is a multiple of count
+# count: the number of integers in a group
+#
+# NB: Works on whole sequences with slices, one step per integer of a group
+def pack(ints,count,nbits):
+	chunks = list(ints[0::count])
+	for k in range(1,count):
+		chunks = [(chunk << nbits) | n for (chunk,n) in zip(chunks,ints[k::count])]
+	return chunks
+
+# Unpacks big-endian integers into groups of n-bit integers (the reverse of pack)
+def unpack(chunks,count,nbits):
+	if count == 1:
+		return chunks
+	mask = 2**nbits - 1
+	ints = [0] * (chunks.__len__() * count)
+	for k in range(count):
+		shift = nbits * (count - 1 - k)
+		ints[k::count] = [(chunk >> shift) & mask for chunk in chunks]
+	return ints
+
 #
 # Padding strings
 
@@ -0,0 +1,342 @@
+#!/usr/bin/python3
+import sys
+import array
+import random
+import hashlib
+import threading
+import collections
+
+from pdfhide import chaos
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# keystream.py
+__version__ = "0.0"
+#
+# This is a keystream generator for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module generates the keystreams of the pdf_hide algo in blocks,
+# and caches them.
+#
+# A keystream is the sequence of numbers of a chaotic map (see chaos.py),
+# or of Python's PRNG with a given seed (used by the improvements). The
+# numbers are generated a block at a time into an array, which is kept
+# in a cache shared by all readers of the same keystream: extracting
+# many documents with the same key only generates its keystream once.
+#
+# The cache is shared by all threads. Each keystream is generated under a
+# lock, so readers in concurrent threads all read the same numbers, and
+# only ever read numbers that are already generated. Keystreams longer
+# than CACHE_LIMIT leave the cache (their readers keep them until done),
+# and keystreams seeded from the payload are not cached at all.
+#
+# Readers (see Keystream) have the same interface as chaos.Chaotic and
+# random.Random, so they can be used in their place, and they return the
+# same numbers, bit for bit.
+#
+# The counter mode is another kind of keystream, not compatible with the
+# original algo: the n-th number is derived from a hash of the key and n
+# (BLAKE2b in keyed mode), so it can be computed without computing the
+# previous ones. Readers of counter keystreams (see Counter_keystream)
+# can seek to any position: shard workers seek to the first TJ op of
+# their shard (see shard.py).
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Number of numbers to generate at a time
+BLOCK_SIZE = 4096
+
+# Number of keystreams to keep in the cache
+CACHE_SIZE = 16
+
+# Maximum length of a cached keystream (8 MiB of numbers)
+CACHE_LIMIT = 1 << 20
+
+# The cache: keystreams by key, least recently used first
+cache = collections.OrderedDict()
+
+# The lock of the cache
+lock = threading.Lock()
+
+# Number of numbers per hash in counter mode (64-byte digests)
+COUNTER_LANES = 8
+
+# Scale of numbers in counter mode (53 bits, like Python's floats)
+COUNTER_SCALE = 2.**-53
+
+#
+#
+#
+# SOURCES
+#
+
+# Numbers of a generator, in an array that only grows
+#
+# NB: The array is extended a block at a time (under the GIL, or the lock
+# of the array in free-threaded builds), so readers never see a partial
+# block; the generator itself is only run under the lock of the source
+class Source:
+
+	def __init__(self):
+		self.values = array.array("d")
+		self.lock = threading.Lock()
+		# Key in the cache, if cached
+		self.key = None
+
+	# Generates numbers until there are at least count
+	def extend(self,count):
+		with self.lock:
+			while self.values.__len__() < count:
+				self.values.extend(self.generate())
+		if self.key != None and self.values.__len__() > CACHE_LIMIT:
+			uncache(self)
+
+	# Returns the next block of numbers
+	def generate(self):
+		raise NotImplementedError
+
+# Numbers of a chaotic map
+class Chaotic_source(Source):
+
+	def __init__(self,mu,flagstr):
+		Source.__init__(self)
+		self.map = chaos.Chaotic(mu,flagstr)
+
+	def generate(self):
+		return self.map.block(BLOCK_SIZE)
+
+# Numbers of Python's PRNG
+class Random_source(Source):
+
+	def __init__(self,seed):
+		Source.__init__(self)
+		self.prng = random.Random(seed)
+
+	def generate(self):
+		r = self.prng.random
+		return [r() for k in range(BLOCK_SIZE)]
+
+#
+#
+#
+# MAIN CLASS
+#
+
+# A reader of a keystream
+class Keystream:
+
+	def __init__(self,source):
+		self.source = source
+		# Position of the next number
+		self.pos = 0
+
+	# Gets the next number
+	def next(self):
+		try:
+			x = self.source.values[self.pos]
+		except IndexError:
+			self.source.extend(self.pos + BLOCK_SIZE)
+			x = self.source.values[self.pos]
+		self.pos += 1
+		return x
+
+	# Same as next(), like random.Random
+	random = next
+
+	# Gets the next number that is not zero
+	#
+	# NB: Same as calling next() until it does not return zero
+	def nonzero(self):
+		x = self.next()
+		while x == 0:
+			x = self.next()
+		return x
+
+	# Gets the next count numbers
+	#
+	# Returns an array
+	def block(self,count):
+		self.source.extend(self.pos + count)
+		self.pos += count
+		return self.source.values[self.pos - count:self.pos]
+
+	# Yields the next numbers, without end
+	def __iter__(self):
+		values = self.source.values
+		while True:
+			if self.pos >= values.__len__():
+				self.source.extend(self.pos + BLOCK_SIZE)
+			end = min(values.__len__(),self.pos + BLOCK_SIZE)
+			for x in values[self.pos:end]:
+				self.pos += 1
+				yield x
+
+	# Yields the next numbers that are not zero, without end
+	def nonzeros(self):
+		for x in self:
+			if x != 0:
+				yield x
+
+# A seekable reader of a counter keystream
+class Counter_keystream:
+
+	# Derives the hash key from a label and a seed at creation time
+	#
+	# label: the name of the keystream (e.g. "one" or "two")
+	# seed: the key of the keystream (as str or bytes)
+	def __init__(self,label,seed):
+		if not isinstance(seed,type(b'')):
+			seed = str(seed).encode("utf-8")
+		self.key = hashlib.blake2b(seed,digest_size=64,person=b"pdf_hide-ctr",salt=label.encode("utf-8")[:16]).digest()
+		# Position of the next number
+		self.pos = 0
+		# Numbers from position self.first
+		self.first = 0
+		self.values = array.array("d")
+
+	# Computes numbers at any position
+	#
+	# Returns an array of count numbers, from position first
+	#
+	# NB: Numbers are in ]0,1[, and never zero
+	def compute(self,first,count):
+		values = array.array("d")
+		lanes = array.array("Q")
+		for n in range(first // COUNTER_LANES,(first + count + COUNTER_LANES - 1) // COUNTER_LANES):
+			lanes.frombytes(hashlib.blake2b(n.to_bytes(8,"little"),key=self.key).digest())
+		if sys.byteorder != "little":
+			lanes.byteswap()
+		skip = first % COUNTER_LANES
+		values.extend([((lane >> 11) + .5) * COUNTER_SCALE for lane in lanes[skip:skip + count]])
+		return values
+
+	# Moves to a position
+	def seek(self,pos):
+		self.pos = pos
+
+	# Gets the next number
+	def next(self):
+		k = self.pos - self.first
+		if k < 0 or k >= self.values.__len__():
+			# Compute the next numbers
+			self.first = self.pos
+			self.values = self.compute(self.pos,BLOCK_SIZE)
+			k = 0
+		self.pos += 1
+		return self.values[k]
+
+	# Same as next(), like random.Random
+	random = next
+
+	# Same as next(), since numbers are never zero
+	nonzero = next
+
+	# Gets the next count numbers
+	#
+	# Returns an array
+	def block(self,count):
+		self.pos += count
+		return self.compute(self.pos - count,count)
+
+	# Yields the next numbers, without end
+	def __iter__(self):
+		while True:
+			for x in self.block(BLOCK_SIZE):
+				yield x
+
+	# Same as __iter__(), since numbers are never zero
+	def nonzeros(self):
+		return iter(self)
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Returns a reader of the keystream of a chaotic map
+def chaotic(mu,flagstr):
+	return Keystream(get(("chaos",mu,tuple(flagstr)),lambda: Chaotic_source(mu,flagstr)))
+
+# Returns a reader of the keystream of Python's PRNG
+#
+# shared: if False, the keystream is not cached (e.g. for a seed that will
+#         never be seen again)
+def prng(seed,shared=True):
+	if not shared:
+		return Keystream(Random_source(seed))
+	return Keystream(get(("random",seed),lambda: Random_source(seed)))
+
+# Returns a seekable reader of a counter keystream
+#
+# NB: Counter keystreams are not cached, any number is cheap to compute
+def counter(label,seed):
+	return Counter_keystream(label,seed)
+
+# Removes all keystreams from the cache
+def clear():
+	with lock:
+		for source in cache.values():
+			source.key = None
+		cache.clear()
+
+#
+#
+# INTERNALS
+#
+#
+
+# Gets a keystream from the cache, or creates it
+#
+# NB: Creating a source does not generate numbers, so it is cheap
+def get(key,create):
+	with lock:
+		if key in cache:
+			cache.move_to_end(key)
+			return cache[key]
+		source = create()
+		source.key = key
+		cache[key] = source
+		if cache.__len__() > CACHE_SIZE:
+			cache.popitem(last=False)[1].key = None
+		return source
+
+# Removes a keystream from the cache, if it is still there
+def uncache(source):
+	with lock:
+		if source.key != None and cache.get(source.key) is source:
+			del cache[source.key]
+		source.key = None
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+from pdfhide import driver
+from pdfhide import logger
+from pdfhide import pdf_algo
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# memory.py
+__version__ = "0.0"
+#
+# This is an in-memory API for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module embeds and extracts data with PDF files held in memory.
+#
+# The PDF files are passed and returned as bytes. Under the hood, they
+# are anonymous files in memory (see driver.memfile()): QPDF reads and
+# writes them through the paths of their descriptors, and the algo keeps
+# all its temporary files in memory too. Nothing is written to disk (but
+# on systems that cannot create files in memory, where anonymous
+# temporary files are used instead).
+#
+# Errors are raised as ValueError, with the reason of the algo.
+#
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Embeds data with passkey in a PDF file
+#
+# cover: the PDF file (as bytes or any buffer)
+# data: the data to embed (as bytes, str, a binary file, or an iterable of bytes)
+# log: the logger to use, defaults to a quiet one
+# the other arguments are the algo settings (see PDF_stego)
+#
+# Returns the new PDF file (as bytes)
+def embed_bytes(cover,data,passkey,improve=False,red=0.1,nbits=4,customrange=False,norandom=False,counter=False,log=None):
+	cover_file = driver.memfile(cover)
+	output_file = driver.memfile()
+	try:
+		ps = pdf_algo.PDF_stego(
+			  driver.fd_path(cover_file),
+			  quiet(log),
+			  output=driver.fd_path(output_file),
+			  improve=improve,
+			  red=red,
+			  nbits=nbits,
+			  customrange=customrange,
+			  counter=counter,
+			  memory=True
+			  )
+		result = ps.embed(data,passkey,norandom=norandom)
+		if result < 0:
+			raise ValueError("Not enough space available (" + str(-result) + " numerals needed)")
+		# NB: QPDF wrote the file through another descriptor
+		output_file.seek(0)
+		return output_file.read()
+	finally:
+		cover_file.close()
+		output_file.close()
+
+# Extracts data with passkey from a PDF file
+#
+# stego: the PDF file (as bytes or any buffer)
+# log: the logger to use, defaults to a quiet one
+# the other arguments are the algo settings (see PDF_stego)
+#
+# Returns the extracted data (as bytes)
+def extract_bytes(stego,passkey,improve=False,red=0.1,nbits=4,customrange=False,counter=False,log=None):
+	stego_file = driver.memfile(stego)
+	try:
+		ps = pdf_algo.PDF_stego(
+			  driver.fd_path(stego_file),
+			  quiet(log),
+			  improve=improve,
+			  red=red,
+			  nbits=nbits,
+			  customrange=customrange,
+			  counter=counter,
+			  memory=True
+			  )
+		values = ps.iter_values()
+		try:
+			res = ps.decode_values(values,passkey)
+		finally:
+			# Stop reading the PDF file
+			values.close()
+		if res[0] == None:
+			raise ValueError(res[1])
+		return res[0]
+	finally:
+		stego_file.close()
+
+#
+#
+# INTERNALS
+#
+#
+
+# Returns a logger, quiet by default
+def quiet(log):
+	if log == None:
+		return logger.rootLogger(logger.CRITICAL)
+	return log
@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+import io
+import array
+import hashlib
+
+from pdfhide import driver
+from pdfhide import encoding
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# payload.py
+__version__ = "0.0"
+#
+# This is a payload streamer for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module turns the data to embed into numerals without holding all
+# of it in memory.
+#
+# The data is read twice. The first pass computes its SHA-1 (CheckStr
+# comes first in the embedded numerals) and the position of its first
+# non-zero byte (the numerals are aligned on the end of the data, without
+# leading zeros, see encoding.msg_to_nums()). The second pass packs the
+# data into numerals a block at a time, as the TJ ops consume them.
+#
+# Data that cannot be read twice (pipes, iterators) is copied to an
+# anonymous temporary file during the first pass.
+#
+# The numerals are exactly those of encoding.encode_msg().
+#
+# The other way around, extracted numerals are spooled to an anonymous
+# temporary file as they are found: the data is also aligned on the end
+# of the numerals, so it can only be decoded once the last one is known.
+# It is then decoded a block at a time, and hashed as it is written.
+#
+# The data is exactly that of encoding.nums_to_msg().
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Number of bytes to read at a time
+BLOCK_SIZE = 1 << 16
+
+#
+#
+#
+# MAIN CLASSES
+#
+
+# The data to embed
+class Payload:
+
+	# Reads the data once at creation time
+	#
+	# data: bytes, str, a file opened in binary mode, or an iterable of bytes
+	# nbits: the number of bits per numeral
+	# tmpdir: the directory of the temporary file, if one is needed
+	# memory: if True, the temporary file is in memory
+	def __init__(self,data,nbits,tmpdir=None,memory=False):
+		self.nbits = nbits
+		self.spooled = None
+		if isinstance(data,str):
+			data = data.encode('utf-8')
+		if isinstance(data,(bytes,bytearray,memoryview)):
+			# NB: BytesIO does not copy bytes until they are written
+			data = io.BytesIO(data)
+		if hasattr(data,"read") and seekable(data):
+			self.file = data
+			self.first = data.tell()
+			chunks = iter(lambda: data.read(BLOCK_SIZE),b"")
+		else:
+			# Cannot read it twice
+			# -> Copy it while reading it
+			self.spooled = driver.spool(tmpdir,memory)
+			self.file = self.spooled
+			self.first = 0
+			chunks = spool_chunks(data,self.spooled)
+		# First pass
+		h = hashlib.sha1()
+		self.size = 0
+		# Position and value of the first non-zero byte
+		lead = None
+		lead_byte = 0
+		for chunk in chunks:
+			h.update(chunk)
+			if lead == None:
+				k = chunk.__len__() - chunk.lstrip(b"\0").__len__()
+				if k < chunk.__len__():
+					lead = self.size + k
+					lead_byte = chunk[k]
+			self.size += chunk.__len__()
+		self.hexdigest = h.hexdigest()
+		# Number of numerals
+		if self.size == 0:
+			self.count = 0
+		elif lead == None:
+			# All zeros
+			# -> One zero numeral
+			self.count = 1
+		else:
+			nbits_all = (self.size - lead - 1) * 8 + lead_byte.bit_length()
+			self.count = (nbits_all + nbits - 1) // nbits
+
+	# Returns the number of numerals of the data
+	def __len__(self):
+		return self.count
+
+	# Returns the SHA-1 digest of the data, as an hexadecimal string
+	def digest(self):
+		return self.hexdigest
+
+	# Returns the list of 20 numerals representing CheckStr
+	def checkstr(self):
+		return encoding.hexdigest_to_nums(self.hexdigest,self.nbits)
+
+	# Yields the numerals of the data, a block at a time
+	#
+	# NB: Same as encoding.msg_to_nums(), the data is read again
+	def numerals(self):
+		if self.count == 0:
+			return
+		(size,count) = encoding.chunk_len(self.nbits)
+		self.file.seek(self.first)
+		# Pad the data to whole chunks, aligned on its end
+		pending = bytes((size - self.size % size) % size)
+		# Leading zero numerals to skip
+		skip = (self.size + pending.__len__()) // size * count - self.count
+		block_size = BLOCK_SIZE - BLOCK_SIZE % size
+		while True:
+			data = self.file.read(block_size)
+			if data:
+				pending += data
+			cut = pending.__len__() - pending.__len__() % size
+			if cut == 0:
+				if not data:
+					break
+				continue
+			nums = encoding.unpack(encoding.pack(pending[:cut],size,8),count,self.nbits)
+			pending = pending[cut:]
+			if skip > 0:
+				# NB: Leading zeros may span several blocks
+				k = min(skip,nums.__len__())
+				nums = nums[k:]
+				skip -= k
+			yield from nums
+
+	# Releases the temporary file, if any
+	def close(self):
+		if self.spooled != None:
+			self.spooled.close()
+			self.spooled = None
+
+# The numerals to embed: CheckStr, the data, then FlagStr
+#
+# NB: Behaves as a list, but numerals are generated as they are read,
+# and must be read in order
+class Numerals:
+
+	def __init__(self,payload,flagstr):
+		self.payload = payload
+		self.checkstr = payload.checkstr()
+		self.flagstr = flagstr
+		self.data = payload.numerals()
+		# Position of the next numeral of the data
+		self.pos = 0
+		# Last numeral of the data read
+		self.last = None
+
+	def __len__(self):
+		return self.checkstr.__len__() + self.payload.__len__() + self.flagstr.__len__()
+
+	def __getitem__(self,k):
+		n = self.checkstr.__len__()
+		if k < n:
+			return self.checkstr[k]
+		k -= n
+		n = self.payload.__len__()
+		if k >= n:
+			return self.flagstr[k - n]
+		if k == self.pos - 1:
+			return self.last
+		if k != self.pos:
+			raise IndexError("numerals must be read in order")
+		self.last = next(self.data)
+		self.pos += 1
+		return self.last
+
+# The extracted data
+class Output:
+
+	# Sets the number of bits per numeral at creation time
+	#
+	# tmpdir: the directory of the temporary file
+	# memory: if True, the temporary file is in memory
+	def __init__(self,nbits,tmpdir=None,memory=False):
+		self.nbits = nbits
+		self.typecode = "B" if nbits <= 8 else "L"
+		self.spooled = driver.spool(tmpdir,memory)
+		# Number of numerals written so far
+		self.count = 0
+
+	# Returns the number of numerals of the data
+	def __len__(self):
+		return self.count
+
+	# Writes the next numerals of the data
+	def write(self,nums):
+		array.array(self.typecode,nums).tofile(self.spooled)
+		self.count += nums.__len__()
+
+	# Decodes the data, writes it to a sink
+	#
+	# Returns a list res[]
+	# res[0] is the number of bytes written
+	# res[1] is the SHA-1 digest of the data, as an hexadecimal string
+	#
+	# NB: Same as encoding.nums_to_msg(), the numerals are read again
+	def decode(self,sink):
+		h = hashlib.sha1()
+		size = 0
+		if self.count > 0:
+			(chunk_size,count) = encoding.chunk_len(self.nbits)
+			self.spooled.flush()
+			self.spooled.seek(0)
+			# Pad the numerals to whole chunks, aligned on their end
+			pending = array.array(self.typecode,[0] * ((count - self.count % count) % count))
+			# Leading bytes to skip
+			nbits_all = self.count * self.nbits
+			skip = (self.count + pending.__len__()) // count * chunk_size - nbits_all // 8
+			block_size = BLOCK_SIZE - BLOCK_SIZE % count
+			while True:
+				data = self.spooled.read(block_size * pending.itemsize)
+				pending.frombytes(data)
+				cut = pending.__len__() - pending.__len__() % count
+				if cut == 0:
+					if not data:
+						break
+					continue
+				msg = bytes(encoding.unpack(encoding.pack(pending[:cut],count,self.nbits),chunk_size,8))
+				del pending[:cut]
+				if skip > 0:
+					# Keep the remaining leading bits if they are not all zeros
+					#
+					# NB: They are in the first chunk
+					if nbits_all % 8 > 0 and msg[skip - 1] > 0:
+						skip -= 1
+					msg = msg[skip:]
+					skip = 0
+				h.update(msg)
+				sink.write(msg)
+				size += msg.__len__()
+		return [size,h.hexdigest()]
+
+	# Releases the temporary file
+	def close(self):
+		self.spooled.close()
+
+#
+#
+# INTERNALS
+#
+#
+
+# Returns True if a file can be read twice
+def seekable(file):
+	try:
+		return file.seekable()
+	except (AttributeError,ValueError):
+		return False
+
+# Yields the chunks of a file or iterable, writing them to a spool
+def spool_chunks(data,spool):
+	if hasattr(data,"read"):
+		file = data
+		data = iter(lambda: file.read(BLOCK_SIZE),b"")
+	for chunk in data:
+		if isinstance(chunk,str):
+			chunk = chunk.encode('utf-8')
+		spool.write(chunk)
+		yield chunk
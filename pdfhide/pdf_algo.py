@@ -1,11 +1,19 @@
 #!/usr/bin/python3
-import re
-import random
+import io
+import os
+import tempfile
+import itertools
 
-from pdfhide import chaos
+from pdfhide import detector
 from pdfhide import driver
 from pdfhide import encoding
+from pdfhide import keystream
 from pdfhide import logger
+from pdfhide import payload
+from pdfhide import qdf
+from pdfhide import reader
+from pdfhide import shard
+from pdfhide import tokenizer
 
 #
 #
@@ -73,6 +81,28 @@ class PDF_stego:
 	# Only use values in custom range for LaTeX
 	customrange = False
 
+	# Read content streams in-process instead of with QPDF when possible
+	native = True
+
+	# Directory for temporary files, defaults to the system one
+	tmpdir = None
+
+	# Cache of QDF files, not used if None
+	cache = None
+
+	# Template of the input file, not used if None
+	template = None
+
+	# Use counter-mode keystreams instead of chaotic maps (not compatible
+	# with the original algo, see keystream.py)
+	counter = False
+
+	# Number of worker processes to embed with (see shard.py)
+	workers = 1
+
+	# Keep temporary files in memory instead of on disk
+	memory = False
+
 	# Chaotic map parameters, should be in ]3.57,4[
 	mu_one = 3.7
 	mu_two = 3.8
@@ -91,9 +121,18 @@ class PDF_stego:
 	#
 
 	# Set algo settings at creation time
-	def __init__(self,input,log,output="a.out",improve=False,red=0.1,nbits=4,customrange=False):
+	def __init__(self,input,log,output="a.out",improve=False,red=0.1,nbits=4,customrange=False,native=True,tmpdir=None,cache=None,template=None,counter=False,workers=1,memory=False):
 		self.input = input
 		self.output = output
+		self.native = native
+		self.tmpdir = tmpdir
+		self.cache = cache
+		self.template = template
+		self.counter = counter
+		self.workers = workers
+		self.memory = memory
+		# Called with the name of each phase of the algo as it starts, if set (see phase())
+		self.timer = None
 		self.improve = improve
 		self.l = log
 		self.redundancy = red
@@ -122,36 +161,189 @@ class PDF_stego:
 	# Parsing tools for TJ operators
 
 	def get_tjs(self,line):
-		tjs = []
-		k = 0
-		while k < line.__len__():
-			# Parse TJ string from current position
-			m = re.search(r'[>)](\-?[0-9]+)[<(]',line[k:])
-			if m == None:
-				# No more TJ ops
-				k = line.__len__()
-			else:
-				val = int(m.group(1))
-				if (self.improve or abs(val) < 2**self.nbits + 1) and val != 0:
-					tjs += [abs(val)]
-				k += m.end(1)
-		return tjs
+		return [abs(val) for val in self.get_tjs_signed(line)]
 
 	def get_tjs_signed(self,line):
-		tjs = []
-		k = 0
-		while k < line.__len__():
-			# Parse TJ string from current position
-			m = re.search(r'[>)](\-?[0-9]+)[<(]',line[k:])
-			if m == None:
-				# No more TJ ops
-				k = line.__len__()
+		return [val for val in tokenizer.values(line) if (self.improve or abs(val) < 2**self.nbits + 1) and val != 0]
+
+	#
+	# Reading tools for content streams
+
+	# Yields the content of a PDF file to parse for TJ operators
+	#
+	# input: the PDF file to read, defaults to the input file
+	#
+	# NB: Page content streams are read in-process when possible,
+	# otherwise the whole file is uncompressed by QPDF and read in blocks
+	# (the input file is read from the cache, if any, instead)
+	def read_content(self,input=None):
+		if input == None:
+			input = self.input
+			# Read the QDF file from the template
+			if self.template != None:
+				yield self.template.qdf
+				return
+			# Try to read the QDF file from the cache
+			if self.cache != None:
+				with self.cache.open(input) as cover_file:
+					yield from driver.blocks(cover_file)
+				return
+		# Try to read content streams in-process
+		if self.native:
+			try:
+				streams = reader.contents(input)
+			except reader.ReaderError as e:
+				self.l.info("Cannot read content streams directly, using QPDF",str(e))
 			else:
-				val = int(m.group(1))
-				if (self.improve or abs(val) < 2**self.nbits + 1) and val != 0:
-					tjs += [val]
-				k += m.end(1)
-		return tjs
+				yield from streams
+				return
+		# Uncompress the whole file
+		uncompressor = driver.uncompress_pipe(input)
+		try:
+			yield from driver.blocks(uncompressor.stdout)
+		finally:
+			# Close pipe
+			driver.wait(uncompressor)
+
+	#
+	# Keystream tools
+
+	# Returns chaotic map 1 for embedding data with passkey
+	#
+	# data: the payload to embed (see payload.py)
+	# flagstr: the numerals of FlagStr
+	def chaotic_one(self,data,passkey,flagstr):
+		if self.counter:
+			if self.improve:
+				return keystream.counter("one",data.digest())
+			return keystream.counter("one",passkey)
+		if self.improve:
+			# NB: Seeded from the payload, so never read again
+			return keystream.prng(data.digest(),shared=False)
+		return keystream.chaotic(self.mu_one,flagstr)
+
+	# Returns chaotic map 2 for passkey
+	#
+	# nbits, improve: the algo settings to use
+	def chaotic_two(self,passkey,nbits,improve):
+		if self.counter:
+			return keystream.counter("two",passkey)
+		if improve:
+			return keystream.prng(passkey)
+		return keystream.chaotic(self.mu_two,encoding.encode_key(passkey,nbits))
+
+	#
+	#
+	#
+	# CAPACITY
+	#
+
+	# Counts the TJ ops usable for data
+	#
+	# values: the signed values of all TJ ops of the input file
+	# nbits, red, improve, customrange: the algo settings to use
+	# passkey: if set, the key to use for the redundancy filter,
+	#          otherwise the expected number of TJ ops is returned
+	#
+	# Returns the number of numerals that can be embedded (CheckStr and FlagStr included)
+	#
+	# NB: Same checks as embed_op(), with the same chaotic map
+	def count_slots(self,values,nbits,red,improve,customrange,passkey=None):
+		# Count valid TJ ops, and run the chaotic map for each TJ op
+		if passkey == None:
+			ch_two = None
+		else:
+			ch_two = self.chaotic_two(passkey,nbits,improve)
+		if ch_two == None:
+			stream = itertools.repeat(1)
+		elif improve:
+			# NB: Zeros are eliminated like in embed_line()
+			stream = ch_two.nonzeros()
+		else:
+			stream = iter(ch_two)
+		slots = 0
+		valid = 0
+		for (val,ch_two_next) in zip(values,stream):
+			# Check the TJ value
+			if val == 0 or (not improve and abs(val) > 2**nbits):
+				continue
+			if improve and customrange and not encoding.is_in_crange(val,nbits):
+				continue
+			valid += 1
+			# Check redundancy
+			if ch_two_next >= red:
+				slots += 1
+		if ch_two == None:
+			# Without key, redundancy rules out a share of valid TJ ops
+			return int(valid * (1 - red))
+		return slots
+
+	# Returns True if a TJ op is usable for data
+	#
+	# val: the signed value of the TJ op
+	# ch_two_next: the number from chaotic map 2 for the TJ op
+	# nbits, red, improve, customrange: the algo settings to use
+	#
+	# NB: Same checks as count_slots() and embed_op()
+	def is_slot(self,val,ch_two_next,nbits,red,improve,customrange):
+		if val == 0 or (not improve and abs(val) > 2**nbits):
+			return False
+		if improve and customrange and not encoding.is_in_crange(val,nbits):
+			return False
+		return ch_two_next >= red
+
+	# Returns the maximum number of bytes of data for a number of slots
+	#
+	# NB: CheckStr and FlagStr take 20 numerals each
+	def max_bytes(self,slots,nbits):
+		return max(0,(slots - 40) * nbits // 8)
+
+	# Computes the capacity of the input file with the algo settings
+	#
+	# passkey: if set, the redundancy filter of this key is used,
+	#          otherwise the expected capacity is returned
+	#
+	# Returns a list res[]
+	# res[0] is the number of numerals that can be embedded
+	# res[1] is the maximum number of bytes of data
+	def capacity(self,passkey=None):
+		slots = self.count_slots(self.read_values(),self.nbits,self.redundancy,self.improve,self.customrange,passkey)
+		return [slots,self.max_bytes(slots,self.nbits)]
+
+	# Computes the capacity of the input file for several algo settings
+	#
+	# nbits: the list of numbers of bits to try
+	# reds: the list of redundancy parameters to try
+	# passkey: see capacity()
+	#
+	# Returns a list of dicts, one per combination of settings (including
+	# improvements and custom range), with the settings, the number of
+	# numerals ("slots") and the maximum number of bytes ("bytes")
+	#
+	# NB: The input file is parsed only once
+	def capacities(self,nbits,reds,passkey=None):
+		values = self.read_values()
+		res = []
+		for improve in [False,True]:
+			for customrange in [False,True]:
+				if customrange and not improve:
+					# NB: Custom range needs improvements
+					continue
+				for n in nbits:
+					if customrange and n > 6:
+						# NB: Custom range forces NBITS to maximum 6
+						continue
+					for red in reds:
+						slots = self.count_slots(values,n,red,improve,customrange,passkey)
+						res += [{
+							"nbits":n,
+							"red":red,
+							"improve":improve,
+							"customrange":customrange,
+							"slots":slots,
+							"bytes":self.max_bytes(slots,n)
+							}]
+		return res
 
 	#
 	#
@@ -236,9 +428,64 @@ class PDF_stego:
 			return [True, -num - 1]
 		return [True, num + 1]
 
-	# Embeds data in TJ operators from a TJ string
+	# Embeds data in the next TJ operator
+	#
+	# tj: the original value of the TJ operator
+	# ch_one, ch_two, ind, i, start, ntjs, j: see embed_line()
+	#
+	# Returns a list res[] (see embed_op())
+	def embed_next(self,tj,ch_one,ch_two,ind,i,start,ntjs,j):
+		# -> Check if there still is data to embed
+		if i < ind.__len__():
+			# Try to embed numeral
+			# -> Check improvements flag
+			if self.improve:
+				# Using Python's randomness
+				# -> Eliminate zeros
+				#
+				# TODO: check that
+				ch_one_next = ch_one.nonzero()
+				ch_two_next = ch_two.nonzero()
+				# Check the position of the TJ op in the file
+				# and embed accordingly
+				if self.tj_count < start: #TODO: fix -> TODO: remember what i meant by "fix"
+					# TJ op is before the start position
+					# -> Check the end position
+					if start + ind.__len__() + j - ntjs > self.tj_count:
+						# TJ op is before the end position
+						# -> Shift the list of nums accordingly
+						#    and embed num
+						op = self.embed_op(tj,ch_one_next,ch_two_next,ind[ntjs - start + self.tj_count - j])
+					else:
+						# TJ op is after the end position
+						# -> Do not embed num
+						op = self.embed_op(tj,ch_one_next,ch_two_next,None)
+				# TJ op is after the start position
+				# -> Check if there is still data to embed
+				#
+				# NB: Not self.tj_count - j, which is behind i after TJ
+				# ops with a zero value (they are not counted in tj_count)
+				elif i - start < ind.__len__():
+					# Embed num
+					op = self.embed_op(tj,ch_one_next,ch_two_next,ind[i - start])
+				else:
+					# Do not embed num
+					op = self.embed_op(tj,ch_one_next,ch_two_next,None)
+			else:
+				# Improvements are disabled
+				# -> Embed next num
+				op = self.embed_op(tj,ch_one.next(),ch_two.next(),ind[i])
+		else:
+			# No more numerals to embed
+			if self.improve:
+				op = self.embed_op(tj,ch_one.random(),ch_two.random(),None)
+			else:
+				op = self.embed_op(tj,ch_one.next(),ch_two.next(),None)
+		return op
+
+	# Embeds data in TJ operators from a content line
 	#
-	# line: the TJ string to parse
+	# line: the content to parse (as bytes or any buffer, may be several lines)
 	# ch_one: chaotic map 1
 	# ch_two: chaotic map 2
 	# ind: the list of nums to embed
@@ -250,89 +497,146 @@ class PDF_stego:
 	# Returns a list res[]
 	# res[0] is the modified line
 	# res[1] is the new value of the IND index
+	# res[2] is the new value of the discarded index
 	def embed_line(self,line,ch_one,ch_two,ind,i,start,ntjs,j):
 		# Copy parameters to return
-		newline = line
 		i_ = i
 		j_ = j
-		# Go through the line
+		# Segments of the new line, joined once at the end
+		segments = []
+		# Position in the line after the last TJ op
 		k = 0
-		while k < newline.__len__():
-			# Look for a TJ op, starting at current position
-			m = re.search(r'[>)](\-?[0-9]+)[<(]',newline[k:])
-			if m == None:
-				# No more TJ ops
-				# -> Break the loop
-				k = newline.__len__()
+		# Go through the TJ ops of the line
+		for m in tokenizer.ops(line):
+			# A TJ op is found
+			op = self.embed_next(m.value,ch_one,ch_two,ind,i_,start,ntjs,j_)
+			if op[0]:
+				# One numeral was embedded, update valid index
+				i_ += 1
 			else:
-				# A TJ op is found
-				tj = int(m.group(1))
-				# -> Check if there still is data to embed
-				if i_ < ind.__len__():
-					# Try to embed numeral
-					# -> Check improvements flag
-					if self.improve:
-						# Using Python's randomness
-						# -> Eliminate zeros
-						#
-						# TODO: check that
-						ch_one_next = 0
-						while ch_one_next == 0:
-							ch_one_next = ch_one.random()
-						ch_two_next = 0
-						while ch_two_next == 0:
-							ch_two_next = ch_two.random()
-						# Check the position of the TJ op in the file
-						# and embed accordingly
-						if self.tj_count < start: #TODO: fix -> TODO: remember what i meant by "fix"
-							# TJ op is before the start position
-							# -> Check the end position
-							if start + ind.__len__() + j_ - ntjs > self.tj_count:
-								# TJ op is before the end position
-								# -> Shift the list of nums accordingly
-								#    and embed num
-								op = self.embed_op(tj,ch_one_next,ch_two_next,ind[ntjs - start + self.tj_count - j_])
-							else:
-								# TJ op is after the end position
-								# -> Do not embed num
-								op = self.embed_op(tj,ch_one_next,ch_two_next,None)
-						# TJ op is after the start position
-						# -> Check if there is still data to embed
-						elif self.tj_count - start < ind.__len__() + j_:
-							# Embed num
-							op = self.embed_op(tj,ch_one_next,ch_two_next,ind[self.tj_count - start - j_])
-						else:
-							# Do not embed num
-							op = self.embed_op(tj,ch_one_next,ch_two_next,None)
-					else:
-						# Improvements are disabled
-						# -> Embed next num
-						op = self.embed_op(tj,ch_one.next(),ch_two.next(),ind[i_])
-				else:
-					# No more numerals to embed
-					if self.improve:
-						op = self.embed_op(tj,ch_one.random(),ch_two.random(),None)
-					else:
-						op = self.embed_op(tj,ch_one.next(),ch_two.next(),None)
-				if op[0]:
-					# One numeral was embedded, update valid index
-					i_ += 1
-				else:
-					# Numeral was not embedded, update discarded index
-					j_ += 1
-				# Finished analizing TJ op
-				# -> Insert new value
-				newline = newline[:k + m.start(1)] + str(op[1]) + newline[k + m.end(1):]
-				# Update current position
-				# -> Jump after the current TJ op
-				k += m.start(1) + str(op[1]).__len__()
-				# -> Keep parsing the line
-		return [newline,i_,j_]
+				# Numeral was not embedded, update discarded index
+				j_ += 1
+			# Finished analizing TJ op
+			# -> Collect the content before the TJ op, then the new value
+			segments.append(line[k:m.offset])
+			segments.append(str(op[1]).encode("latin-1"))
+			# Update current position
+			# -> Jump after the current TJ op
+			k = m.offset + m.length
+			# -> Keep parsing the line
+		# Check if any TJ op was found
+		if k == 0:
+			# No TJ ops, the line is unchanged
+			return [line,i_,j_]
+		# Produce the new line at once
+		segments.append(line[k:])
+		return [b"".join(segments),i_,j_]
+
+	# Embeds data in TJ operators from a QDF file, writes the new QDF to a sink
+	#
+	# cover_file: the QDF file to parse (opened in binary mode)
+	# sink: the writable to write the new QDF to
+	# ch_one: chaotic map 1
+	# ch_two: chaotic map 2
+	# ind: the list of nums to embed
+	# start: the TJ op where data starts
+	#
+	# Returns the number of nums embedded
+	#
+	# NB: The file is parsed in blocks of whole lines (mapped in memory
+	# if possible), written as soon as they are parsed, so memory usage
+	# does not depend on the size of the file
+	def embed_file(self,cover_file,sink,ch_one,ch_two,ind,start):
+		i = 0
+		j = 0
+		for lines in driver.blocks(cover_file):
+			# Embed data in the TJ blocks of the lines
+			block = self.embed_line(lines,ch_one,ch_two,ind,i,start,self.tjs.__len__(),j)
+			# Update state
+			i = block[1]
+			j = block[2]
+			# Write new lines
+			sink.write(block[0])
+		return i
+
+	# Embeds data in the TJ operators of a template, writes the new QDF to a sink
+	#
+	# sink, ch_one, ch_two, ind, start: see embed_file()
+	#
+	# Returns the number of nums embedded
+	#
+	# NB: The template already knows where the TJ ops are, so the QDF
+	# file is not parsed, only patched
+	def embed_template(self,sink,ch_one,ch_two,ind,start):
+		i = 0
+		j = 0
+		values = []
+		for tj in self.template.values:
+			# Embed data in the TJ op
+			op = self.embed_next(tj,ch_one,ch_two,ind,i,start,self.tjs.__len__(),j)
+			# Update state
+			if op[0]:
+				i += 1
+			else:
+				j += 1
+			values.append(str(op[1]).encode("latin-1"))
+		# Write new QDF
+		self.template.write(sink,values)
+		return i
 
 	# Embeds data with passkey in a PDF file, outputs stego PDF file
 	#
+	# data: the data to embed, as bytes, str, a file opened in binary
+	#       mode, or an iterable of bytes
+	# sink: if set, the writable to write the new QDF to, instead of
+	#       producing the output file (then, fixing and compressing the
+	#       QDF is up to the caller)
+	#
 	# Returns the number of embedded numerals constituting the data
-	def embed(self,data,passkey,norandom=False):
+	def embed(self,data,passkey,norandom=False,sink=None):
+		self.phase("scan")
+		# Read the data once
+		#
+		# NB: The data is not kept in memory, see payload.py
+		data = payload.Payload(data,self.nbits,self.tmpdir,self.memory)
+		cover = None
+		try:
+			cover = self.open_shards()
+			return self.embed_payload(data,passkey,norandom,sink,cover)
+		finally:
+			data.close()
+			if cover != None:
+				cover.close()
+
+	# Splits the QDF file of the input file into shards, if worth it
+	#
+	# Returns a shard.Sharded_cover, or None to embed sequentially
+	def open_shards(self):
+		if self.workers <= 1 or self.template != None:
+			return None
+		if self.cache != None:
+			path = self.cache.get(self.input)
+			temp = False
+		else:
+			# NB: The workers need a file to map in memory
+			fd,path = tempfile.mkstemp(dir=self.tmpdir,suffix=".qdf")
+			os.close(fd)
+			temp = True
+			if driver.uncompress(self.input,path) not in (0,3):
+				# NB: QPDF returns 3 when it had to recover from warnings
+				driver.delete(path)
+				raise OSError("QPDF cannot uncompress \"" + self.input + "\"")
+		if not shard.worth_it(path,self.workers):
+			if temp:
+				driver.delete(path)
+			return None
+		self.l.info("Embedding in " + str(self.workers) + " worker processes")
+		return shard.Sharded_cover(path,self.workers,temp)
+
+	# Embeds a payload with passkey in a PDF file (see embed())
+	#
+	# cover: the shards of the QDF file of the input file, or None
+	def embed_payload(self,data,passkey,norandom,sink,cover):
 		# Initialize state
 		self.norandom = norandom
 		if self.customrange:
@@ -342,26 +646,58 @@ class PDF_stego:
 		self.tj_count = 0
 		self.tj_count_valid = 0
 		self.tjs = []
-		i = 0
-		j = 0
-		new_file = b""
 		# Get the numerals to embed from the key and the message
-		nums = encoding.encode_msg(data,passkey,self.nbits)
-		ind = nums[0] + nums[1] + nums[2]
-		# Initialize chaotic maps
-		if self.improve:
-			ch_one = random.Random(encoding.digest(data))
-			ch_two = random.Random(passkey)
+		#
+		# NB: The numerals of the message are generated as they are embedded
+		flagstr = encoding.encode_key(passkey.encode('utf-8'),self.nbits)
+		ind = payload.Numerals(data,flagstr)
+		# Check the capacity of the input file before rewriting it
+		#
+		# NB: Only the TJ values are read, nothing is written
+		self.l.info("Input file: \"" + self.input + "\"")
+		if cover == None:
+			values = self.read_values()
 		else:
-			ch_one = chaos.Chaotic(self.mu_one,nums[2])
-			ch_two = chaos.Chaotic(self.mu_two,nums[2])
+			values = cover.read_values()
+		slots = self.count_slots(values,self.nbits,self.redundancy,self.improve,self.customrange,passkey)
+		values = None
+		if slots < ind.__len__():
+			# Not enough space
+			# -> Fail
+			self.l.error("Not enough space available (only " + str(slots) + " available, " + str(ind.__len__()) + " needed)")
+			return -ind.__len__()
+		self.phase("rewrite")
+		# Initialize chaotic maps
+		ch_one = self.chaotic_one(data,passkey,flagstr)
+		ch_two = self.chaotic_two(passkey,self.nbits,self.improve)
 		# Open input file
 		#
 		# NB: Only works for valid PDF files
-		self.l.info("Input file: \"" + self.input + "\"")
-		driver.uncompress(self.input,self.input+".qdf")
-		cover_file = open(self.input + ".qdf","rb")
-		cover_file.seek(0,0)
+		self.debug_embed_check_tj()
+		# -> Check for a template or shards
+		if self.template != None or cover != None:
+			# Patch the QDF file of the template, or rewrite the shards
+			uncompressor = None
+			cover_file = None
+		elif self.cache == None:
+			# Uncompress the input file on the fly
+			uncompressor = driver.uncompress_pipe(self.input)
+			cover_file = uncompressor.stdout
+		else:
+			# Read the QDF file from the cache
+			uncompressor = None
+			cover_file = self.cache.open(self.input)
+		# Open output file
+		# -> Check for a custom sink
+		if sink == None:
+			# Fix the new QDF on the fly
+			#
+			# NB: QPDF needs to seek in the fixed QDF to compress it,
+			# so it goes to an anonymous temporary file
+			fixed_file = driver.spool(self.tmpdir,self.memory)
+			output_file = qdf.QDF_fixer(fixed_file)
+		else:
+			output_file = sink
 		# Determine start position
 		if 0:#self.improve: #TODO: fix
 			start = int(self.tjs.__len__() * ch_two.random())
@@ -369,58 +705,70 @@ class PDF_stego:
 		else:
 			start = 0
 		# Parse file
+		#
+		# NB: QPDF and this parser run concurrently
 		self.l.info("Embedding data, please wait...")
-		self.print_conf_embed(data,nums)
-		for line__ in cover_file:
-			line = line__.decode("latin-1")
-			line_ = line
-			# Parse line for TJ blocks
-			k = 0
-			while k < line_.__len__():
-				# Look for a TJ block, starting at current position
-				m = re.match(r'\[(.*?)\][ ]?TJ',line_[k:])
-				if m == None:
-					# No TJ blocks
-					# -> Look further
-					#
-					# TODO: check that
-					k += 1
-				else:
-					# A TJ block is found
-					# -> Try to embed data in TJ block
-					block = self.embed_line(m.group(1),ch_one,ch_two,ind,i,start,self.tjs.__len__(),j)
-					# Insert new block in the line
-					line_ = line_[:k + m.start(1)] + block[0] + line_[k + m.end(1):]
-					# Update state
-					i = block[1]
-					j = block[2]
-					# Update current position
-					k += m.start(1) + block[0].__len__()
-			# Encode new line
-			new_file += line_.encode("latin-1")
-		self.debug_embed_check_tj(cover_file)
-		# Close file and clean up
-		cover_file.close()
-		driver.delete(self.input+".qdf")
+		self.print_conf_embed(data,ind)
+		if cover != None:
+			i = cover.embed(self,output_file,ch_one,ch_two,ind)
+		elif cover_file == None:
+			i = self.embed_template(output_file,ch_one,ch_two,ind,start)
+		else:
+			i = self.embed_file(cover_file,output_file,ch_one,ch_two,ind,start)
+		# Close input
+		if uncompressor != None:
+			if driver.wait(uncompressor) not in (0,3):
+				# QPDF failed, the new QDF is incomplete
+				# -> Fail
+				if sink == None:
+					fixed_file.close()
+				raise OSError("QPDF cannot uncompress \"" + self.input + "\"")
+		elif cover_file != None:
+			cover_file.close()
+		if sink == None:
+			output_file.flush()
 		# Check if all data was embedded
 		if i < ind.__len__():
 			# All data was not embedded
 			# -> Fail
 			self.l.error("Not enough space available (only " + str(self.tj_count_valid) + " available, " + str(ind.__len__()) + " needed)")
+			if sink == None:
+				fixed_file.close()
 			return -ind.__len__()
 		# All data was embedded
 		self.l.info("Done embedding.")
+		# Check for a custom sink
+		if sink != None:
+			# The new QDF was written to the sink
+			# -> Nothing else to produce
+			return data.__len__()
+		# -> Check if the new QDF was fixed
+		if not output_file.ok:
+			# The QDF is not supported by the fixer
+			# -> Fix it with fix-qdf
+			self.l.info("Cannot fix the QDF file directly, using fix-qdf")
+			self.phase("fix")
+			damaged_file = fixed_file
+			fixed_file = driver.spool(self.tmpdir,self.memory)
+			code = driver.fix_file(damaged_file,fixed_file)
+			damaged_file.close()
+			if code not in (0,3):
+				# The new QDF is still damaged
+				# -> Fail
+				fixed_file.close()
+				raise OSError("fix-qdf cannot fix the QDF file of \"" + self.input + "\"")
 		# -> Produce output file
-		output_file = open(self.output+".raw","wb")
-		output_file.write(new_file)
-		output_file.close()
-		# Fix Compress Clean
-		driver.fcc(self.output+".raw",self.output)
+		self.phase("compress")
+		try:
+			code = driver.compress_file(fixed_file,self.output)
+		finally:
+			fixed_file.close()
+		if code not in (0,3):
+			raise OSError("QPDF cannot compress \"" + self.output + "\"")
 		self.debug_embed_print_sum()
-		driver.delete(self.output+".raw.fix")
 		# All finished
 		self.l.info("Output file: \"" + self.output + "\"")
-		return nums[1].__len__()
+		return data.__len__()
 
 	#
 	#
@@ -454,198 +802,257 @@ class PDF_stego:
 		# Extract data from TJ op
 		return abs(val)
 
-	# Extracts data from all operators in a TJ string
+	# Extracts data from TJ values
 	#
-	# line: the TJ string to parse
+	# values: the signed values of the TJ ops to parse (any iterable)
+	# ch_two: chaotic map 2
+	#
+	# Yields the values of the valid TJ ops, in order
+	#
+	# NB: Values are only read when needed, so the caller can stop early
+	def filter_values(self,values,ch_two):
+		# Check improvements flag
+		if self.improve:
+			# Using Python's randomness
+			# -> Eliminate zeros
+			#
+			# TODO: check that
+			stream = ch_two.nonzeros()
+		else:
+			# Improvements are disabled
+			stream = iter(ch_two)
+		# Go through the TJ ops, with the next number from the chaotic map
+		for (val,ch_two_next) in zip(values,stream):
+			# -> Try to extract numeral
+			tj = self.extract_op(val,ch_two_next)
+			# -> Check result
+			if tj != 0:
+				# A valid value was found
+				yield tj
+			# -> Keep parsing
+
+	# Extracts data from a list of TJ values
+	#
+	# values: the signed values of the TJ ops to parse
+	# ch_two: chaotic map 2
+	#
+	# Returns a list tjs[]
+	# tjs[n] is the value of the n-th valid TJ op
+	def extract_values(self,values,ch_two):
+		return list(self.filter_values(values,ch_two))
+
+	# Extracts data from all operators in a content line
+	#
+	# line: the content to parse (as bytes)
 	# ch_two: chaotic map 2
 	#
 	# Returns a list tjs[]
 	# tjs[n] is the value of the n-th valid TJ op
 	def extract_line(self,line,ch_two):
-		# Initialize list to return
-		tjs = []
-		# Go through the line
-		k = 0
-		while k < line.__len__():
-			# Look for a TJ op, starting at current position
-			m = re.search(r'[>)](\-?[0-9]+)[<(]',line[k:])
-			if m == None:
-				# No more TJ ops
-				# -> Break the loop
-				k = line.__len__()
-			else:
-				# A TJ op is found
-				# -> Check improvements flag
-				if self.improve:
-					# Using Python's randomness
-					# -> Eliminate zeros
-					#
-					# TODO: check that
-					ch_two_next = 0
-					while ch_two_next == 0:
-						ch_two_next = ch_two.random()
-				else:
-					# Improvements are disabled
-					ch_two_next = ch_two.next()
-				# Finished checking chaotic map
-				# -> Try to extract numeral
-				tj = self.extract_op(int(m.group(1)),ch_two_next)
-				# -> Check result
-				if tj != 0:
-					# A valid value was found
-					# -> Prepare to return value
-					tjs += [tj]
-				# Update current position
-				# -> Jump after the current TJ op
-				k += m.end(1)
-				# -> Keep parsing the line
-		return tjs
-
-	# Extracts data from PDF file using derived_key, outputs extracted data to
-	def extract(self,derived_key):
+		return self.extract_values(tokenizer.values(line),ch_two)
+
+	# Reads the values of all TJ ops of the input file
+	#
+	# Returns a list of signed values, in order
+	def read_values(self):
+		return list(self.iter_values())
+
+	# Yields the values of all TJ ops of the input file, in order
+	#
+	# NB: The input file is read as values are needed
+	def iter_values(self):
+		# Check for a template
+		if self.template != None:
+			# NB: The values are already known
+			yield from self.template.values
+			return
+		for content in self.read_content():
+			yield from tokenizer.values(content)
+
+	# Decodes data from the TJ values of the input file using derived_key
+	#
+	# values: the signed values of all TJ ops of the input file (any iterable)
+	# sink: if set, the writable to write the extracted data to
+	#
+	# Returns a list res[]
+	# If res[0] == None then no data was found, res[1] is the reason
+	# Otherwise, res[0] is the extracted data (as bytes), or the number
+	# of bytes written if sink is set
+	#
+	# NB: values is not modified, so it can be shared between keys,
+	# and it is not read further than the end of FlagStr
+	#
+	# NB: The numerals of the data are spooled as they are found, and
+	# decoded a block at a time (see payload.py), so memory usage does
+	# not depend on the size of the data; if sink is set, it gets the
+	# data even if it does not match CheckStr
+	def decode_values(self,values,derived_key,sink=None):
+		# Spool the numerals of the data
+		found = payload.Output(self.nbits,self.tmpdir,self.memory)
+		try:
+			return self.decode_numerals(values,derived_key,found,sink)
+		finally:
+			found.close()
+
+	# Decodes data from the TJ values of the input file (see decode_values())
+	#
+	# found: the spool of the numerals of the data
+	def decode_numerals(self,values,derived_key,found,sink):
 		# Initialize state
 		self.tj_count = 0
 		self.tj_count_valid = 0
-		tjs = []
 		# Get the numerals from the key
 		nums = encoding.encode_key(derived_key,self.nbits)
 		# Initiate chaotic map
-		if self.improve:
-			ch_two = random.Random(derived_key)
-		else:
-			ch_two = chaos.Chaotic(self.mu_two,nums)
-		# Open input file
-		#
-		# NB: Only works for valid PDF files
-		self.l.info("Input file: \"" + self.input + "\"")
-		driver.uncompress(self.input,self.input+".qdf")
-		embedding_file = open(self.input+".qdf",encoding="iso-8859-1")
+		ch_two = self.chaotic_two(derived_key,self.nbits,self.improve)
 		# Determine start position
 		if 0:#self.improve:#TODO: fix
-			# Parse file
-			for line in embedding_file:
-				# Parse line for TJ blocks
-				m = re.search(r'\[(.*)\][ ]?TJ',line)
-				if m != None:
-					tjs += self.get_tjs(m.group(1))
-			start = int(tjs.__len__() * ch_two.random())
-			embedding_file.seek(0,0)
-			tjs = []
+			start = int([val for val in values if (self.improve or abs(val) < 2**self.nbits + 1) and val != 0].__len__() * ch_two.random())
 		else:
 			start = 0
-		# Parse file
-		self.l.info("Extracting data, please wait...")
 		self.print_conf_extract(start,nums)
-		for line in embedding_file:
-			# Parse line for TJ blocks
-			# -> Look for a TJ block, starting at current position
-			m = re.search(r'\[(.*)\][ ]?TJ',line)
-			if m != None:
-				# A TJ block is found
-				# -> Try to extract data from TJ block
-				tjs += self.extract_line(line,ch_two)
-		# Close file and clean up
-		embedding_file.close()
-		driver.delete(self.input+".qdf")
-		# Extract data from TJ ops
+		# Look for FlagStr while filtering TJ ops with the chaotic map
 		normalrange = 1
 		# NB: Hack for custom range (do not shift by 1)
 		# TODO: do that better and include in docs
 		if self.customrange:
 			normalrange = 0
-		# Normalize values
-		#
-		# TODO: check if really necessary
-		tjs = list(map(lambda x: (x - normalrange) % (2**self.nbits), tjs))
-		# Wrap values around in order
-		# to move easily inside
-		#
-		# TODO: use modulo calculation instead
-		tjs_ = tjs + tjs
-		# Start extracting after CheckStr
-		#
-		# NB: CheckStr is 20 numerals long
-		k = start + 20
-		# Go through the list of numerals
-		c = 0
-		while c < tjs.__len__():
-			# Look for end position FlagStr
-			# at current position
+		flagstr = detector.FlagStr_detector(nums,start,found.write)
+		complete = False
+		for tj in self.filter_values(values,ch_two):
+			# Normalize value
 			#
-			# NB: FlagStr is 20 numerals long
-			if nums == tjs_[k:k+20]:
-				# End position is found, register it
-				end = k + 20 - 1
-				self.l.debug("End position found",end)
-				# NB: length = end - start + 1
-				# Extract CheckStr
-				checkstr = tjs_[start:start + 20]
-				# Extract data
-				embedded = tjs_[start + 20:k]
-				# Break the loop
-				c = tjs.__len__()
-			# FlagStr not found
-			# -> Look further
-			c += 1
-			k += 1
+			# TODO: check if really necessary
+			if flagstr.feed((tj - normalrange) % (2**self.nbits)):
+				# FlagStr is found
+				# -> Stop parsing
+				complete = True
+				break
 		# Check is FlagStr was found
-		#
-		# TODO: check that
-		if c != tjs.__len__() + 1:
-			# FlagStr not found
+		if not complete and not flagstr.finish():
+			# FlagStr not found, even wrapping values around
 			# -> Fail
-			self.l.error("Ending code FlagStr not found")
-			return -1
+			return [None,"Ending code FlagStr not found"]
+		self.l.debug("End position found",flagstr.end + nums.__len__() - 1)
+		# Extract CheckStr
+		checkstr = flagstr.checkstr()
 		# FlagStr was found
 		# -> Decode embedded data
 		self.l.info("Done extracting.")
 		self.l.info("Decoding data, please wait...")
-		# Go through the list of numerals
-		# containing the data
-		k = 0
-		bin_str = ""
-		while k < embedded.__len__():
-			# Decode the next numeral into a binary string
-			bin = encoding.num_to_binstr(embedded[k],self.nbits)
-			# Check if it was the last numeral
-			if k == embedded.__len__() - 1:
-				# Processing the last numeral
-				# -> Only take the bits needed
-				bin_str += bin[bin.__len__() - self.nbits:]
-			else:
-				# Not processing the last numeral
-				# -> Take all bits
-				bin_str += bin
-			# -> Keep decoding
-			k += 1
-		# Decode the full binary string into bytes
-		emb_chars = encoding.decode(bin_str)
-		emb_str = b""
-		for ch in emb_chars:
-			emb_str += ch
-		self.debug_extract_print_sum(encoding.encode_key(emb_str,self.nbits),bin_str,checkstr,embedded,emb_str)
+		# Decode the numerals containing the data into bytes
+		if sink == None:
+			output_file = io.BytesIO()
+		else:
+			output_file = sink
+		(size,digest) = found.decode(output_file)
+		self.debug_extract_print_sum(checkstr,found,digest)
 		# Check integrity
-		if encoding.digest_to_nums(emb_str, self.nbits) != checkstr:
+		if encoding.hexdigest_to_nums(digest,self.nbits) != checkstr:
 			# Data coes not match embedded checksum
 			# -> Fail
-			self.l.error("CheckStr does not match embedded data")
-			return -1
+			return [None,"CheckStr does not match embedded data"]
 		# Data matches checksum
 		self.l.info("Done decoding.")
-		# -> Produce output file
-		output_file = open(self.output,"wb")
-		output_file.write(emb_str)
-		output_file.close()
+		if sink == None:
+			return [output_file.getvalue(),None]
+		return [size,None]
+
+	# Extracts data from PDF file using derived_key, outputs extracted data to output file
+	#
+	# values: the values of all TJ ops, if already read (a generator), defaults to reading the input file
+	#
+	# Returns 0 if data was extracted, -1 otherwise
+	def extract(self,derived_key,values=None):
+		# Open input file
+		#
+		# NB: Only works for valid PDF files
+		self.l.info("Input file: \"" + self.input + "\"")
+		# Parse file
+		self.l.info("Extracting data, please wait...")
+		self.phase("scan")
+		if values == None:
+			values = self.iter_values()
+		# Write the data as it is decoded
+		#
+		# NB: The output file is only produced if the data is valid
+		(output_file,temp) = driver.open_atomic(self.output)
+		res = [None,None]
+		try:
+			res = self.decode_values(values,derived_key,output_file)
+		finally:
+			# Stop reading the input file
+			values.close()
+			driver.close_atomic(output_file,temp,self.output,res[0] != None)
+		# Check result
+		if res[0] == None:
+			# No data
+			# -> Fail
+			self.l.error(res[1])
+			return -1
 		# All finished
 		self.l.info("Output file: \"" + self.output + "\"")
 		return 0
 
+	# Extracts data from PDF file trying several keys, outputs data extracted with the first valid key to output file
+	#
+	# keys: the list of candidate keys
+	#
+	# Returns a list res[]
+	# If res[n] == None then keys[n] is not valid
+	# Otherwise, res[n] is the data extracted with keys[n] (as bytes)
+	#
+	# NB: The input file is parsed only once, for all keys
+	def extract_keys(self,keys):
+		# Open input file
+		self.l.info("Input file: \"" + self.input + "\"")
+		# Parse file
+		self.l.info("Extracting data with " + str(keys.__len__()) + " keys, please wait...")
+		values = self.read_values()
+		res = []
+		for n in range(keys.__len__()):
+			# Try the next key
+			key_res = self.decode_values(values,keys[n])
+			if key_res[0] == None:
+				self.l.info("Key #" + str(n + 1) + " is not valid",key_res[1])
+			else:
+				self.l.info("Key #" + str(n + 1) + " is valid")
+			res += [key_res[0]]
+		# -> Produce output file
+		for emb_str in res:
+			if emb_str != None:
+				self.write_output(emb_str)
+				break
+		return res
+
+	# Writes extracted data to output file
+	def write_output(self,emb_str):
+		(output_file,temp) = driver.open_atomic(self.output)
+		committed = False
+		try:
+			output_file.write(emb_str)
+			committed = True
+		finally:
+			driver.close_atomic(output_file,temp,self.output,committed)
+		# All finished
+		self.l.info("Output file: \"" + self.output + "\"")
+
 	#
 	#
 	#
 	# DEBUG CHECKS
 	#
 
+	#
+	# Timing tools for benchmarks
+
+	# Marks the start of a phase of the algo (see bench/)
+	#
+	# NB: The phases are "scan", "rewrite", "fix" and "compress"
+	def phase(self,name):
+		if self.timer != None:
+			self.timer(name)
+
 	#
 	# Printing tools for debug
 
@@ -658,14 +1065,17 @@ class PDF_stego:
 					  "improvements":self.improve
 					  })
 
-	def print_conf_embed(self,data,nums):
+	def print_conf_embed(self,data,ind):
+		if not self.l.DEBUG:
+			return
 		self.print_conf()
+		# NB: The data itself is not in memory
 		self.l.debugs({
-					  "Data to embed":data,
-					  "Data to embed (binary)":encoding.str_to_binstr(data,self.nbits),
-					  "FlagStr1 (CheckStr)":nums[0],
-					  "FlagStr2":nums[2],
-					  "Data":encoding.msg_to_nums(data,self.nbits)
+					  "Data to embed (size)":data.size,
+					  "Data to embed (SHA-1)":data.digest(),
+					  "FlagStr1 (CheckStr)":ind.checkstr,
+					  "FlagStr2":ind.flagstr,
+					  "Data (numerals)":data.__len__()
 					  })
 		self.l.debug("===== END CONFIG =====")
 
@@ -677,19 +1087,14 @@ class PDF_stego:
 					  })
 		self.l.debug("===== END CONFIG =====")
 
-	def debug_embed_check_tj(self,cover_file):
+	def debug_embed_check_tj(self):
 		if self.l.DEBUG:#TODO: do that better
 			self.tjss_ = []
-			cover_file.seek(0,0)
 			tjss = []
 			# Parse file
-			for line__ in cover_file:
-				line = line__.decode("latin-1")
-				# Parse line for TJ blocks
-				m = re.search(r'\[(.*)\][ ]?TJ',line)
-				if m != None:
-					self.tjs += self.get_tjs(m.group(1))
-					tjss += self.get_tjs_signed(m.group(1))
+			for content in self.read_content():
+				self.tjs += self.get_tjs(content)
+				tjss += self.get_tjs_signed(content)
 			self.tjss_ = tjss
 			#if self.improve:
 			#	self.l.debug(self.print_it("TJ values before",tjss))
@@ -699,16 +1104,11 @@ class PDF_stego:
 
 	def debug_embed_print_sum(self):
 		if self.l.DEBUG:#TODO: do that better
-			embd_file = open(self.output+".raw.fix",encoding="iso-8859-1")
 			tjss = []
 			# Parse file
-			for line in embd_file:
-				# Parse line for TJ blocks
-				m = re.search(r'\[(.*)\][ ]?TJ',line)
-				if m != None:
-					self.tjs += self.get_tjs(m.group(1))
-					tjss += self.get_tjs_signed(m.group(1))
-			embd_file.close()
+			for content in self.read_content(self.output):
+				self.tjs += self.get_tjs(content)
+				tjss += self.get_tjs_signed(content)
 			#if 0:#self.improve:
 			#	self.print_debug("TJ values after",tjss)
 			#	self.print_debug("Low-bits TJ values after",map(lambda x: abs(x) % (2**self.nbits),tjss))
@@ -727,12 +1127,14 @@ class PDF_stego:
 				self.l.debug("Total nb of TJ ops used",ind.__len__())
 				self.l.debug("Total nb of TJ ops used for data",nums[1].__len__())
 
-	def debug_extract_print_sum(self,checksum,bin_str,checkstr,embedded,emb_str):
-		self.l.debug("Raw binary data",bin_str)
-		self.l.debug("Raw data",embedded)
+	def debug_extract_print_sum(self,checkstr,embedded,digest):
+		if not self.l.DEBUG:
+			return
+		# NB: The data itself is not in memory
+		checksum = encoding.hexdigest_to_nums(digest,self.nbits)
 		self.l.debug("Data Checksum",checksum)
 		self.l.debug("CheckStr",checkstr)
-		self.l.debug("Extracted data","\"" + str(emb_str) + "\"")
+		self.l.debug("Extracted data (SHA-1)",digest)
 		self.l.debug("Total nb of TJ ops",self.tj_count)
 		self.l.debug("Total nb of valid TJ ops",self.tj_count_valid)
 		self.l.debug("Total nb of valid TJ ops used",embedded.__len__() + 40)
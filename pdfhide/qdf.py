@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+import re
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# qdf.py
+__version__ = "0.0"
+#
+# This is a QDF fixer for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module repairs QDF files on the fly, like the fix-qdf utility.
+#
+# When the algo changes the width of TJ values, the '/Length' of content
+# streams and the offsets of the cross-reference table are not valid
+# anymore. A QDF_fixer is a writable that sits between the algo and the
+# output file: it keeps track of the offset of every object and of the
+# number of bytes of every stream as they are written, then it writes
+# the right values in length objects, the cross-reference table, and the
+# trailer. The document is never read again.
+#
+# Only plain QDF files are supported, i.e. the ones QPDF generates when
+# there are no object streams. Otherwise, the fixer passes data through
+# unchanged, and sets its 'ok' flag to False: the file should then be
+# fixed with fix-qdf.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# States of the fixer
+TOP = 0
+IN_OBJ = 1
+IN_STREAM = 2
+AFTER_STREAM = 3
+IN_LENGTH = 4
+AT_XREF = 5
+BEFORE_TRAILER = 6
+IN_TRAILER = 7
+DONE = 8
+PASS = 9
+
+# Lines of interest
+RE_OBJ = re.compile(rb'^([0-9]+) 0 obj\n$')
+RE_STREAM = re.compile(rb'^.*\bstream\n$')
+RE_NUM = re.compile(rb'^[0-9]+\n$')
+RE_SIZE = re.compile(rb'^([ ]*/Size )[0-9]+\n$')
+RE_UNSUPPORTED = re.compile(rb'/Type /(?:ObjStm|XRef)\b')
+
+LINE_XREF = b"xref\n"
+LINE_ENDOBJ = b"endobj\n"
+LINE_ENDSTREAM = b"endstream\n"
+LINE_IGNORE_NEWLINE = b"%QDF: ignore_newline\n"
+LINE_TRAILER = b"trailer <<\n"
+LINE_TRAILER_END = b">>\n"
+
+# The end of a stream, after the stream data
+END_MARKER = b"\n" + LINE_ENDSTREAM
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class QDF_fixer:
+
+	# Sets the output at creation time
+	#
+	# sink: the writable to write the fixed QDF to
+	def __init__(self,sink):
+		self.sink = sink
+		# False if the QDF could not be fixed
+		self.ok = True
+		# Number of bytes written
+		self.offset = 0
+		# Data not processed yet (an incomplete line)
+		self.pending = b""
+		# True if the last byte written is a newline
+		self.newline = True
+		self.state = TOP
+		# Offsets of objects, in order
+		self.xref = []
+		self.xref_offset = 0
+		self.stream_length = 0
+
+	#
+	#
+	#
+	# WRITING
+	#
+
+	# Writes data from the QDF file
+	#
+	# NB: data can be split anywhere, it does not need to be made of lines,
+	# and it can be any buffer (e.g. a memoryview)
+	def write(self,data):
+		if not isinstance(data,bytes):
+			data = bytes(data)
+		if self.pending.__len__() > 0:
+			data = self.pending + data
+			self.pending = b""
+		pos = 0
+		end = data.__len__()
+		while pos < end:
+			if self.state == PASS:
+				self.emit(data[pos:])
+				return
+			if self.state == IN_STREAM:
+				pos = self.write_stream(data,pos)
+				if pos == None:
+					return
+				continue
+			# Process the next line
+			eol = data.find(b"\n",pos)
+			if eol < 0:
+				# Incomplete line
+				# -> Wait for more data
+				self.pending = bytes(data[pos:])
+				return
+			self.write_line(bytes(data[pos:eol + 1]))
+			pos = eol + 1
+
+	# Writes remaining data
+	def flush(self):
+		if self.pending.__len__() > 0:
+			if self.state != DONE:
+				self.emit(self.pending)
+			self.pending = b""
+		if self.state not in (DONE,PASS):
+			# The end of the QDF file was not found
+			self.ok = False
+		self.sink.flush()
+
+	# Writes data to the output
+	def emit(self,data):
+		if data.__len__() > 0:
+			self.sink.write(data)
+			self.offset += data.__len__()
+			self.newline = (data[-1] == 0x0a)
+
+	#
+	#
+	#
+	# PARSING
+	#
+
+	# Writes stream data, up to the end of the stream
+	#
+	# Returns the position after the stream data, or None if more data is needed
+	def write_stream(self,data,pos):
+		# Look for the end of the stream
+		if self.newline and data[pos:pos + LINE_ENDSTREAM.__len__()] == LINE_ENDSTREAM:
+			end = pos
+		else:
+			end = data.find(END_MARKER,pos)
+			if end >= 0:
+				end += 1
+		if end < 0:
+			# End of the stream not found
+			# -> Keep the last line if it may be its beginning
+			nl = data.rfind(b"\n",pos)
+			if nl >= 0:
+				cut = nl + 1
+			elif self.newline:
+				cut = pos
+			else:
+				cut = data.__len__()
+			tail = data[cut:]
+			if tail.__len__() > 0 and LINE_ENDSTREAM.startswith(tail):
+				self.emit(data[pos:cut])
+				self.pending = bytes(tail)
+			else:
+				self.emit(data[pos:])
+			return None
+		self.emit(data[pos:end])
+		self.stream_length = self.offset - self.stream_start
+		self.state = AFTER_STREAM
+		self.emit(LINE_ENDSTREAM)
+		return end + LINE_ENDSTREAM.__len__()
+
+	# Writes one line, outside of stream data
+	def write_line(self,line):
+		if self.state == TOP:
+			m = RE_OBJ.match(line)
+			if m != None:
+				self.add_obj(int(m.group(1)))
+				self.state = IN_OBJ
+			elif line == LINE_XREF:
+				self.xref_offset = self.offset
+				self.state = AT_XREF
+		elif self.state == IN_OBJ:
+			if RE_STREAM.match(line) != None:
+				self.emit(line)
+				self.stream_start = self.offset
+				self.state = IN_STREAM
+				return
+			if line == LINE_ENDOBJ:
+				self.state = TOP
+			elif RE_UNSUPPORTED.search(line) != None:
+				# Object streams are not supported
+				self.fail()
+		elif self.state == AFTER_STREAM:
+			if line == LINE_IGNORE_NEWLINE:
+				# NB: QPDF added a newline that is not part of the stream
+				if self.stream_length > 0:
+					self.stream_length -= 1
+			else:
+				m = RE_OBJ.match(line)
+				if m != None:
+					# The stream length comes right after the stream
+					self.add_obj(int(m.group(1)))
+					self.state = IN_LENGTH
+		elif self.state == IN_LENGTH:
+			if RE_NUM.match(line) == None:
+				# Not a length object
+				self.fail()
+			else:
+				line = str(self.stream_length).encode("latin-1") + b"\n"
+				self.state = IN_OBJ
+		elif self.state == AT_XREF:
+			# Write the new table instead of the old one
+			self.emit(("0 " + str(1 + self.xref.__len__()) + "\n0000000000 65535 f \n").encode("latin-1"))
+			self.emit(b"".join([b"%010d 00000 n \n" % offset for offset in self.xref]))
+			self.state = BEFORE_TRAILER
+			return
+		elif self.state == BEFORE_TRAILER:
+			if line != LINE_TRAILER:
+				# Skip the old table
+				return
+			self.state = IN_TRAILER
+		elif self.state == IN_TRAILER:
+			m = RE_SIZE.match(line)
+			if m != None:
+				line = m.group(1) + str(1 + self.xref.__len__()).encode("latin-1") + b"\n"
+			elif line == LINE_TRAILER_END:
+				self.emit(line)
+				self.emit(("startxref\n" + str(self.xref_offset) + "\n%%EOF\n").encode("latin-1"))
+				self.state = DONE
+				return
+		elif self.state == DONE:
+			# Skip the old end of file
+			return
+		self.emit(line)
+
+	# Registers the offset of an object
+	def add_obj(self,num):
+		if num != self.xref.__len__() + 1:
+			# Objects are not in order
+			self.fail()
+		else:
+			self.xref.append(self.offset)
+
+	# Gives up on fixing the QDF
+	def fail(self):
+		self.ok = False
+		self.state = PASS
@@ -0,0 +1,600 @@
+#!/usr/bin/python3
+import re
+import mmap
+import zlib
+import collections
+
+from pdfhide import tokenizer
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# reader.py
+__version__ = "0.0"
+#
+# This is a simple in-process reader for PDF content streams for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module reads the page content streams of a PDF file without QPDF.
+#
+# It follows the cross-reference table (or stream) of the file to load
+# only the objects it needs: the page tree, and the content streams of
+# each page, which are inflated in memory. Images and fonts are never
+# read. The content streams are returned in page order, which is also
+# the order in which they appear in the QDF file generated by QPDF.
+#
+# Only a common subset of PDF is supported: no encryption, and only
+# FlateDecode (or no filter) for content streams. Anything else raises
+# a ReaderError, and callers should then fall back to QPDF, which is
+# also able to repair broken files.
+#
+# NB: QPDF normalizes line endings of content streams in QDF mode, so
+# this module does the same.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# PDF whitespace and delimiters
+WS = b"\x00\t\n\x0c\r "
+DELIMS = b"()<>[]{}/%"
+
+# A token, after whitespace and comments
+# -> group 1: delimiter
+# -> group 2: name
+# -> group 3: number
+# -> group 4: keyword
+TOKEN = re.compile(rb'(?:[\x00\t\n\x0c\r ]|%[^\r\n]*)*(?:(<<|>>|[\[\]{}(<])|/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)|([+\-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])|([^\x00\t\n\x0c\r ()<>\[\]{}/%]+))')
+
+# An indirect reference, e.g. "12 0 R"
+REF = re.compile(rb'([0-9]+)[\x00\t\n\x0c\r ]+([0-9]+)[\x00\t\n\x0c\r ]+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+
+# An indirect object header, e.g. "12 0 obj"
+OBJ = re.compile(rb'[\x00\t\n\x0c\r ]*([0-9]+)[\x00\t\n\x0c\r ]+([0-9]+)[\x00\t\n\x0c\r ]+obj')
+
+# The beginning of stream data
+STREAM = re.compile(rb'[\x00\t\n\x0c\r ]*stream(?:\r\n|\n|\r)')
+
+# The end of stream data
+ENDSTREAM = re.compile(rb'[\x00\t\n\x0c\r ]*endstream')
+
+# An entry in a cross-reference table subsection header, or an entry
+XREF_SUB = re.compile(rb'[\x00\t\n\x0c\r ]*([0-9]+) ([0-9]+)[ ]*(?:\r\n|\n|\r)')
+XREF_ENTRY = re.compile(rb'([0-9]{10}) ([0-9]{5}) ([nf])')
+
+# Maximum distance from the end of the file to look for "startxref"
+TAIL = 2048
+
+# An indirect reference
+Ref = collections.namedtuple("Ref",["num","gen"])
+
+# A stream object
+#
+# dict: the stream dictionary
+# start: the position of the first byte of the raw data in the file
+# length: the number of bytes of the raw data
+Stream = collections.namedtuple("Stream",["dict","start","length"])
+
+#
+#
+#
+# ERRORS
+#
+
+# The file cannot be read without QPDF
+class ReaderError(Exception):
+	pass
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Returns the list of the inflated page content streams of a PDF file
+#
+# input: the path of the PDF file, or the PDF file itself as a buffer
+def contents(input):
+	if isinstance(input,str):
+		with open(input,"rb") as input_file:
+			try:
+				buf = mmap.mmap(input_file.fileno(),0,access=mmap.ACCESS_READ)
+			except ValueError:
+				# Empty file
+				raise ReaderError("empty file")
+			try:
+				return read(buf)
+			finally:
+				buf.close()
+	if not isinstance(input,(bytes,bytearray)):
+		input = bytes(input)
+	return read(input)
+
+#
+#
+# INTERNALS
+#
+#
+
+# Returns the list of the inflated page content streams of a PDF buffer
+#
+# NB: Malformed values that slipped past the checks below must not crash
+# callers, which only expect a ReaderError (and then fall back to QPDF)
+def read(buf):
+	try:
+		return PDF_reader(buf).contents()
+	except (TypeError,ValueError,IndexError,KeyError,AttributeError,OverflowError,MemoryError,RecursionError) as e:
+		raise ReaderError("malformed file: " + type(e).__name__ + ": " + str(e))
+
+# Returns True if a parsed object is an integer
+#
+# NB: Booleans are ints in Python
+def is_int(obj):
+	return isinstance(obj,int) and not isinstance(obj,bool)
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class PDF_reader:
+
+	def __init__(self,buf):
+		self.buf = buf
+		self.xref = {}
+		self.objects = {}
+		self.checked = set()
+		self.trailer = self.read_xref()
+		if "Encrypt" in self.trailer:
+			raise ReaderError("encrypted file")
+
+	#
+	#
+	#
+	# PAGES
+	#
+
+	# Returns the list of the inflated page content streams, in page order
+	def contents(self):
+		res = []
+		seen = set()
+		root = self.resolve(self.trailer.get("Root"))
+		if not isinstance(root,dict):
+			raise ReaderError("no document catalog")
+		for page in self.pages(root.get("Pages")):
+			# Check that nothing else on the page may hold TJ ops
+			self.check_page(page)
+			# Get content streams
+			refs = self.resolve(page.get("Contents"))
+			if refs == None:
+				continue
+			if not isinstance(refs,list):
+				refs = [page.get("Contents")]
+			for ref in refs:
+				# NB: QPDF writes shared streams only once
+				if ref in seen:
+					continue
+				seen.add(ref)
+				content = self.decode(self.resolve(ref))
+				if b"\r" in content:
+					content = content.replace(b"\r\n",b"\n").replace(b"\r",b"\n")
+				res.append(content)
+		return res
+
+	# Yields the page objects of a page tree, in order
+	def pages(self,ref):
+		stack = [(ref,{})]
+		seen = set()
+		while stack.__len__() > 0:
+			(ref,inherited) = stack.pop()
+			if isinstance(ref,Ref):
+				if ref in seen:
+					raise ReaderError("loop in page tree")
+				seen.add(ref)
+			node = self.resolve(ref)
+			if not isinstance(node,dict):
+				raise ReaderError("bad page tree")
+			if "Resources" in node:
+				inherited = {"Resources":node["Resources"]}
+			kids = self.resolve(node.get("Kids"))
+			if kids == None:
+				page = dict(inherited)
+				page.update(node)
+				yield page
+			else:
+				for kid in reversed(kids):
+					stack.append((kid,inherited))
+
+	# Makes sure that a page does not draw text outside its content streams
+	#
+	# NB: Form XObjects and annotation appearances are content streams
+	# too, and they are left in QDF files wherever QPDF sees fit, so any
+	# TJ block in them defeats the purpose of this reader
+	def check_page(self,page):
+		streams = []
+		resources = self.resolve(page.get("Resources"))
+		if isinstance(resources,dict):
+			xobjects = self.resolve(resources.get("XObject"))
+			if isinstance(xobjects,dict):
+				streams += list(xobjects.values())
+		annots = self.resolve(page.get("Annots"))
+		if isinstance(annots,list):
+			for annot in annots:
+				annot = self.resolve(annot)
+				if isinstance(annot,dict):
+					ap = self.resolve(annot.get("AP"))
+					if isinstance(ap,dict):
+						for appearance in ap.values():
+							appearance = self.resolve(appearance)
+							if isinstance(appearance,dict):
+								streams += list(appearance.values())
+							else:
+								streams += [appearance]
+		for ref in streams:
+			# NB: Resources are often shared between pages
+			if isinstance(ref,Ref):
+				if ref in self.checked:
+					continue
+				self.checked.add(ref)
+			stream = self.resolve(ref)
+			if isinstance(stream,Stream) and stream.dict.get("Subtype") != "Image":
+				if next(tokenizer.ops(self.decode(stream)),None) != None:
+					raise ReaderError("TJ operators outside of page contents")
+
+	#
+	#
+	#
+	# STREAMS
+	#
+
+	# Returns the decoded data of a stream
+	def decode(self,stream):
+		if not isinstance(stream,Stream):
+			raise ReaderError("bad stream")
+		data = self.buf[stream.start:stream.start + stream.length]
+		filters = self.resolve(stream.dict.get("Filter"))
+		params = self.resolve(stream.dict.get("DecodeParms"))
+		if filters == None:
+			return bytes(data)
+		if not isinstance(filters,list):
+			filters = [filters]
+			params = [params]
+		if not isinstance(params,list):
+			params = [params] * filters.__len__()
+		for (f,p) in zip(filters,params):
+			if f == "FlateDecode" or f == "Fl":
+				try:
+					data = zlib.decompressobj().decompress(data)
+				except zlib.error as e:
+					raise ReaderError("bad compressed data: " + str(e))
+				data = self.unpredict(data,self.resolve(p))
+			else:
+				raise ReaderError("unsupported filter: " + str(f))
+		return data
+
+	# Reverses the PNG predictors used with FlateDecode
+	def unpredict(self,data,params):
+		if not isinstance(params,dict):
+			return data
+		predictor = self.integer(params.get("Predictor",1),"bad predictor")
+		if predictor == 1:
+			return data
+		if predictor < 10 or self.resolve(params.get("Colors",1)) != 1 or self.resolve(params.get("BitsPerComponent",8)) != 8:
+			raise ReaderError("unsupported predictor")
+		columns = self.integer(params.get("Columns",1),"bad predictor")
+		if columns < 1 or columns > data.__len__():
+			raise ReaderError("bad predictor")
+		res = bytearray()
+		prev = bytearray(columns)
+		for k in range(0,data.__len__() - columns,columns + 1):
+			kind = data[k]
+			row = bytearray(data[k + 1:k + 1 + columns])
+			if kind == 1:
+				for c in range(1,columns):
+					row[c] = (row[c] + row[c - 1]) & 0xff
+			elif kind == 2:
+				for c in range(columns):
+					row[c] = (row[c] + prev[c]) & 0xff
+			elif kind == 3:
+				for c in range(columns):
+					left = row[c - 1] if c > 0 else 0
+					row[c] = (row[c] + ((left + prev[c]) >> 1)) & 0xff
+			elif kind == 4:
+				for c in range(columns):
+					a = row[c - 1] if c > 0 else 0
+					b = prev[c]
+					d = prev[c - 1] if c > 0 else 0
+					p = a + b - d
+					(pa,pb,pd) = (abs(p - a),abs(p - b),abs(p - d))
+					if pa <= pb and pa <= pd:
+						row[c] = (row[c] + a) & 0xff
+					elif pb <= pd:
+						row[c] = (row[c] + b) & 0xff
+					else:
+						row[c] = (row[c] + d) & 0xff
+			elif kind != 0:
+				raise ReaderError("bad predictor")
+			res += row
+			prev = row
+		return bytes(res)
+
+	#
+	#
+	#
+	# OBJECTS
+	#
+
+	# Returns the object pointed to by a reference, or the object itself
+	def resolve(self,obj):
+		while isinstance(obj,Ref):
+			obj = self.get(obj.num)
+		return obj
+
+	# Returns an integer object, resolving it first
+	#
+	# msg: the message of the ReaderError to raise if it is not an integer
+	def integer(self,obj,msg):
+		obj = self.resolve(obj)
+		if not is_int(obj):
+			raise ReaderError(msg)
+		return obj
+
+	# Returns an indirect object
+	def get(self,num):
+		if num in self.objects:
+			return self.objects[num]
+		entry = self.xref.get(num)
+		if entry == None:
+			# NB: Missing objects are null objects
+			return None
+		# Prevent reference loops
+		self.objects[num] = None
+		if entry[0] == 1:
+			obj = self.parse_indirect(num,entry[1])
+		else:
+			obj = self.parse_compressed(num,entry[1],entry[2])
+		self.objects[num] = obj
+		return obj
+
+	# Parses an indirect object at an offset in the file
+	def parse_indirect(self,num,offset):
+		m = OBJ.match(self.buf,offset)
+		if m == None or int(m.group(1)) != num:
+			raise ReaderError("bad cross-reference table")
+		(obj,pos) = self.parse(self.buf,m.end())
+		if isinstance(obj,dict):
+			m = STREAM.match(self.buf,pos)
+			if m != None:
+				length = self.resolve(obj.get("Length"))
+				if not isinstance(length,int) or m.end() + length > self.buf.__len__():
+					raise ReaderError("bad stream length")
+				# NB: QPDF is able to recover from wrong stream lengths
+				if ENDSTREAM.match(self.buf,m.end() + length) == None:
+					raise ReaderError("bad stream length")
+				return Stream(obj,m.end(),length)
+		return obj
+
+	# Parses an object from an object stream
+	def parse_compressed(self,num,stmnum,index):
+		stm = self.get(stmnum)
+		if not isinstance(stm,Stream):
+			raise ReaderError("bad object stream")
+		data = self.decode(stm)
+		pos = 0
+		header = []
+		for k in range(2 * self.integer(stm.dict.get("N",0),"bad object stream")):
+			(val,pos) = self.parse(data,pos)
+			if not isinstance(val,int):
+				raise ReaderError("bad object stream")
+			header.append(val)
+		if index * 2 + 1 >= header.__len__() or header[index * 2] != num:
+			raise ReaderError("bad object stream")
+		pos = self.integer(stm.dict.get("First",0),"bad object stream") + header[index * 2 + 1]
+		if pos < 0 or pos >= data.__len__():
+			raise ReaderError("bad object stream")
+		(obj,pos) = self.parse(data,pos)
+		return obj
+
+	# Parses a direct object
+	#
+	# Returns a list res[]
+	# res[0] is the object
+	# res[1] is the position after the object
+	def parse(self,buf,pos):
+		m = TOKEN.match(buf,pos)
+		if m == None:
+			raise ReaderError("unexpected end of data")
+		pos = m.end()
+		if m.group(1) != None:
+			delim = m.group(1)
+			if delim == b"<<":
+				res = {}
+				while True:
+					m = TOKEN.match(buf,pos)
+					if m == None:
+						raise ReaderError("unexpected end of data")
+					if m.group(1) == b">>":
+						return [res,m.end()]
+					if m.group(2) == None:
+						raise ReaderError("bad dictionary key")
+					(val,pos) = self.parse(buf,m.end())
+					res[m.group(2).decode("latin-1")] = val
+			if delim == b"[":
+				res = []
+				while True:
+					m = TOKEN.match(buf,pos)
+					if m == None:
+						raise ReaderError("unexpected end of data")
+					if m.group(1) == b"]":
+						return [res,m.end()]
+					(val,pos) = self.parse(buf,pos)
+					res.append(val)
+			if delim == b"(":
+				return self.parse_string(buf,pos)
+			if delim == b"<":
+				end = buf.find(b">",pos)
+				if end < 0:
+					raise ReaderError("unexpected end of data")
+				return [bytes(buf[pos:end]),end + 1]
+			raise ReaderError("unexpected delimiter")
+		if m.group(2) != None:
+			return [m.group(2).decode("latin-1"),pos]
+		if m.group(3) != None:
+			num = m.group(3)
+			if b"." in num:
+				return [float(num),pos]
+			r = REF.match(buf,m.start(3))
+			if r != None:
+				return [Ref(int(r.group(1)),int(r.group(2))),r.end()]
+			return [int(num),pos]
+		keyword = m.group(4)
+		if keyword == b"true":
+			return [True,pos]
+		if keyword == b"false":
+			return [False,pos]
+		if keyword == b"null":
+			return [None,pos]
+		raise ReaderError("unexpected keyword")
+
+	# Parses a literal string, after its opening parenthesis
+	#
+	# NB: The content of strings does not matter here, so escape
+	# sequences are only skipped
+	def parse_string(self,buf,pos):
+		depth = 1
+		start = pos
+		end = buf.__len__()
+		while pos < end:
+			ch = buf[pos]
+			if ch == 0x5c:
+				pos += 1
+			elif ch == 0x28:
+				depth += 1
+			elif ch == 0x29:
+				depth -= 1
+				if depth == 0:
+					return [bytes(buf[start:pos]),pos + 1]
+			pos += 1
+		raise ReaderError("unexpected end of data")
+
+	#
+	#
+	#
+	# CROSS-REFERENCE
+	#
+
+	# Reads all cross-reference sections, newest first
+	#
+	# Returns the trailer dictionary of the newest section
+	def read_xref(self):
+		tail = self.buf.rfind(b"startxref",max(0,self.buf.__len__() - TAIL))
+		if tail < 0:
+			raise ReaderError("startxref not found")
+		m = TOKEN.match(self.buf,tail + 9)
+		if m == None or m.group(3) == None:
+			raise ReaderError("bad startxref")
+		offset = int(m.group(3))
+		trailer = None
+		seen = set()
+		while offset != None:
+			if not is_int(offset) or offset in seen or offset < 0 or offset >= self.buf.__len__():
+				raise ReaderError("bad cross-reference offset")
+			seen.add(offset)
+			if self.buf[offset:offset + 4] == b"xref":
+				section = self.read_xref_table(offset + 4)
+				# NB: Hybrid files have another section in a stream
+				if is_int(section.get("XRefStm")):
+					self.read_xref_stream(section["XRefStm"])
+			else:
+				section = self.read_xref_stream(offset)
+			if trailer == None:
+				trailer = section
+			offset = section.get("Prev")
+		return trailer
+
+	# Reads a cross-reference table and its trailer
+	def read_xref_table(self,pos):
+		while True:
+			m = XREF_SUB.match(self.buf,pos)
+			if m == None:
+				break
+			first = int(m.group(1))
+			count = int(m.group(2))
+			pos = m.end()
+			for k in range(count):
+				e = XREF_ENTRY.match(self.buf,pos)
+				if e == None:
+					raise ReaderError("bad cross-reference entry")
+				if e.group(3) == b"n" and first + k not in self.xref:
+					self.xref[first + k] = (1,int(e.group(1)),int(e.group(2)))
+				pos = e.end()
+				while pos < self.buf.__len__() and self.buf[pos] in WS:
+					pos += 1
+		m = TOKEN.match(self.buf,pos)
+		if m == None or m.group(4) != b"trailer":
+			raise ReaderError("trailer not found")
+		(trailer,pos) = self.parse(self.buf,m.end())
+		if not isinstance(trailer,dict):
+			raise ReaderError("bad trailer")
+		return trailer
+
+	# Reads a cross-reference stream
+	def read_xref_stream(self,offset):
+		m = OBJ.match(self.buf,offset)
+		if m == None:
+			raise ReaderError("bad cross-reference offset")
+		stream = self.parse_indirect(int(m.group(1)),offset)
+		if not isinstance(stream,Stream) or stream.dict.get("Type") != "XRef":
+			raise ReaderError("bad cross-reference stream")
+		data = self.decode(stream)
+		widths = stream.dict.get("W")
+		if not isinstance(widths,list) or widths.__len__() != 3 or not all(is_int(w) and w >= 0 for w in widths):
+			raise ReaderError("bad cross-reference stream")
+		index = stream.dict.get("Index",[0,stream.dict.get("Size",0)])
+		if not isinstance(index,list) or not all(is_int(i) and i >= 0 for i in index):
+			raise ReaderError("bad cross-reference stream")
+		size = sum(widths)
+		pos = 0
+		for k in range(0,index.__len__() - 1,2):
+			for num in range(index[k],index[k] + index[k + 1]):
+				if pos + size > data.__len__():
+					raise ReaderError("bad cross-reference stream")
+				fields = []
+				for w in widths:
+					fields.append(int.from_bytes(data[pos:pos + w],"big"))
+					pos += w
+				if widths[0] == 0:
+					fields[0] = 1
+				if fields[0] in (1,2) and num not in self.xref:
+					self.xref[num] = tuple(fields)
+		return stream.dict
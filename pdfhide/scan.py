@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+import os
+import json
+import time
+import concurrent.futures
+
+from pdfhide import logger
+from pdfhide import pdf_algo
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# scan.py
+__version__ = "0.0"
+#
+# This is a corpus scanner for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module finds the PDF files of a directory tree that carry data
+# for a key (or for any key of a keyring).
+#
+# Each file is checked in a worker process, extracting only: the TJ
+# values are read once for all keys, reading stops at the end of FlagStr,
+# and the data is decoded and checked against CheckStr, but not written.
+# Nothing is written to disk but the anonymous temporary files of the
+# algo, so misses leave no trace.
+#
+# The result of each hit (and of each file that could not be read) is
+# written as one JSON object per line, in the order of the directory tree
+# (see find_pdfs()), with the time it took; misses are only written if
+# asked:
+# ##### {"file": ..., "hit": ..., "key": ..., "bytes": ..., "time": ...} #####
+# - hit: whether data was found
+# - key: the number of the first valid key (starting at 1), if any
+# - bytes: the size of the data, if any
+# - error: the reason why the file could not be read, if any
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Extension of PDF files
+EXT = ".pdf"
+
+# Number of files sent to a worker process at a time
+CHUNK_SIZE = 8
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Yields the PDF files of a directory tree
+#
+# NB: The files of a directory come first, then its subdirectories, all
+# sorted by name, so scans are reproducible
+def find_pdfs(root):
+	if os.path.isfile(root):
+		yield root
+		return
+	for (dir,dirs,files) in os.walk(root):
+		dirs.sort()
+		for name in sorted(files):
+			if name.lower().endswith(EXT):
+				yield os.path.join(dir,name)
+
+# Checks one PDF file for data
+#
+# path: the PDF file to check
+# keys: the list of candidate keys
+# settings: the algo settings (as a dict, see batch.SETTINGS)
+#
+# Returns the result of the check (as a dict)
+#
+# NB: Runs in a worker process, so everything here must be picklable
+def scan_file(path,keys,settings):
+	result = {
+		"file":path,
+		"hit":False
+		}
+	begin = time.time()
+	try:
+		ps = pdf_algo.PDF_stego(
+			  path,
+			  logger.rootLogger(logger.CRITICAL),
+			  improve=settings.get("improve",False),
+			  red=settings.get("red",0.1),
+			  nbits=settings.get("nbits",4),
+			  customrange=settings.get("customrange",False),
+			  native=settings.get("native",True),
+			  counter=settings.get("counter",False)
+			  )
+		values = ps.iter_values()
+		if keys.__len__() > 1:
+			# NB: Read the values once for all keys
+			values = ps.read_values()
+		try:
+			for n in range(keys.__len__()):
+				res = ps.decode_values(values,keys[n],Discard())
+				if res[0] != None:
+					result["hit"] = True
+					result["key"] = n + 1
+					result["bytes"] = res[0]
+					break
+		finally:
+			if keys.__len__() == 1:
+				values.close()
+	except Exception as e:
+		result["error"] = e.__class__.__qualname__ + ": " + str(e)
+	result["time"] = round(time.time() - begin,6)
+	return result
+
+# Checks the PDF files of a directory tree in a pool of worker processes
+#
+# root: the directory (or file) to scan
+# keys: the list of candidate keys
+# settings: the algo settings (as a dict)
+# summary: the writable to write the results to (opened in text mode)
+# workers: the number of worker processes, defaults to the number of CPUs
+# misses: if True, the results of all files are written, not only hits
+#
+# Returns a list res[]
+# res[0] is the number of files checked
+# res[1] is the number of hits
+def run(root,keys,settings,summary,workers=None,misses=False):
+	count = 0
+	hits = 0
+	paths = list(find_pdfs(root))
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		# Write results in order, as soon as they are available
+		for result in executor.map(scan_file,paths,[keys] * paths.__len__(),[settings] * paths.__len__(),chunksize=CHUNK_SIZE):
+			count += 1
+			if result["hit"]:
+				hits += 1
+			elif not misses and "error" not in result:
+				continue
+			summary.write(json.dumps(result,sort_keys=True) + "\n")
+			summary.flush()
+	return [count,hits]
+
+#
+#
+# INTERNALS
+#
+#
+
+# A writable that drops what is written to it
+class Discard:
+
+	def write(self,data):
+		return data.__len__()
@@ -0,0 +1,484 @@
+#!/usr/bin/python3
+import os
+import json
+import stat
+import time
+import signal
+import socket
+import threading
+import collections
+import concurrent.futures
+
+from pdfhide import cache
+from pdfhide import logger
+from pdfhide import pdf_algo
+from pdfhide import template
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# server.py
+__version__ = "0.0"
+#
+# This is a daemon for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module serves embed, extract and capacity requests on a Unix domain
+# socket, so that callers do not pay for a new process each time.
+#
+# Each connection carries one request and one response, both written as
+# one JSON object on one line:
+# ##### {"action": ..., "cover": ..., "output": ..., "key": ..., ...} #####
+# - action: "embed", "extract" or "capacity"
+# - cover: the PDF file (or template, if "template" is set) to read
+# - output: the file to write (embedding and extracting only)
+# - payload: the data file to embed (embedding only)
+# - workers: the number of processes to rewrite the cover in (embedding
+#   only, see PDF_stego)
+# - keys: the candidate keys, instead of "key" (extracting only)
+# - nbitslist, redlist: the settings to try (capacity only)
+# - verbose: the verbosity level of the messages to send back
+# - the other fields are the algo settings (see batch.SETTINGS)
+# Paths must be absolute: the daemon does not share the working directory
+# of its callers.
+# ##### {"ok": ..., "result": ..., "log": [...], "time": ...} #####
+# - result: the return code of the algo (embedding and extracting only)
+# - valid: the numbers of the valid keys, starting at 1 (with "keys")
+# - capacities: the capacities of the cover (capacity only)
+# - log: the messages of the algo, as [method,message] pairs
+# - error: the reason why the request failed, if any
+#
+# Requests run in a pool of worker processes that live as long as the
+# daemon, so their keystreams (see keystream.py), templates and QDF cache
+# stay warm. At most "queue" requests are accepted at a time: then the
+# daemon stops accepting connections until one is answered, so callers
+# wait in the backlog of the socket instead of piling up in memory.
+#
+# The socket is only accessible to the user running the daemon.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Environment variable with the socket of the daemon to forward to
+ENV_SOCKET = "PDF_HIDE_SOCKET"
+
+# Actions served, by name and alias
+ACTIONS = {
+	"embed":"embed",
+	"m":"embed",
+	"extract":"extract",
+	"x":"extract",
+	"capacity":"capacity",
+	"c":"capacity"
+	}
+
+# Maximum size of a message, in bytes
+MAX_MESSAGE = 1 << 20
+
+# Number of templates to keep open in each worker process
+TEMPLATES = 16
+
+# Number of PDF files to remember the cache key of
+KEYS = 4096
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class Server:
+
+	# Listens on a socket at creation time
+	#
+	# path: the path of the socket
+	# workers: the number of worker processes, defaults to the number of CPUs
+	# queue: the number of requests accepted at a time, defaults to twice the number of workers
+	# settings: the defaults of the requests, i.e. "cache" and "cachesize"
+	# log: the logger to use
+	def __init__(self,path,workers=None,queue=None,settings={},log=None):
+		self.path = path
+		self.workers = workers if workers != None else os.cpu_count() or 1
+		self.queue = queue if queue != None else 2 * self.workers
+		self.settings = dict(settings)
+		self.l = log if log != None else logger.rootLogger(logger.CRITICAL)
+		self.slots = threading.Semaphore(self.queue)
+		self.lock = threading.Lock()
+		self.closed = False
+		self.listener = listen(path,self.queue)
+		self.executor = self.start()
+
+	# Answers requests until closed
+	def serve_forever(self):
+		self.l.info("Listening on \"" + self.path + "\"",str(self.workers) + " workers")
+		while True:
+			# Backpressure
+			# -> Do not accept more than "queue" connections at a time
+			self.slots.acquire()
+			if self.closed:
+				break
+			try:
+				(conn,address) = self.listener.accept()
+			except OSError:
+				self.slots.release()
+				if self.closed:
+					break
+				raise
+			threading.Thread(target=self.answer,args=(conn,),daemon=True).start()
+
+	# Answers the request of a connection
+	def answer(self,conn):
+		try:
+			with conn:
+				try:
+					request = read_message(conn)
+				except (OSError,ValueError) as e:
+					self.l.warn("Invalid request",str(e))
+					write_message(conn,{"ok":False,"error":e.__class__.__qualname__ + ": " + str(e)})
+					return
+				response = self.run(request)
+				self.l.info("Request: " + str(request.get("action")) + " \"" + str(request.get("cover")) + "\"",
+					  ("ok" if response["ok"] else "failed") + " in " + str(response.get("time")) + "s")
+				write_message(conn,response)
+		except OSError as e:
+			# The caller went away
+			self.l.warn("Connection lost",str(e))
+		finally:
+			self.slots.release()
+
+	# Runs a request in a worker process
+	#
+	# Returns the response (as a dict)
+	def run(self,request):
+		executor = self.executor
+		try:
+			return executor.submit(run_request,request).result()
+		except concurrent.futures.process.BrokenProcessPool as e:
+			# A worker process died
+			# -> Start a new pool for the next requests
+			with self.lock:
+				if self.executor is executor and not self.closed:
+					self.l.error("Worker process died, restarting workers")
+					self.executor = self.start()
+			return {"ok":False,"error":e.__class__.__qualname__ + ": " + str(e)}
+
+	# Stops listening, then waits for the pending requests
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+		try:
+			# NB: Wakes up accept()
+			self.listener.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		self.listener.close()
+		# NB: Wakes up the loop if it waits for a slot
+		self.slots.release()
+		try:
+			os.unlink(self.path)
+		except FileNotFoundError:
+			pass
+		self.executor.shutdown()
+
+	# Starts the worker processes
+	def start(self):
+		return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,initializer=init_worker,initargs=(self.settings,))
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Connects to a daemon
+#
+# Returns the connected socket
+#
+# NB: Raises OSError if no daemon listens on the socket
+def connect(path):
+	conn = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+	try:
+		conn.connect(path)
+	except OSError:
+		conn.close()
+		raise
+	return conn
+
+# Sends a request to a daemon, waits for its response
+#
+# conn: the connected socket (see connect()), closed afterwards
+#
+# Returns the response (as a dict)
+def send(conn,request):
+	with conn:
+		write_message(conn,request)
+		return read_message(conn)
+
+# Sends a request to the daemon listening on a socket
+#
+# Returns the response (as a dict)
+def request(path,message):
+	return send(connect(path),message)
+
+# Runs one request
+#
+# Returns the response (as a dict)
+#
+# NB: Runs in a worker process, so everything here must be picklable
+def run_request(request):
+	response = {"ok":False}
+	log = Recorder(request.get("verbose",logger.ERROR))
+	begin = time.time()
+	try:
+		action = ACTIONS.get(request.get("action"))
+		if action == None:
+			raise ValueError("unknown action \"" + str(request.get("action")) + "\"")
+		for name in ["cover","output","payload"]:
+			if name in request and not os.path.isabs(request[name]):
+				raise ValueError(name + " is not an absolute path")
+		cover_template = None
+		if action == "embed" and request.get("template",False):
+			cover_template = get_template(request["cover"])
+		ps = pdf_algo.PDF_stego(
+			  request["cover"],
+			  log,
+			  output=request.get("output","out.pdf_hide"),
+			  improve=request.get("improve",False),
+			  red=request.get("red",0.1),
+			  nbits=request.get("nbits",4),
+			  customrange=request.get("customrange",False),
+			  native=request.get("native",True),
+			  counter=request.get("counter",False),
+			  workers=request.get("workers",1),
+			  cache=get_cache(request),
+			  template=cover_template
+			  )
+		if action == "embed":
+			with open(request["payload"],"rb") as payload_file:
+				code = ps.embed(payload_file,request["key"],norandom=request.get("norandom",False))
+			response["ok"] = code > 0
+			response["result"] = code
+		elif action == "extract" and "keys" in request:
+			results = ps.extract_keys(request["keys"])
+			response["valid"] = [n + 1 for n in range(results.__len__()) if results[n] != None]
+			response["ok"] = response["valid"].__len__() > 0
+		elif action == "extract":
+			code = ps.extract(request["key"])
+			response["ok"] = code == 0
+			response["result"] = code
+		else:
+			response["capacities"] = ps.capacities(
+				  request.get("nbitslist",[4]),
+				  request.get("redlist",[0.1]),
+				  passkey=request.get("key")
+				  )
+			response["ok"] = True
+	except Exception as e:
+		response["ok"] = False
+		response["error"] = e.__class__.__qualname__ + ": " + str(e)
+	response["log"] = log.records
+	response["time"] = round(time.time() - begin,6)
+	return response
+
+# Writes the messages of a response to a logger
+def replay(response,log):
+	for (method,msg) in response.get("log",[]):
+		getattr(log,method)(msg)
+
+#
+#
+# INTERNALS
+#
+#
+
+# Listens on a socket, only accessible to the current user
+#
+# NB: A socket left behind by a daemon that died is replaced
+def listen(path,backlog):
+	if os.path.exists(path):
+		if not stat.S_ISSOCK(os.stat(path).st_mode):
+			raise FileExistsError("\"" + path + "\" is not a socket")
+		try:
+			connect(path).close()
+		except ConnectionRefusedError:
+			os.unlink(path)
+		else:
+			raise OSError("A daemon already listens on \"" + path + "\"")
+	listener = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+	umask = os.umask(0o177)
+	try:
+		listener.bind(path)
+	except OSError:
+		listener.close()
+		raise
+	finally:
+		os.umask(umask)
+	listener.listen(backlog)
+	return listener
+
+# Reads one message from a socket
+def read_message(conn):
+	with conn.makefile("rb") as stream:
+		line = stream.readline(MAX_MESSAGE + 1)
+	if not line.endswith(b"\n"):
+		if line.__len__() > MAX_MESSAGE:
+			raise ValueError("message too large")
+		raise ValueError("message truncated")
+	message = json.loads(line)
+	if not isinstance(message,dict):
+		raise ValueError("message is not an object")
+	return message
+
+# Writes one message to a socket
+def write_message(conn,message):
+	conn.sendall(json.dumps(message,sort_keys=True).encode('utf-8') + b"\n")
+
+#
+# Worker processes
+
+# Defaults of the requests
+settings = {}
+
+# QDF caches, by directory and size cap
+caches = {}
+
+# Open templates, by path, least recently used first
+templates = collections.OrderedDict()
+
+# Sets the defaults of the requests
+#
+# NB: Interrupts are for the daemon, which stops the worker processes
+def init_worker(defaults):
+	signal.signal(signal.SIGINT,signal.SIG_IGN)
+	signal.signal(signal.SIGTERM,signal.SIG_DFL)
+	settings.update(defaults)
+
+# Returns the QDF cache of a request, if any
+def get_cache(request):
+	dir = request.get("cache",settings.get("cache"))
+	if dir == None:
+		return None
+	size = request.get("cachesize",settings.get("cachesize",cache.DEFAULT_SIZE))
+	if (dir,size) not in caches:
+		caches[(dir,size)] = Warm_cache(dir,size)
+	return caches[(dir,size)]
+
+# Returns a template, keeping it open for the next requests
+#
+# NB: A template file that changed is loaded again
+def get_template(path):
+	st = os.stat(path)
+	stamp = (st.st_dev,st.st_ino,st.st_size,st.st_mtime_ns)
+	if path in templates:
+		(old_stamp,old) = templates.pop(path)
+		if old_stamp == stamp:
+			templates[path] = (stamp,old)
+			return old
+		old.close()
+	cover_template = template.Template(path)
+	templates[path] = (stamp,cover_template)
+	if templates.__len__() > TEMPLATES:
+		templates.popitem(last=False)[1][1].close()
+	return cover_template
+
+# A QDF cache that remembers the keys of the PDF files
+#
+# NB: A PDF file is only hashed again if it changed
+class Warm_cache(cache.QDF_cache):
+
+	def __init__(self,dir,size):
+		super().__init__(dir,size)
+		self.keys = collections.OrderedDict()
+
+	def key(self,input):
+		st = os.stat(input)
+		stamp = (st.st_dev,st.st_ino,st.st_size,st.st_mtime_ns)
+		if input in self.keys and self.keys[input][0] == stamp:
+			self.keys.move_to_end(input)
+			return self.keys[input][1]
+		key = super().key(input)
+		self.keys[input] = (stamp,key)
+		self.keys.move_to_end(input)
+		if self.keys.__len__() > KEYS:
+			self.keys.popitem(last=False)
+		return key
+
+# A logger that records messages to send them back
+#
+# NB: Same interface and levels as logger.rootLogger
+class Recorder:
+
+	def __init__(self,verbose=0):
+		self.verbose = verbose
+		self.DEBUG = verbose >= logger.DEBUG
+		self.records = []
+
+	def record(self,method,level,msg,val):
+		if self.verbose >= level:
+			self.records += [[method,msg + logger.print_val(val)]]
+
+	def critical(self,msg,val=None):
+		self.record("critical",logger.CRITICAL,msg,val)
+
+	def error(self,msg,val=None):
+		self.record("error",logger.ERROR,msg,val)
+
+	def warn(self,msg,val=None):
+		self.record("warn",logger.INFO,msg,val)
+
+	def info(self,msg,val=None):
+		self.record("info",logger.INFO,msg,val)
+
+	def debug(self,msg,val=None):
+		self.record("debug",logger.DEBUG,msg,val)
+
+	def criticals(self,dict):
+		for (m,v) in dict.items():
+			self.critical(m,v)
+
+	def errors(self,dict):
+		for (m,v) in dict.items():
+			self.error(m,v)
+
+	def warns(self,dict):
+		for (m,v) in dict.items():
+			self.warn(m,v)
+
+	def infos(self,dict):
+		for (m,v) in dict.items():
+			self.info(m,v)
+
+	def debugs(self,dict):
+		for (m,v) in dict.items():
+			self.debug(m,v)
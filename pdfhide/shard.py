@@ -0,0 +1,323 @@
+#!/usr/bin/python3
+import os
+import mmap
+import array
+import itertools
+import collections
+import concurrent.futures
+
+from pdfhide import driver
+from pdfhide import keystream
+from pdfhide import logger
+from pdfhide import pdf_algo
+from pdfhide import tokenizer
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# shard.py
+__version__ = "0.0"
+#
+# This is a parallel embedding engine for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module rewrites a QDF file in shards, in a pool of worker processes.
+#
+# A shard is a range of whole lines of the QDF file, so it holds whole TJ
+# blocks (they never span lines) of one or more page content streams.
+# Embedding takes three steps:
+# - the workers read the values of the TJ ops of each shard
+# - the main process runs the chaotic maps over all values, in order, to
+#   find the numbers and the numerals for the TJ ops of each shard
+# - the workers rewrite each shard with its numbers and numerals, and the
+#   main process writes the new shards in order
+# Only the second step is sequential, and it neither parses nor writes
+# the QDF file. The new QDF file is the same as the one of the sequential
+# algo, byte for byte.
+#
+# With counter keystreams (see keystream.py), each TJ op takes exactly one
+# number of each map, so the n-th TJ op always gets the n-th numbers. The
+# workers then seek to the first TJ op of their shard, and count its slots
+# themselves: the second step only adds up the slots of the shards.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# Number of shards per worker process
+SHARDS_PER_WORKER = 4
+
+# Minimum size of a shard, in bytes
+MIN_SHARD_SIZE = driver.BUFFER_SIZE
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class Sharded_cover:
+
+	# Splits a QDF file into shards at creation time
+	#
+	# path: the QDF file to read
+	# workers: the number of worker processes
+	# temp: if True, the QDF file is removed when closed
+	def __init__(self,path,workers,temp=False):
+		self.path = path
+		self.workers = workers
+		self.temp = temp
+		self.shards = split(path,workers * SHARDS_PER_WORKER)
+		self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+		# Values of the TJ ops of each shard
+		self.values = None
+
+	# Returns the number of shards
+	def __len__(self):
+		return self.shards.__len__()
+
+	# Reads the values of the TJ ops of all shards
+	#
+	# Returns an iterator over the values of all TJ ops, in order
+	def read_values(self):
+		self.values = list(self.executor.map(read_shard,[self.path] * self.shards.__len__(),self.shards))
+		return itertools.chain.from_iterable(self.values)
+
+	# Embeds numerals in all shards, writes the new QDF to a sink
+	#
+	# ps: the PDF_stego instance with the algo settings
+	# sink: the writable to write the new QDF to
+	# ch_one: chaotic map 1
+	# ch_two: chaotic map 2
+	# ind: the list of nums to embed
+	#
+	# Returns the number of nums embedded
+	#
+	# NB: At most two shards per worker are in memory at a time
+	def embed(self,ps,sink,ch_one,ch_two,ind):
+		if self.values == None:
+			self.read_values()
+		settings = {
+			"improve":ps.improve,
+			"red":ps.redundancy,
+			"nbits":ps.nbits,
+			"customrange":ps.customrange,
+			"norandom":ps.norandom
+			}
+		# Count the TJ ops before each shard
+		skips = [0] + list(itertools.accumulate(values.__len__() for values in self.values))
+		counter = isinstance(ch_one,keystream.Counter_keystream) and isinstance(ch_two,keystream.Counter_keystream)
+		if counter:
+			# Count the slots of each shard in the workers
+			slots = list(self.executor.map(count_shard,[settings] * self.values.__len__(),self.values,[ch_two] * self.values.__len__(),skips[:-1]))
+		pending = collections.deque()
+		i = 0
+		for s in range(self.shards.__len__()):
+			# Find the numbers and the numerals of the shard
+			if counter:
+				# NB: The workers seek to the numbers of the shard
+				i_next = min(ind.__len__(),i + slots[s])
+				task = [rewrite_shard,self.path,self.shards[s],settings,ch_one,ch_two]
+			else:
+				(ch_ones,ch_twos,i_next) = plan(ps,self.values[s],ch_one,ch_two,ind.__len__(),i)
+				task = [rewrite_shard,self.path,self.shards[s],settings,ch_ones,ch_twos]
+			# NB: The next numeral is needed even if it is not embedded
+			nums = [ind[k] for k in range(i,min(i_next + 1,ind.__len__()))]
+			pending.append(self.executor.submit(*task,nums,skips[s] if counter else None))
+			i = i_next
+			# Write the new shards in order
+			while pending.__len__() > 2 * self.workers or (pending.__len__() > 0 and pending[0].done()):
+				sink.write(pending.popleft().result())
+		while pending.__len__() > 0:
+			sink.write(pending.popleft().result())
+		if counter:
+			# NB: Same positions as after plan()
+			ch_one.seek(ch_one.pos + skips[-1])
+			ch_two.seek(ch_two.pos + skips[-1])
+		ps.tj_count_valid = i
+		return i
+
+	# Stops the worker processes
+	def close(self):
+		self.executor.shutdown(cancel_futures=True)
+		if self.temp:
+			driver.delete(self.path)
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Splits a file into ranges of whole lines
+#
+# count: the number of ranges to aim for
+#
+# Returns a list of [start,end] ranges, in order
+def split(path,count):
+	size = os.path.getsize(path)
+	size_shard = max(MIN_SHARD_SIZE,size // max(1,count))
+	shards = []
+	with open(path,"rb") as qdf_file:
+		pos = 0
+		for block in driver.blocks(qdf_file,size_shard):
+			shards.append([pos,pos + block.__len__()])
+			pos += block.__len__()
+			block.release()
+	return shards
+
+# Returns True if a file is large enough to be rewritten in shards
+def worth_it(path,workers):
+	return workers > 1 and os.path.getsize(path) >= 2 * MIN_SHARD_SIZE
+
+# Finds the numbers and the numerals for the TJ ops of a shard
+#
+# ps: the PDF_stego instance with the algo settings
+# values: the values of the TJ ops of the shard
+# ch_one: chaotic map 1
+# ch_two: chaotic map 2
+# n: the number of nums to embed
+# i: the number of nums already embedded
+#
+# Returns a list res[]
+# res[0] is the numbers of chaotic map 1, one per TJ op
+# res[1] is the numbers of chaotic map 2, one per TJ op
+# res[2] is the number of nums embedded after the shard
+#
+# NB: Same calls to the chaotic maps as embed_next(), and same checks as
+# embed_op() (see count_slots())
+def plan(ps,values,ch_one,ch_two,n,i):
+	ch_ones = array.array("d")
+	ch_twos = array.array("d")
+	k = 0
+	while k < values.__len__() and i < n:
+		if ps.improve:
+			ch_ones.append(ch_one.nonzero())
+			ch_twos.append(ch_two.nonzero())
+		else:
+			ch_ones.append(ch_one.next())
+			ch_twos.append(ch_two.next())
+		if ps.is_slot(values[k],ch_twos[-1],ps.nbits,ps.redundancy,ps.improve,ps.customrange):
+			i += 1
+		k += 1
+	# No more numerals to embed
+	# -> One number per TJ op
+	ch_ones.extend(ch_one.block(values.__len__() - k))
+	ch_twos.extend(ch_two.block(values.__len__() - k))
+	return [ch_ones,ch_twos,i]
+
+#
+#
+# INTERNALS
+#
+#
+
+# Reads the values of the TJ ops of a shard
+#
+# NB: Runs in a worker process
+def read_shard(path,shard):
+	with open(path,"rb") as qdf_file:
+		buffer = mmap.mmap(qdf_file.fileno(),0,access=mmap.ACCESS_READ)
+	try:
+		return array.array("q",[op.value for op in tokenizer.ops(buffer,shard[0],shard[1])])
+	finally:
+		buffer.close()
+
+# Counts the slots of a shard, with counter keystreams
+#
+# values: the values of the TJ ops of the shard
+# ch_two: chaotic map 2, before the first TJ op of the file
+# skip: the number of TJ ops before the shard
+#
+# NB: Runs in a worker process
+def count_shard(settings,values,ch_two,skip):
+	ps = stego(settings)
+	ch_two.seek(ch_two.pos + skip)
+	ch_twos = ch_two.block(values.__len__())
+	slots = 0
+	for k in range(values.__len__()):
+		if ps.is_slot(values[k],ch_twos[k],ps.nbits,ps.redundancy,ps.improve,ps.customrange):
+			slots += 1
+	return slots
+
+# Rewrites a shard with its numbers and numerals
+#
+# ch_one, ch_two: the numbers of the chaotic maps for the shard (see
+#                 plan()), or counter keystreams to seek (see skip)
+# skip: with counter keystreams, the number of TJ ops before the shard
+#
+# Returns the new shard (as bytes)
+#
+# NB: Runs in a worker process
+def rewrite_shard(path,shard,settings,ch_one,ch_two,nums,skip=None):
+	ps = stego(settings)
+	if skip == None:
+		ch_one = Numbers(ch_one)
+		ch_two = Numbers(ch_two)
+	else:
+		ch_one.seek(ch_one.pos + skip)
+		ch_two.seek(ch_two.pos + skip)
+	with open(path,"rb") as qdf_file:
+		buffer = mmap.mmap(qdf_file.fileno(),0,access=mmap.ACCESS_READ)
+	try:
+		block = ps.embed_line(buffer[shard[0]:shard[1]],ch_one,ch_two,nums,0,0,0,0)
+	finally:
+		buffer.close()
+	return block[0]
+
+# Returns a PDF_stego instance with the algo settings, to rewrite shards
+#
+# NB: Runs in a worker process
+def stego(settings):
+	ps = pdf_algo.PDF_stego(None,logger.rootLogger(logger.CRITICAL),
+		  improve=settings["improve"],
+		  red=settings["red"],
+		  nbits=settings["nbits"],
+		  customrange=settings["customrange"]
+		  )
+	ps.norandom = settings["norandom"]
+	return ps
+
+# Numbers of a chaotic map, already computed
+#
+# NB: Same interface as keystream.Keystream, as used by embed_next()
+class Numbers:
+
+	def __init__(self,values):
+		self.values = iter(values)
+
+	def next(self):
+		return next(self.values)
+
+	random = next
+
+	nonzero = next
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+import sys
+import mmap
+import array
+import shutil
+import struct
+
+from pdfhide import driver
+from pdfhide import tokenizer
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# template.py
+__version__ = "0.0"
+#
+# This is a cover template compiler for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module precompiles cover PDF files into templates.
+#
+# A template holds the QDF file of a cover, as QPDF generates it, and an
+# index of all its TJ operators (offset, length, and signed value, see
+# the tokenizer). Embedding data in a template only computes the new
+# values, then patches them in the QDF file at the known offsets: the
+# cover is neither uncompressed nor parsed again.
+#
+# A template file is made of:
+# - a header: MAGIC, then the number of TJ ops and the size of the QDF
+#   file (as little-endian 64-bit integers)
+# - the offsets of the TJ ops (as little-endian 64-bit integers)
+# - the lengths of the TJ ops (as bytes)
+# - the values of the TJ ops (as little-endian 64-bit integers)
+# - the QDF file
+#
+
+#
+#
+#
+# STATIC
+#
+
+# The beginning of template files
+MAGIC = b"%PDF_HIDE-TEMPLATE-0.0\n"
+
+# The header after MAGIC
+HEADER = struct.Struct("<QQ")
+
+# The size of the index, per TJ op
+INDEX_ENTRY = 8 + 1 + 8
+
+#
+#
+#
+# MAIN CLASS
+#
+
+class Template:
+
+	# Loads a template file at creation time
+	#
+	# NB: The template file is mapped in memory, not read
+	def __init__(self,path):
+		self.path = path
+		with open(path,"rb") as template_file:
+			try:
+				self.map = mmap.mmap(template_file.fileno(),0,access=mmap.ACCESS_READ)
+			except ValueError:
+				# Empty file
+				raise ValueError("\"" + path + "\" is not a template file")
+		try:
+			if self.map[:MAGIC.__len__()] != MAGIC:
+				raise ValueError("\"" + path + "\" is not a template file")
+			pos = MAGIC.__len__()
+			try:
+				(count,size) = HEADER.unpack_from(self.map,pos)
+			except struct.error:
+				raise ValueError("\"" + path + "\" is not a template file")
+			pos += HEADER.size
+			# Check the sizes before reading anything
+			#
+			# NB: Each TJ op has an offset, a length and a value (see above)
+			if pos + count * INDEX_ENTRY + size != self.map.__len__():
+				raise ValueError("\"" + path + "\" is not a template file (truncated)")
+			# Read the index
+			self.offsets = read_array("q",self.map,pos,count)
+			pos += count * 8
+			self.lengths = read_array("B",self.map,pos,count)
+			pos += count
+			self.values = read_array("q",self.map,pos,count)
+			pos += count * 8
+		except ValueError:
+			self.map.close()
+			raise
+		# The QDF file
+		self.qdf = memoryview(self.map)[pos:]
+
+	# Returns the number of TJ ops
+	def __len__(self):
+		return self.values.__len__()
+
+	# Writes the QDF file, with new values for its TJ ops
+	#
+	# sink: the writable to write the new QDF to
+	# values: the new values of the TJ ops, in order (as bytes)
+	#
+	# NB: The QDF file is written in large blocks
+	def write(self,sink,values,block_size=driver.BUFFER_SIZE):
+		segments = []
+		size = 0
+		pos = 0
+		k = 0
+		for value in values:
+			offset = self.offsets[k]
+			segments.append(self.qdf[pos:offset])
+			segments.append(value)
+			size += offset - pos + value.__len__()
+			pos = offset + self.lengths[k]
+			k += 1
+			if size >= block_size:
+				sink.write(b"".join(segments))
+				segments = []
+				size = 0
+		segments.append(self.qdf[pos:])
+		sink.write(b"".join(segments))
+
+	# Releases the template file
+	def close(self):
+		self.qdf.release()
+		self.map.close()
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Compiles a PDF file into a template file
+#
+# input: the PDF file to compile
+# output: the template file to write
+# cache: a cache of QDF files to use, if any
+#
+# Returns the number of TJ ops of the template
+#
+# NB: The QDF file is spooled to a temporary file and indexed a block at a
+# time, so memory only grows with the number of TJ ops (see INDEX_ENTRY)
+def compile_pdf(input,output,cache=None):
+	# Uncompress the PDF file
+	if cache == None:
+		qdf_file = driver.spool()
+		uncompressor = driver.uncompress_pipe(input)
+		try:
+			shutil.copyfileobj(uncompressor.stdout,qdf_file,driver.BUFFER_SIZE)
+		finally:
+			code = driver.wait(uncompressor)
+		if code not in (0,3):
+			# NB: QPDF returns 3 when it had to recover from warnings
+			qdf_file.close()
+			raise OSError("QPDF cannot uncompress \"" + input + "\"")
+		qdf_file.seek(0)
+	else:
+		qdf_file = cache.open(input)
+	with qdf_file:
+		# Index the TJ ops
+		offsets = array.array("q")
+		lengths = array.array("B")
+		values = array.array("q")
+		size = 0
+		for block in driver.blocks(qdf_file):
+			for op in tokenizer.ops(block):
+				if op.length > 18:
+					# NB: Values are stored as 64-bit integers
+					raise ValueError("TJ operator too long in \"" + input + "\"")
+				offsets.append(size + op.offset)
+				lengths.append(op.length)
+				values.append(op.value)
+			size += block.__len__()
+		# Write the template file
+		(template_file,temp) = driver.open_atomic(output)
+		committed = False
+		try:
+			template_file.write(MAGIC)
+			template_file.write(HEADER.pack(values.__len__(),size))
+			write_array(template_file,offsets)
+			write_array(template_file,lengths)
+			write_array(template_file,values)
+			qdf_file.seek(0)
+			shutil.copyfileobj(qdf_file,template_file,driver.BUFFER_SIZE)
+			committed = True
+		finally:
+			driver.close_atomic(template_file,temp,output,committed)
+	return values.__len__()
+
+#
+#
+# INTERNALS
+#
+#
+
+# Reads a little-endian array from a buffer
+def read_array(typecode,buffer,pos,count):
+	a = array.array(typecode)
+	a.frombytes(buffer[pos:pos + count * a.itemsize])
+	if sys.byteorder != "little":
+		a.byteswap()
+	return a
+
+# Writes an array to a file as little-endian
+def write_array(file,a):
+	if sys.byteorder != "little":
+		a = array.array(a.typecode,a)
+		a.byteswap()
+	a.tofile(file)
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+import re
+import collections
+
+#
+#
+#
+# PDF HIDE
+#
+
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+#
+# Copyright (C) 2013 Nicolas Canceill
+#
+
+#
+# tokenizer.py
+__version__ = "0.0"
+#
+# This is a TJ operator tokenizer for pdf_hide v0.0
+#
+# Written by Nicolas Canceill
+# Last updated on Nov 10, 2013
+# Hosted at https://github.com/ncanceill/pdf_hide
+#
+
+#
+# This module finds TJ operators inside PDF content streams.
+#
+# A TJ block is a text array followed by the TJ operator, such as:
+# ##### [(Lorem)-333(ipsum)]TJ #####
+# and a TJ operator (as understood by the pdf_hide algo) is a kerning
+# number found between two strings of a TJ block, such as "-333" above.
+#
+# The content (implemented as the `bytes` type in Python, or any buffer)
+# is scanned in a single pass with compiled regular expressions, and
+# each TJ operator is reported as a record holding its byte offset,
+# its length in bytes, and its signed value.
+#
+# NB: TJ blocks never span several lines, so scanning a whole content
+# stream is the same as scanning it line by line.
+#
+
+#
+#
+#
+# STATIC
+#
+
+# A TJ block, the content of the array is group 1
+TJ_BLOCK = re.compile(rb'\[(.*?)\][ ]?TJ')
+
+# A TJ operator inside a TJ block, the value is group 1
+TJ_OP = re.compile(rb'[>)](\-?[0-9]+)[<(]')
+
+# A TJ operator record
+#
+# offset: the position of the first byte of the value in the content
+# length: the number of bytes of the value
+# value: the signed value
+TJop = collections.namedtuple("TJop",["offset","length","value"])
+
+#
+#
+# PUBLIC API
+#
+#
+
+# Yields the TJ operators found in content, in order
+#
+# start, end: the range of content to scan
+def ops(content,start=0,end=None):
+	if end == None:
+		end = len(content)
+	for block in TJ_BLOCK.finditer(content,start,end):
+		for m in TJ_OP.finditer(content,block.start(1),block.end(1)):
+			yield TJop(m.start(1),m.end(1) - m.start(1),int(m.group(1)))
+
+# Returns the list of the signed values of the TJ operators found in content
+def values(content,start=0,end=None):
+	return [op.value for op in ops(content,start,end)]
@@ -1,11 +1,36 @@
 #!/usr/bin/python3
 import unittest
 import os
+import sys
+import asyncio
 import random
 import string
+import io
+import json
+import tempfile
+import threading
 
+from pdfhide import aio
+from pdfhide import batch
+from pdfhide import chaos
+from pdfhide import cache
+from pdfhide import detector
+from pdfhide import driver
+from pdfhide import encoding
+from pdfhide import keystream
 from pdfhide import logger
+from pdfhide import memory
+from pdfhide import payload
 from pdfhide import pdf_algo
+from pdfhide import qdf
+from pdfhide import reader
+from pdfhide import scan
+from pdfhide import server
+from pdfhide import shard
+from pdfhide import template
+from pdfhide import tokenizer
+
+from bench import synth
 
 #
 #
@@ -82,6 +107,27 @@ def print_begin(case):
 def print_end(case):
 	print("========== END TEST " + case.upper() + " ==========")
 
+# QDF files
+
+# Returns a plain QDF file with one page, as QPDF writes it
+#
+# content: the content stream of the page
+# entries: more entries for the dictionary of the content stream
+def make_qdf(content,entries=b""):
+	objs = [b"<<\n  /Pages 2 0 R\n  /Type /Catalog\n>>\n",
+		b"<<\n  /Count 1\n  /Kids [\n    3 0 R\n  ]\n  /Type /Pages\n>>\n",
+		b"<<\n  /Contents 4 0 R\n  /Parent 2 0 R\n  /Type /Page\n>>\n",
+		b"<<\n  /Length 5 0 R\n" + entries + b">>\nstream\n" + content + b"endstream\n",
+		str(content.__len__()).encode() + b"\n"]
+	qdf = b"%PDF-1.4\n%QDF-1.0\n\n"
+	offsets = []
+	for n in range(objs.__len__()):
+		offsets += [qdf.__len__()]
+		qdf += str(n + 1).encode() + b" 0 obj\n" + objs[n] + b"endobj\n\n"
+	xref = qdf.__len__()
+	qdf += b"xref\n0 6\n0000000000 65535 f \n" + b"".join([b"%010d 00000 n \n" % offset for offset in offsets])
+	return qdf + b"trailer <<\n  /Root 1 0 R\n  /Size 6\n>>\nstartxref\n" + str(xref).encode() + b"\n%%EOF\n"
+
 #
 #
 #
@@ -101,6 +147,249 @@ class AllDependenciesTestCase(unittest.TestCase):
 	def tearDownClass(cls):
 		print_end('dependencies')
 
+# Numeral codec
+class EncodingTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		random.seed(RANDOM_SEED)
+		print_begin('encoding')
+	def test_encoding_msg(self):
+		for n in range(1000):
+			data = bytes(random.choice([0,255,random.randrange(256)]) for x in range(random.randrange(32)))
+			nbits = random.randrange(1,17)
+			expected = [encoding.binstr_to_num(str,nbits) for str in encoding.pad_str(data,nbits)]
+			self.assertEqual(encoding.msg_to_nums(data,nbits),expected)
+	def test_encoding_nums(self):
+		for n in range(1000):
+			nbits = random.randrange(1,17)
+			nums = [random.randrange(2**nbits) for x in range(random.randrange(32))]
+			expected = b"".join(encoding.decode("".join([encoding.num_to_binstr(num,nbits) for num in nums])))
+			self.assertEqual(encoding.nums_to_msg(nums,nbits),expected)
+	@classmethod
+	def tearDownClass(cls):
+		print_end('encoding')
+
+# Streamed payloads
+class PayloadTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		random.seed(RANDOM_SEED)
+		print_begin('payload')
+	def test_payload_numerals(self):
+		for n in range(1000):
+			data = bytes(random.choice([0,255,random.randrange(256)]) for x in range(random.randrange(300)))
+			nbits = random.randrange(1,17)
+			expected = encoding.encode_msg(data,key,nbits)
+			# Bytes, seekable file, or iterator
+			source = [data,io.BytesIO(data),iter([data[k:k + 7] for k in range(0,data.__len__(),7)])][n % 3]
+			p = payload.Payload(source,nbits)
+			self.assertEqual([p.checkstr(),list(p.numerals()),p.__len__()],[expected[0],expected[1],expected[1].__len__()])
+			p.close()
+	def test_payload_output(self):
+		for n in range(1000):
+			nbits = random.randrange(1,17)
+			nums = [random.choice([0,random.randrange(2**nbits)]) for x in range(random.randrange(300))]
+			expected = encoding.nums_to_msg(nums,nbits)
+			o = payload.Output(nbits)
+			for k in range(0,nums.__len__(),7):
+				o.write(nums[k:k + 7])
+			output = io.BytesIO()
+			self.assertEqual(o.decode(output),[expected.__len__(),encoding.digest(expected)])
+			self.assertEqual(output.getvalue(),expected)
+			o.close()
+	@classmethod
+	def tearDownClass(cls):
+		print_end('payload')
+
+# Keystreams
+class KeystreamTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('keystream')
+		cls.flagstr = encoding.encode_key(key,4)
+	def test_keystream_chaotic(self):
+		ch = chaos.Chaotic(3.8,self.flagstr)
+		expected = [ch.next() for n in range(10000)]
+		ks = keystream.chaotic(3.8,self.flagstr)
+		self.assertEqual([ks.next() for n in range(3)],expected[:3])
+		ks = keystream.chaotic(3.8,self.flagstr)
+		self.assertEqual(list(ks.block(5000)) + [x for (n,x) in zip(range(5000),ks)],expected)
+	def test_keystream_prng(self):
+		ch = random.Random(key)
+		expected = [ch.random() for n in range(10000)]
+		ks = keystream.prng(key)
+		self.assertEqual([ks.random() for n in range(5000)] + [x for (n,x) in zip(range(5000),ks.nonzeros())],expected)
+	def test_keystream_counter(self):
+		ks = keystream.counter("one",key)
+		expected = list(ks.block(10000))
+		self.assertTrue(all(0 < x < 1 for x in expected))
+		ks = keystream.counter("one",key)
+		ks.seek(7001)
+		self.assertEqual([ks.next() for n in range(3)],expected[7001:7004])
+		ks.seek(3)
+		self.assertEqual([x for (n,x) in zip(range(5000),ks)],expected[3:5003])
+		self.assertNotEqual(list(keystream.counter("two",key).block(10)),expected[:10])
+	def test_keystream_threads(self):
+		ch = chaos.Chaotic(3.8,self.flagstr)
+		expected = [ch.next() for n in range(20000)]
+		keystream.clear()
+		results = []
+		barrier = threading.Barrier(8)
+		def read():
+			ks = keystream.chaotic(3.8,self.flagstr)
+			barrier.wait()
+			results.append([ks.next() for n in range(20000)])
+		threads = [threading.Thread(target=read) for n in range(8)]
+		# NB: Switch threads often, so that they generate at the same time
+		interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-4)
+		try:
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		finally:
+			sys.setswitchinterval(interval)
+		self.assertEqual(results,[expected] * 8)
+	def test_keystream_limit(self):
+		keystream.clear()
+		ks = keystream.prng(key)
+		self.assertEqual(keystream.cache.__len__(),1)
+		ks.block(keystream.CACHE_LIMIT + 1)
+		self.assertEqual(keystream.cache.__len__(),0)
+		keystream.prng(key + "x",shared=False)
+		self.assertEqual(keystream.cache.__len__(),0)
+	@classmethod
+	def tearDownClass(cls):
+		keystream.clear()
+		print_end('keystream')
+
+# FlagStr detector
+class DetectorTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		random.seed(RANDOM_SEED)
+		print_begin('detector')
+	def test_detector_cycle(self):
+		for n in range(1000):
+			tjs = [random.randrange(2) for x in range(random.randrange(80))]
+			flagstr = [random.randrange(2) for x in range(20)]
+			if tjs.__len__() > 0 and random.random() < 0.5:
+				k = random.randrange(tjs.__len__())
+				flagstr = [tjs[(k + x) % tjs.__len__()] for x in range(20)]
+			# Look for FlagStr the slow way
+			tjs_ = tjs + tjs
+			expected = None
+			for k in range(20,20 + tjs.__len__()):
+				if tjs_[k:k + 20] == flagstr:
+					expected = [tjs_[:20],tjs_[20:k]]
+					break
+			d = detector.FlagStr_detector(flagstr)
+			found = any(d.feed(tj) for tj in tjs) or d.finish()
+			self.assertEqual(found,expected != None)
+			if found:
+				self.assertEqual([d.checkstr(),d.data()],expected)
+			# Same with a sink, passing numerals as soon as possible
+			data = []
+			d = detector.FlagStr_detector(flagstr,sink=data.extend,block_size=random.randrange(1,8))
+			found = any(d.feed(tj) for tj in tjs) or d.finish()
+			if found:
+				self.assertEqual([d.checkstr(),data],expected)
+	@classmethod
+	def tearDownClass(cls):
+		print_end('detector')
+
+# In-process reader
+class ReaderTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('reader')
+	def test_reader_tjs(self):
+		driver.uncompress(s_long + ".pdf",s_long + ".qdf")
+		qdf_file = open(s_long + ".qdf","rb")
+		expected = tokenizer.values(qdf_file.read())
+		qdf_file.close()
+		driver.delete(s_long + ".qdf")
+		result = []
+		for content in reader.contents(s_long + ".pdf"):
+			result += tokenizer.values(content)
+		self.assertEqual(expected,result)
+	def test_reader_malformed(self):
+		for trailer in [b"<< /Size 1 /Prev /Foo >>",b"<< /Size 1 /Prev -5 >>",b"<< /Size 1 /Root [1] >>"]:
+			pdf = b"%PDF-1.4\nxref\n0 1\n0000000000 65535 f \ntrailer\n" + trailer + b"\nstartxref\n9\n%%EOF\n"
+			self.assertRaises(reader.ReaderError,reader.contents,pdf)
+	@classmethod
+	def tearDownClass(cls):
+		print_end('reader')
+
+# QDF fixer
+class QDFTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('qdf')
+	def fix_qdf(self,data,size):
+		output = io.BytesIO()
+		fixer = qdf.QDF_fixer(output)
+		for pos in range(0,data.__len__(),size):
+			fixer.write(data[pos:pos + size])
+		fixer.flush()
+		return [fixer.ok,output.getvalue()]
+	def test_qdf_fix(self):
+		content = b"BT\n/F1 10 Tf\n[(lorem)-333(ipsum)-27(dolor)]TJ\nET\n"
+		wide = content.replace(b")-333(",b")-3333(")
+		# NB: Stale length, offsets, size and startxref
+		stale = make_qdf(content).replace(content,wide).replace(b"/Size 6\n",b"/Size 60\n")
+		expected = make_qdf(wide)
+		for size in [1,3,7,4096]:
+			[ok,result] = self.fix_qdf(stale,size)
+			self.assertTrue(ok)
+			self.assertEqual(expected,result)
+			self.assertIn(b"\n5 0 obj\n" + str(wide.__len__()).encode() + b"\nendobj\n",result)
+			self.assertIn(b"\n  /Size 6\n",result)
+			xref = result.index(b"\nxref\n") + 1
+			self.assertTrue(result.endswith(b"\nstartxref\n" + str(xref).encode() + b"\n%%EOF\n"))
+			entries = result[xref:].split(b"\n")[3:8]
+			for n in range(5):
+				self.assertTrue(result[int(entries[n][:10]):].startswith(str(n + 1).encode() + b" 0 obj\n"))
+	def test_qdf_objstm(self):
+		# NB: Stale length, offsets and startxref
+		data = make_qdf(b"1 0\n<< >>\n",b"  /First 4\n  /N 1\n  /Type /ObjStm\n").replace(b"<< >>",b"<< /A 1 >>")
+		for size in [1,3,7,4096]:
+			[ok,result] = self.fix_qdf(data,size)
+			self.assertFalse(ok)
+			self.assertEqual(data,result)
+	@classmethod
+	def tearDownClass(cls):
+		print_end('qdf')
+
+# Blocks of lines
+class BlocksTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('blocks')
+	def check_blocks(self,data,blocks):
+		self.assertEqual(data,b"".join(blocks))
+		for block in blocks[:-1]:
+			self.assertEqual(block[-1:],b"\n")
+	def test_blocks(self):
+		# NB: Lines longer than the blocks, and no newline at the end
+		data = b"a" * 100 + b"\n\n" + b"b" * 10 + b"\n" + b"c" * 37 + b"\n" + b"d" * 50
+		for size in [1,7,16,64,4096]:
+			# Mapped in memory
+			with driver.memfile(data) as data_file:
+				views = list(driver.blocks(data_file,size))
+			self.assertTrue(all(isinstance(view,memoryview) for view in views))
+			blocks = [bytes(view) for view in views]
+			for view in views:
+				view.release()
+			self.check_blocks(data,blocks)
+			# Read from a pipe
+			self.check_blocks(data,list(driver.read_blocks(io.BytesIO(data),size)))
+			self.check_blocks(data,list(driver.blocks(io.BytesIO(data),size)))
+	@classmethod
+	def tearDownClass(cls):
+		print_end('blocks')
+
 # Algorithm, no custom settings, no improvements
 class DefaultAlgoTestCase(unittest.TestCase):
 	@classmethod
@@ -108,14 +397,27 @@ class DefaultAlgoTestCase(unittest.TestCase):
 		print_begin('algorithm (default)')
 		cls.defaultMessage = msg
 		cls.defaultKey = key
+	def test_algodef_capacity(self):
+		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl,output=s_embed)
+		result = ps.capacity(self.defaultKey)
+		self.assertTrue(result[1] >= self.defaultMessage.__len__())
+		result = ps.embed(b"\xff" * (result[1] + 1),self.defaultKey)
+		self.assertTrue(result < 0)
 	def test_algodef_embed(self):
 		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl,output=s_embed)
 		result = ps.embed(self.defaultMessage,self.defaultKey)
 		self.assertTrue(result > 0)
+	def test_algodef_embedfail(self):
+		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl,output="sample/missing/test_e.pdf")
+		self.assertRaises(OSError,ps.embed,self.defaultMessage,self.defaultKey)
 	def test_algodef_extract(self):
 		ps = pdf_algo.PDF_stego(s_embed,rl,output=s_msg)
 		result = ps.extract(self.defaultKey)
 		self.assertEqual(result, 0)
+	def test_algodef_extractkeys(self):
+		ps = pdf_algo.PDF_stego(s_embed,rl,output=s_msg)
+		result = ps.extract_keys([self.defaultKey + "x",self.defaultKey])
+		self.assertEqual(result,[None,self.defaultMessage])
 	def test_algodef_resultchk(self):
 		output_file = open(s_msg,"rb")
 		output = output_file.read()
@@ -191,6 +493,19 @@ class SpecialAlgoTestCase(unittest.TestCase):
 		output = output_file.read()
 		output_file.close()
 		self.assertEqual(self.defaultMessage,output)
+	def test_algo_counter_embed(self):
+		ps = pdf_algo.PDF_stego(s_long + ".pdf",rl,output=s_embed,counter=True)
+		result = ps.embed(self.defaultMessage,self.defaultKey)
+		self.assertTrue(result > 0)
+	def test_algo_counter_extract(self):
+		ps = pdf_algo.PDF_stego(s_embed,rl,output=s_msg,counter=True)
+		result = ps.extract(self.defaultKey)
+		self.assertEqual(result, 0)
+	def test_algo_counter_resultchk(self):
+		output_file = open(s_msg,"rb")
+		output = output_file.read()
+		output_file.close()
+		self.assertEqual(self.defaultMessage,output)
 	@classmethod
 	def tearDownClass(cls):
 		print_end('algorithm (special)')
@@ -289,6 +604,316 @@ class SpecialIAlgoTestCase(unittest.TestCase):
 	def tearDownClass(cls):
 		print_end('algorithm improved (special)')
 
+# Cache of QDF files
+class CacheTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('cache')
+		cls.dir = "sample/cache"
+	def test_cache_hit(self):
+		qdf_cache = cache.QDF_cache(self.dir)
+		path = qdf_cache.get(s_base + ".pdf")
+		self.assertTrue(os.path.exists(path))
+		self.assertEqual(qdf_cache.get(s_base + ".pdf"),path)
+	def test_cache_evict(self):
+		qdf_cache = cache.QDF_cache(self.dir,0)
+		path = qdf_cache.get(s_base + ".pdf")
+		self.assertNotEqual(qdf_cache.get(s_long + ".pdf"),path)
+		self.assertFalse(os.path.exists(path))
+	def test_cache_extract(self):
+		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl,output=s_embed,cache=cache.QDF_cache(self.dir))
+		self.assertTrue(ps.embed(msg,key) > 0)
+		ps = pdf_algo.PDF_stego(s_embed,rl,output=s_msg,cache=cache.QDF_cache(self.dir))
+		self.assertEqual(ps.extract(key),0)
+		output_file = open(s_msg,"rb")
+		self.assertEqual(msg,output_file.read())
+		output_file.close()
+	@classmethod
+	def tearDownClass(cls):
+		cache.QDF_cache(cls.dir).clear()
+		os.rmdir(cls.dir)
+		print_end('cache')
+
+# Parallel embedding
+class ShardTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('shard')
+		# NB: Use small shards, the samples are small
+		cls.min_shard_size = shard.MIN_SHARD_SIZE
+		shard.MIN_SHARD_SIZE = 1024
+	def test_shard_embed(self):
+		# NB: Compare the new QDF files, QPDF may generate a new /ID
+		for [improve,counter] in [[False,False],[True,False],[False,True],[True,True]]:
+			expected = io.BytesIO()
+			ps = pdf_algo.PDF_stego(s_long + ".pdf",rl,improve=improve,counter=counter)
+			self.assertTrue(ps.embed(msg,key,sink=expected) > 0)
+			output = io.BytesIO()
+			ps = pdf_algo.PDF_stego(s_long + ".pdf",rl,improve=improve,counter=counter,workers=3)
+			self.assertTrue(ps.embed(msg,key,sink=output) > 0)
+			self.assertEqual(output.getvalue(),expected.getvalue())
+	@classmethod
+	def tearDownClass(cls):
+		shard.MIN_SHARD_SIZE = cls.min_shard_size
+		print_end('shard')
+
+# Corpus scan
+class ScanTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('scan')
+		cls.dir = "sample/scan"
+		os.makedirs(cls.dir + "/sub",exist_ok=True)
+		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl,output=cls.dir + "/sub/hit.pdf")
+		ps.embed(msg,key)
+		driver.uncompress(s_base + ".pdf",cls.dir + "/miss.pdf")
+	def test_scan_run(self):
+		summary = io.StringIO()
+		self.assertEqual(scan.run(self.dir,[key + "x",key],{},summary,workers=2,misses=True),[2,1])
+		results = [json.loads(line) for line in summary.getvalue().splitlines()]
+		self.assertEqual([[r["file"],r["hit"]] for r in results],[[self.dir + "/miss.pdf",False],[self.dir + "/sub/hit.pdf",True]])
+		self.assertEqual([results[1]["key"],results[1]["bytes"]],[2,msg.__len__()])
+		self.assertFalse(os.path.exists(self.dir + "/sub/hit.pdf.tmp"))
+	@classmethod
+	def tearDownClass(cls):
+		for path in [cls.dir + "/sub/hit.pdf",cls.dir + "/miss.pdf"]:
+			driver.delete(path)
+		os.rmdir(cls.dir + "/sub")
+		os.rmdir(cls.dir)
+		print_end('scan')
+
+# In-memory API
+class MemoryTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('memory')
+		cover_file = open(s_base + ".pdf","rb")
+		cls.cover = cover_file.read()
+		cover_file.close()
+	def test_memory_bytes(self):
+		for improve in [False,True]:
+			stego = memory.embed_bytes(self.cover,msg,key,improve=improve)
+			self.assertEqual(memory.extract_bytes(stego,key,improve=improve),msg)
+			self.assertRaises(ValueError,memory.extract_bytes,stego,key + "x",improve=improve)
+	@classmethod
+	def tearDownClass(cls):
+		print_end('memory')
+
+# Asyncio API
+class AioTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('aio')
+	def test_aio_embed_extract(self):
+		async def run():
+			# NB: All documents in flight at once
+			res = await asyncio.gather(*[aio.embed(s_base + ".pdf",s_embed + str(n),msg,key,improve=n == 1) for n in range(2)])
+			self.assertTrue(all(r > 0 for r in res))
+			return await asyncio.gather(*[aio.extract(s_embed + str(n),s_msg + str(n),key,improve=n == 1) for n in range(2)])
+		self.assertEqual(asyncio.run(run()),[0,0])
+		for n in range(2):
+			output_file = open(s_msg + str(n),"rb")
+			self.assertEqual(msg,output_file.read())
+			output_file.close()
+		self.assertEqual(asyncio.run(aio.extract(s_embed + "0",s_msg,key + "x")),-1)
+	def test_aio_same_key(self):
+		# NB: Same key, in the threads of the default executor, and
+		# keystreams longer than a block (see keystream.py)
+		#
+		# NB: The cover and the outputs are removed even if the test fails
+		scratch = tempfile.TemporaryDirectory(prefix="pdf_hide-")
+		self.addCleanup(scratch.cleanup)
+		cover = os.path.join(scratch.name,"synth.pdf")
+		embeds = [os.path.join(scratch.name,"embed" + str(n) + ".pdf") for n in range(6)]
+		msgs = [os.path.join(scratch.name,"msg" + str(n)) for n in range(6)]
+		synth.generate(cover,pages=40,kerning="small",compress=False)
+		messages = [msg + bytes([n + 1]) * (500 * n + 500) for n in range(6)]
+		async def run():
+			keystream.clear()
+			res = await asyncio.gather(*[aio.embed(cover,embeds[n],messages[n],key) for n in range(messages.__len__())])
+			self.assertTrue(all(r > 0 for r in res))
+			keystream.clear()
+			return await asyncio.gather(*[aio.extract(embeds[n],msgs[n],key) for n in range(messages.__len__())])
+		self.assertEqual(asyncio.run(run()),[0] * messages.__len__())
+		for n in range(messages.__len__()):
+			output_file = open(msgs[n],"rb")
+			self.assertEqual(messages[n],output_file.read())
+			output_file.close()
+	@classmethod
+	def tearDownClass(cls):
+		for n in range(2):
+			driver.delete(s_embed + str(n))
+			driver.delete(s_msg + str(n))
+		print_end('aio')
+
+# Cover templates
+class TemplateTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('template')
+		cls.defaultMessage = msg
+		cls.defaultKey = key
+		cls.template = s_base + ".tpl"
+	def test_template_1compile(self):
+		count = template.compile_pdf(s_base + ".pdf",self.template)
+		self.assertEqual(count,template.Template(self.template).__len__())
+	def test_template_2embed(self):
+		ps = pdf_algo.PDF_stego(self.template,rl,output=s_embed,template=template.Template(self.template))
+		result = ps.embed(self.defaultMessage,self.defaultKey)
+		self.assertTrue(result > 0)
+	def test_template_3extract(self):
+		ps = pdf_algo.PDF_stego(s_embed,rl,output=s_msg)
+		result = ps.extract(self.defaultKey)
+		self.assertEqual(result, 0)
+		output_file = open(s_msg,"rb")
+		self.assertEqual(self.defaultMessage,output_file.read())
+		output_file.close()
+	def test_template_4truncated(self):
+		template_file = open(self.template,"rb")
+		data = template_file.read()
+		template_file.close()
+		for size in [template.MAGIC.__len__() + 4,template.MAGIC.__len__() + template.HEADER.size + 3,data.__len__() - 1]:
+			truncated_file = open(self.template + ".bad","wb")
+			truncated_file.write(data[:size])
+			truncated_file.close()
+			self.assertRaises(ValueError,template.Template,self.template + ".bad")
+	@classmethod
+	def tearDownClass(cls):
+		driver.delete(cls.template)
+		driver.delete(cls.template + ".bad")
+		print_end('template')
+
+# Batch runner
+class BatchTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('batch')
+		cls.defaultMessage = msg
+		cls.defaultKey = key
+		msg_file = open(s_msg + ".in","wb")
+		msg_file.write(cls.defaultMessage)
+		msg_file.close()
+	def test_batch_manifest(self):
+		manifest = io.StringIO("action,cover,output,payload,nbits,improve\nm,a.pdf,b.pdf,c,5,yes\nx,b.pdf,c,,,\n")
+		jobs = batch.read_manifest(manifest,{"key":self.defaultKey})
+		self.assertEqual([job["action"] for job in jobs],["embed","extract"])
+		self.assertEqual([jobs[0]["nbits"],jobs[0]["improve"],jobs[0]["key"]],[5,True,self.defaultKey])
+		self.assertRaises(ValueError,batch.read_manifest,io.StringIO("cover,output\na.pdf,b.pdf\n"))
+	def test_batch_run(self):
+		for (manifest,n) in [("action,cover,output,payload,improve\nembed," + s_base + ".pdf," + s_embed + "," + s_msg + ".in,\nembed," + s_long + ".pdf," + s_embed + ".i," + s_msg + ".in,1\n",2),
+			  ("action,cover,output,improve\nextract," + s_embed + "," + s_msg + ",\nextract," + s_embed + ".i," + s_msg + ".i,1\n",2)]:
+			jobs = batch.read_manifest(io.StringIO(manifest),{"key":self.defaultKey})
+			summary = io.StringIO()
+			self.assertEqual(batch.run(jobs,summary,workers=2,verbose=LOG_LEVEL),0)
+			results = [json.loads(line) for line in summary.getvalue().splitlines()]
+			self.assertEqual([result["job"] for result in results],list(range(n)))
+		for output in [s_msg,s_msg + ".i"]:
+			output_file = open(output,"rb")
+			self.assertEqual(self.defaultMessage,output_file.read())
+			output_file.close()
+	@classmethod
+	def tearDownClass(cls):
+		for file in [s_msg + ".in",s_msg + ".i",s_embed + ".i"]:
+			driver.delete(file)
+		print_end('batch')
+
+# Daemon
+class ServerTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('server')
+		cls.defaultMessage = msg
+		cls.defaultKey = key
+		msg_file = open(s_msg + ".in","wb")
+		msg_file.write(cls.defaultMessage)
+		msg_file.close()
+		cls.path = os.path.abspath("sample/pdf_hide.sock")
+		cls.daemon = server.Server(cls.path,workers=1,queue=2)
+		cls.thread = threading.Thread(target=cls.daemon.serve_forever)
+		cls.thread.start()
+	def test_server_1embed(self):
+		response = server.request(self.path,{"action":"embed","cover":os.path.abspath(s_base + ".pdf"),"output":os.path.abspath(s_embed),"payload":os.path.abspath(s_msg + ".in"),"key":self.defaultKey})
+		self.assertTrue(response["ok"])
+		self.assertTrue(response["result"] > 0)
+	def test_server_2extract(self):
+		# NB: Twice, with warm keystreams the second time
+		for n in range(2):
+			response = server.request(self.path,{"action":"extract","cover":os.path.abspath(s_embed),"output":os.path.abspath(s_msg),"key":self.defaultKey})
+			self.assertEqual(response["result"],0)
+			output_file = open(s_msg,"rb")
+			self.assertEqual(self.defaultMessage,output_file.read())
+			output_file.close()
+		response = server.request(self.path,{"action":"extract","cover":os.path.abspath(s_embed),"output":os.path.abspath(s_msg),"keys":[self.defaultKey + "x",self.defaultKey]})
+		self.assertEqual(response["valid"],[2])
+	def test_server_3capacity(self):
+		response = server.request(self.path,{"action":"capacity","cover":os.path.abspath(s_base + ".pdf"),"nbitslist":[4],"redlist":[0.1]})
+		self.assertTrue(response["ok"])
+		ps = pdf_algo.PDF_stego(s_base + ".pdf",rl)
+		self.assertEqual(response["capacities"],ps.capacities([4],[0.1]))
+	def test_server_4errors(self):
+		for request in [{"action":"compile-template"},{"action":"extract","cover":s_embed,"key":self.defaultKey}]:
+			response = server.request(self.path,request)
+			self.assertFalse(response["ok"])
+			self.assertTrue("error" in response)
+		self.assertRaises(OSError,server.Server,self.path)
+	@classmethod
+	def tearDownClass(cls):
+		cls.daemon.close()
+		cls.thread.join()
+		driver.delete(s_msg + ".in")
+		print_end('server')
+
+# Synthetic covers
+class SynthTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		print_begin('synth')
+		cls.cover = "sample/synth_t.pdf"
+	def test_synth_values(self):
+		for (kerning,layout,image,compress) in [["latex","lines",0,True],["crange","line",4096,False]]:
+			count = synth.generate(self.cover,pages=3,tjs=5,kerns=4,kerning=kerning,layout=layout,image=image,compress=compress)
+			values = []
+			for content in reader.contents(self.cover):
+				values += tokenizer.values(content)
+			self.assertEqual(values.__len__(),count)
+			self.assertEqual(count,3 * 5 * 4)
+			self.assertFalse(0 in values)
+			for value in values:
+				self.assertTrue(any(low <= value <= high for (weight,low,high) in synth.DISTRIBUTIONS[kerning]))
+	def test_synth_seed(self):
+		covers = []
+		for seed in [0,0,1]:
+			synth.generate(self.cover,pages=2,seed=seed)
+			cover_file = open(self.cover,"rb")
+			covers += [cover_file.read()]
+			cover_file.close()
+		self.assertEqual(covers[0],covers[1])
+		self.assertNotEqual(covers[0],covers[2])
+	def test_synth_embed(self):
+		synth.generate(self.cover,pages=2,kerning="crange")
+		cover_file = open(self.cover,"rb")
+		cover = cover_file.read()
+		cover_file.close()
+		stego = memory.embed_bytes(cover,msg,key,improve=True,customrange=True)
+		self.assertEqual(memory.extract_bytes(stego,key,improve=True,customrange=True),msg)
+	def test_synth_zeros(self):
+		# NB: Zero TJ values are never usable, so the numerals must be
+		# indexed by usable TJ op (see embed_next())
+		synth.generate(self.cover,pages=2,kerning=[[6,-450,-250],[4,-40,40],[3,0,0]],compress=False)
+		values = []
+		for content in reader.contents(self.cover):
+			values += tokenizer.values(content)
+		self.assertTrue(0 in values)
+		cover_file = open(self.cover,"rb")
+		cover = cover_file.read()
+		cover_file.close()
+		stego = memory.embed_bytes(cover,msg,key,improve=True)
+		self.assertEqual(memory.extract_bytes(stego,key,improve=True),msg)
+	@classmethod
+	def tearDownClass(cls):
+		driver.delete(cls.cover)
+		print_end('synth')
+
 #
 #
 #